@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Times reads of different lengths from each stat and fits the read time model
+
+The fits are saved as json under the name of each bus, set read_calibration_file in
+the controller settings to use them when planning reads.
+Ian Horsley 2018
+"""
+import time
+import logging
+import argparse
+
+from heatmisercontroller.logging_setup import initialize_logger_full
+from heatmisercontroller.network import HeatmiserNetwork
+from heatmisercontroller.bus import run_on_buses
+from heatmisercontroller.exceptions import HeatmiserResponseError
+
+def longest_block(controller):
+    """first field and length of the longest contiguous block of fields"""
+    blocks = controller._get_field_blocks_from_id_range(0, len(controller.fields) - 1)
+    firstfield, _, length = max(blocks, key=lambda block: block[2])
+    return firstfield.address, length
+
+def calibrate_bus(bus, controllers, tests):
+    """read each controller on bus with a range of lengths, the bus adaptor records the times"""
+    for controller in controllers:
+        address, blocklength = longest_block(controller)
+        lengths = sorted(set([1, blocklength // 2, blocklength]))
+        print("%s C%d timing lengths %s and read all %d"%(bus.name, controller.set_address, lengths, controller.dcb_length))
+        for _ in range(tests):
+            try:
+                for length in lengths:
+                    bus.adaptor.read_from_device(controller.set_address, controller.set_protocol, address, length)
+                bus.adaptor.read_all_from_device(controller.set_address, controller.set_protocol, controller.dcb_length)
+            except HeatmiserResponseError as err:
+                print("%s C%d errored %s"%(bus.name, controller.set_address, str(err)))
+                time.sleep(5)
+
+def calibrate(network, tests):
+    """calibrate the controllers on each bus, the buses concurrently"""
+    network.stop_bus_executor() #call the adaptors directly, nothing else uses them
+    for _, excinfo in run_on_buses(lambda bus: calibrate_bus(bus, bus_controllers(network, bus), tests), network.buses.values()):
+        if excinfo is not None:
+            raise excinfo[0], excinfo[1], excinfo[2]
+
+def bus_controllers(network, bus):
+    """controllers configured on bus"""
+    return [controller for controller in network.controllers if controller.busname == bus.name]
+
+def report(network):
+    """print fitted models against the default, for each bus"""
+    for bus in network.buses.values():
+        calibration = bus.adaptor.read_calibration
+        print("Bus %s adaptor  %.4f s + %.5f s/byte"%((bus.name,) + calibration.coefficients()))
+        for controller in bus_controllers(network, bus):
+            intercept, slope = calibration.coefficients(controller.set_address)
+            print("C%-2d      %.4f s + %.5f s/byte, read all %.3f s"%(controller.set_address, intercept, slope, controller.fullreadtime))
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    PARSER.add_argument('-c', '--config', help="configuration file, default is the package hmcontroller.conf")
+    PARSER.add_argument('-n', '--tests', type=int, default=30, help="reads of each length from each stat")
+    PARSER.add_argument('-o', '--output', help="json file for fits, default is read_calibration_file setting")
+    ARGS = PARSER.parse_args()
+
+    initialize_logger_full('logs', logging.WARN)
+    HMN = HeatmiserNetwork(ARGS.config)
+    OUTPUT = ARGS.output or HMN.adaptor.read_calibration_file or 'read_calibration.json'
+
+    calibrate(HMN, ARGS.tests)
+    report(HMN)
+    for BUS in HMN.buses.values():
+        BUS.adaptor.read_calibration.save(OUTPUT, BUS.name)
+    print("Saved to %s"%OUTPUT)
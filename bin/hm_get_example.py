@@ -39,6 +39,8 @@ SCHEDULEFIELDS = ['mon_heat', 'tues_heat', 'wed_heat', 'thurs_heat', 'fri_heat',
 STATEFIELDS = ['onoff', 'frostprot', 'holidayhours', 'runmode', 'tempholdmins', 'setroomtemp']
 OTHERFIELDS = ['sensorsavaliable', 'airtemp', 'remoteairtemp', 'heatingdemand', 'hotwaterdemand']
 FIELDNAMES = STATEFIELDS + OTHERFIELDS
+#prepare the reads once, so each cycle only checks ages and reads
+READS = dict((controller, (controller.prepare(SCHEDULEFIELDS), controller.prepare(FIELDNAMES))) for controller in HMN.controllers)
 
 # CYCLE THROUGH ALL CONTROLLERS repeatedly, constantly updating parameters
 while True:
@@ -46,8 +48,9 @@ while True:
     for current_controller in HMN.controllers:
         try:
             #read all fields at the same time allows for most efficient number of reads
-            current_controller.read_fields(SCHEDULEFIELDS)
-            current_controller.read_fields(FIELDNAMES, 0) #force get on these fields
+            schedulefields, fieldnames = READS[current_controller]
+            schedulefields.read()
+            fieldnames.read() #gets fields older than their max_age
             targettext = current_controller.print_target()
             disptext = "C%d in %s Air Temp is %.1f from type %.f, %s, Heat %d" %(current_controller.address, current_controller.name.ljust(4), current_controller.read_air_temp(), current_controller.read_air_sensor_type(), targettext, current_controller.heatingdemand)
         except HeatmiserResponseError as err:
@@ -58,4 +61,8 @@ while True:
             else:
                 print(disptext)
 
-    time.sleep(5) # sleep before next cycle
+    print("Cycle %s"%HMN.adaptor.receive_stats)
+    HMN.adaptor.receive_stats.reset()
+    #sleep until a field is due, but at least a second to let the bus rest
+    nextexpiry = HMN.next_expiry(FIELDNAMES)
+    time.sleep(5 if nextexpiry is None else max(1, nextexpiry - time.time()))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""Polls all stats keeping every field within its max_age and reports bus use
+
+Fields due together are read in one planned read per stat, temperatures first.
+The duty cycle cap and batching are set in the [scheduler] section of the
+configuration and can be overridden here.
+Ian Horsley 2018
+"""
+import time
+import logging
+import argparse
+
+from heatmisercontroller.logging_setup import initialize_logger_full
+from heatmisercontroller.network import HeatmiserNetwork
+from heatmisercontroller.pollscheduler import PollScheduler
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    PARSER.add_argument('-c', '--config', help="configuration file, default is the package hmcontroller.conf")
+    PARSER.add_argument('-d', '--duty-cycle', type=float, help="fraction of time the bus may be used")
+    PARSER.add_argument('-b', '--batch-window', type=float, help="seconds within which due fields are read together")
+    PARSER.add_argument('-r', '--report', type=float, default=600, help="seconds between summaries")
+    PARSER.add_argument('-t', '--duration', type=float, help="seconds to run for, default forever")
+    ARGS = PARSER.parse_args()
+
+    initialize_logger_full('logs', logging.WARN)
+    HMN = HeatmiserNetwork(ARGS.config)
+    SETTINGS = HMN.scheduler_settings
+    if ARGS.duty_cycle is not None:
+        SETTINGS['duty_cycle'] = ARGS.duty_cycle
+    if ARGS.batch_window is not None:
+        SETTINGS['batch_window'] = ARGS.batch_window
+    try:
+        SCHEDULER = PollScheduler(HMN, **SETTINGS)
+    except ValueError as err:
+        PARSER.error(str(err))
+
+    END = None if ARGS.duration is None else time.time() + ARGS.duration
+    try:
+        while END is None or time.time() < END:
+            SCHEDULER.run(ARGS.report if END is None else min(ARGS.report, END - time.time()))
+            print("\n".join(SCHEDULER.summary()))
+    except KeyboardInterrupt:
+        print("\n".join(SCHEDULER.summary()))
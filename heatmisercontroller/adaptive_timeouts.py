@@ -0,0 +1,111 @@
+"""Learns response times for each device address and sets receive timeouts from them"""
+import logging
+from collections import deque
+
+class LatencyEstimate(object):
+    """Distribution of one latency, an EWMA plus a window of recent samples for quantiles"""
+    def __init__(self, alpha=0.2, window=50):
+        self.alpha = alpha
+        self.mean = None
+        self.samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, value):
+        """Add a sample"""
+        if self.mean is None:
+            self.mean = value
+        else:
+            self.mean += self.alpha * (value - self.mean)
+        self.samples.append(value)
+
+    def quantile(self, fraction):
+        """Value below which fraction of the recent samples fall"""
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def get_state(self):
+        """Returns state as a dict that can be stored as json"""
+        return {'mean': self.mean, 'samples': list(self.samples)}
+
+    def set_state(self, state):
+        """Restores state from get_state"""
+        self.mean = state['mean']
+        self.samples.clear()
+        self.samples.extend(state['samples'])
+
+class AdaptiveTimeouts(object):
+    """Per address first byte latency and per byte time, used to set receive timeouts
+
+    Timeouts are margin times the larger of the quantile and the mean of recent samples,
+    limited to between COM_MIN_TIMEOUT and max_factor times the configured timeout.
+    The configured timeouts are used until min_samples responses have been seen.
+    After a missed response on a learned timeout the next receive from that address
+    uses the full window, so a device that has slowed down is learnt again, while a
+    dead device only costs the full window on alternate attempts."""
+    def __init__(self, quantile=0.95, margin=1.5, max_factor=3.0, min_samples=5):
+        self.quantile = quantile
+        self.margin = margin
+        self.max_factor = max_factor
+        self.min_samples = min_samples
+        self.firstbyte = {}
+        self.perbyte = {}
+        self._suspect = set()
+
+    def configure(self, quantile, margin, max_factor):
+        """Update parameters without losing learned values"""
+        self.quantile = quantile
+        self.margin = margin
+        self.max_factor = max_factor
+
+    def record(self, address, firstbytetime, resttime, length):
+        """Record a complete response of length bytes from address"""
+        self.firstbyte.setdefault(address, LatencyEstimate()).add(firstbytetime)
+        if length > 1:
+            self.perbyte.setdefault(address, LatencyEstimate()).add(resttime / (length - 1))
+        self._suspect.discard(address)
+
+    def no_response(self, address, learned):
+        """Record a missed response, learned True if the learned timeout was in use"""
+        if learned:
+            self._suspect.add(address)
+        else:
+            self._suspect.discard(address)
+
+    def _limit(self, estimate, scale, configured, serport):
+        """Timeout from estimate, or None if not learnt yet"""
+        if estimate is None or len(estimate) < self.min_samples:
+            return None
+        value = self.margin * scale * max(estimate.quantile(self.quantile), estimate.mean)
+        return min(max(value, serport.COM_MIN_TIMEOUT), self.max_factor * configured)
+
+    def timeouts(self, address, expected_length, serport):
+        """Returns first byte timeout, full frame timeout and whether they were learned
+
+        Full frame timeout is measured from the start of listening, as COM_TIMEOUT."""
+        if address in self._suspect:
+            return serport.COM_START_TIMEOUT, serport.COM_TIMEOUT, False
+        start = self._limit(self.firstbyte.get(address), 1, serport.COM_START_TIMEOUT, serport)
+        rest = self._limit(self.perbyte.get(address), max(1, expected_length - 1), serport.COM_TIMEOUT, serport)
+        if start is None or rest is None:
+            return serport.COM_START_TIMEOUT, serport.COM_TIMEOUT, False
+        return start, start + rest, True
+
+    def get_learned(self):
+        """Returns learned values keyed by address, suitable for storing as json"""
+        learned = {}
+        for address, estimate in self.firstbyte.iteritems():
+            learned[address] = {'firstbyte': estimate.get_state()}
+        for address, estimate in self.perbyte.iteritems():
+            learned.setdefault(address, {})['perbyte'] = estimate.get_state()
+        return learned
+
+    def load_learned(self, learned):
+        """Restores values from get_learned, addresses may be strings as after a json round trip"""
+        for address, states in learned.iteritems():
+            address = int(address)
+            for name, store in (('firstbyte', self.firstbyte), ('perbyte', self.perbyte)):
+                if name in states:
+                    store.setdefault(address, LatencyEstimate()).set_state(states[name])
+        logging.debug("Loaded learned timeouts for %i addresses"%len(learned))
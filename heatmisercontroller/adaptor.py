@@ -4,10 +4,16 @@ import time
 import logging
 import serial
 
-from .hm_constants import MAX_FRAME_RESP_LENGTH, MIN_FRAME_READ_RESP_LENGTH, DCB_START, FUNC_WRITE, FUNC_READ, BROADCAST_ADDR, FRAME_WRITE_RESP_LENGTH, FR_CONTENTS, RW_LENGTH_ALL, CRC_LENGTH
+from .hm_constants import MAX_FRAME_RESP_LENGTH, MIN_FRAME_READ_RESP_LENGTH, DCB_START, FUNC_WRITE, FUNC_READ, BROADCAST_ADDR, FRAME_WRITE_RESP_LENGTH, FR_CONTENTS, RW_LENGTH_ALL, CRC_LENGTH, DONT_CARE_LENGTH
+from .hm_constants import RECEIVE_BUFFER_LENGTH, RECEIVE_MODE_TIMEOUT, RECEIVE_MODE_HEADER, DEFAULT_RECEIVE_MODE, DEFAULT_BUS
 import framing
+from .adaptive_timeouts import AdaptiveTimeouts
+from .read_calibration import ReadTimeCalibration
 from .exceptions import HeatmiserResponseError, HeatmiserResponseErrorCRC
 from .logging_setup import csvlist
+from .transports import create_transport, DEFAULT_TRANSPORT
+
+monotonic = getattr(time, 'monotonic', time.time) #wall clock on python 2, waits are limited in case it steps
 
 def retryer(max_retries=3):
     """Decorates reading from and writing to devices, rerunning the methods on failure"""
@@ -30,25 +36,103 @@ def retryer(max_retries=3):
         return inner
     return wraps
 
+class ReceiveStats(object):
+    """Records time spent receiving frames and the time timeout mode would have taken"""
+    def __init__(self):
+        self.frames = 0
+        self.receivetime = 0.0
+        self.timeoutmodetime = 0.0
+        self.resyncs = 0
+        self.discarded = 0
+
+    def reset(self):
+        """Reset counters, for example at the start of a polling cycle"""
+        self.__init__()
+
+    def record(self, receivetime, timeoutmodetime):
+        """Record a single receive"""
+        self.frames += 1
+        self.receivetime += receivetime
+        self.timeoutmodetime += timeoutmodetime
+
+    def saved_time(self):
+        """Bus time saved compared to timeout mode"""
+        return self.timeoutmodetime - self.receivetime
+
+    def record_discard(self, decoder, resync=False):
+        """Record bytes thrown away by a FrameDecoder"""
+        self.discarded += decoder.discarded + decoder.pending
+        if resync:
+            self.resyncs += 1
+
+    def __repr__(self):
+        return "%i frames received in %.2fs, saved %.2fs, %i resyncs, %i bytes discarded"%(self.frames, self.receivetime, self.saved_time(), self.resyncs, self.discarded)
+
+class BusTiming(object):
+    """Records how the bus settle gap before each send was used
+
+    The gap starts when a response ends, work after it such as processing the response and
+    forming the next request is hidden if the next send is ready before the bus is free.
+    Sends ready after the bus was free, by less than a gap, are counted as overruns."""
+    def __init__(self):
+        self.sends = 0
+        self.waited = 0.0
+        self.overruns = 0
+        self.overrun = 0.0
+
+    def reset(self):
+        """Reset counters, for example at the start of a sweep"""
+        self.__init__()
+
+    def record(self, gap, early):
+        """Record a send ready early seconds before the bus was free, negative if after, gap the settle time"""
+        self.sends += 1
+        if early > 0:
+            self.waited += early
+        elif -early < gap:
+            self.overruns += 1
+            self.overrun -= early
+
+    def __repr__(self):
+        return "%i sends, waited %.2fs for the bus, %i sends overran the settle gap by %.3fs"%(self.sends, self.waited, self.overruns, self.overrun)
+
 class HeatmiserAdaptor(object):
     """Handles configuration serial port and provides low level read and write functions"""
+    receive_mode = DEFAULT_RECEIVE_MODE
+    adaptive_timeouts = False
+    adaptive_timeout_quantile = 0.95
+    adaptive_timeout_margin = 1.5
+    adaptive_timeout_max_factor = 3.0
+    read_calibration_file = ''
+    busname = DEFAULT_BUS #fits are loaded for this bus from read_calibration_file
+    _clock = staticmethod(monotonic) #bus deadlines are on this clock, replaceable to test timing
+    _sleep = staticmethod(time.sleep)
+
     def __init__(self, setup):
 
         # Initialize setup and get settings
         self._setup = setup
         settings = self._setup.settings
+        self.receive_stats = ReceiveStats()
+        self.bus_timing = BusTiming()
+        self._rxbuffer = bytearray(RECEIVE_BUFFER_LENGTH) #reused for every response
+        self._rxview = memoryview(self._rxbuffer)
+        self.read_frames = framing.ReadFrameCache()
+        self.timeouts = AdaptiveTimeouts() #always learns, only used if adaptive_timeouts
+        self.read_calibration = ReadTimeCalibration()
 
-        self.serport = serial.Serial()
-        self.serport.bytesize = serial.EIGHTBITS #COM_SIZE
-        self.serport.parity = serial.PARITY_NONE #COM_PARITY
-        self.serport.stopbits = serial.STOPBITS_ONE #COM_STOP
+        self.serport = None
+        self.transport = None
 
         self.lastsendtime = None
         self.creationtime = time.time()
 
         self._update_settings(settings)
+        if self.read_calibration_file:
+            self.read_calibration.load(self.read_calibration_file, self.busname)
 
-        self.lastreceivetime = self.creationtime - self.serport.COM_BUS_RESET_TIME # so that system will get on with sending straight away
+        self.busfreeat = self._clock() # so that system will get on with sending straight away
+        self._busgap = 0.0
         
         if self.auto_connect:
             self.connect()
@@ -58,21 +142,44 @@ class HeatmiserAdaptor(object):
 
     def _update_settings(self, settings):
         """Check settings and update if needed."""
+        oldmaster = getattr(self, 'my_master_addr', None)
         for name, value in settings['controller'].iteritems():
             setattr(self, name, value)
+        if getattr(self, 'my_master_addr', None) != oldmaster:
+            self.read_frames.invalidate() #cached frames contain the old source address
+        self.timeouts.configure(self.adaptive_timeout_quantile, self.adaptive_timeout_margin, self.adaptive_timeout_max_factor)
 
-        # Configure serial settings after closing if required
+        # Configure serial settings after closing if required, with a new port if the transport changed
         wasopen = False
-        if self.serport.isOpen():
+        if self.serport is not None and self.serport.isOpen():
             wasopen = True
             self.serport.close() # close port
 
+        transport = settings['serial'].get('transport', DEFAULT_TRANSPORT)
+        if transport != self.transport:
+            self._release_port()
+            self.serport = self._create_port(transport)
         for name, value in settings['serial'].iteritems():
-            setattr(self.serport, name, value)
+            if name != 'transport':
+                setattr(self.serport, name, value)
 
         if not self.serport.isOpen() and wasopen:
             self._open_port()
 
+    def _create_port(self, transport):
+        """Returns an unopened port for transport, 8 bits no parity 1 stop bit"""
+        port = create_transport(transport)
+        port.bytesize = serial.EIGHTBITS #COM_SIZE
+        port.parity = serial.PARITY_NONE #COM_PARITY
+        port.stopbits = serial.STOPBITS_ONE #COM_STOP
+        self.transport = transport
+        return port
+
+    def _release_port(self):
+        """Close any connections a pooled transport keeps for reconnecting"""
+        if hasattr(self.serport, 'close_pool'):
+            self.serport.close_pool()
+
 ### low level serial commands
 
     def connect(self):
@@ -101,23 +208,17 @@ class HeatmiserAdaptor(object):
             logging.info("Gen serial port closed")
         else:
             logging.warn("Gen serial port was already closed")
+        self._release_port()
     
     def _send_message(self, message):
         """Send message to serial port and log errors"""
         if not self.serport.isOpen():
             self.connect()
 
-        #check time since last received to make sure bus has settled.
-        waittime = self.serport.COM_BUS_RESET_TIME - (time.time() - self.lastreceivetime)
-        if waittime > 0:
-            logging.debug("Gen waiting before sending %.2f"% (waittime))
-            time.sleep(waittime)
+        self._wait_for_bus()
         
-        # http://stackoverflow.com/questions/180606/how-do-i-convert-a-list-of-ascii-values-to-a-string-in-python
-        string = ''.join(map(chr, message))
-
         try:
-            self.serport.write(string)    # Write a string
+            self.serport.write(message)    # Write bytearray (or list of ints) directly
         except serial.SerialTimeoutException as err:
             self.serport.close() #need to close so that isOpen works correctly.
             logging.warning("Write timeout error: %s, sending %s" % (err, csvlist(message)))
@@ -130,25 +231,106 @@ class HeatmiserAdaptor(object):
         self.lastsendtime = time.strftime("%d %b %Y %H:%M:%S +0000", time.localtime(time.time())) #timezone is wrong
         logging.debug("Gen sent %s", csvlist(message))
 
+    def _hold_bus(self, seconds):
+        """Set the bus free at deadline seconds from now"""
+        self.busfreeat = self._clock() + seconds
+        self._busgap = seconds
+
+    def bus_free_time(self):
+        """Monotonic time the bus will have settled, after the last receive or broadcast"""
+        return self.busfreeat
+
+    def _wait_for_bus(self):
+        """Sleep until the bus free at deadline, recording how much of the settle gap was left
+
+        Processing of the last response has already been done inside the gap, by the caller.
+        The wait is limited to the gap, in case the clock has stepped."""
+        early = self.busfreeat - self._clock()
+        self.bus_timing.record(self._busgap, early)
+        if early > 0:
+            waittime = min(early, self._busgap)
+            logging.debug("Gen waiting before sending %.2f"% (waittime))
+            self._sleep(waittime)
+
     def _clear_input_buffer(self):
         """Clears input buffer
         
-        Used after CRC check wrong; in case more data was sent than expected."""
-    
-        time.sleep(self.serport.COM_TIMEOUT) #wait for read timeout to ensure slave finished sending
+        Used after CRC check wrong; in case more data was sent than expected.
+        Reads until the bus is quiet, rather than always waiting for the read timeout."""
+        decoder = framing.FrameDecoder()
         try:
             if self.serport.isOpen():
+                self._drain_input(decoder, False)
                 self.serport.reset_input_buffer() #reset input buffer and dump any contents
+            decoder.flush()
+            self.receive_stats.record_discard(decoder)
             logging.warning("Input buffer cleared")
         except serial.SerialException:
             self.serport.close()
             logging.warning("Failed to clear input buffer")
             raise
     
-    def _read_bytes(self, length):
-        """read from serial port and log errors"""
+    def _drain_input(self, decoder, stop_on_frame):
+        """Read until the bus has been quiet for COM_MIN_TIMEOUT, up to COM_TIMEOUT, passing bytes to decoder
+
+        Returns list of frames found, stopping at the first if stop_on_frame"""
+        frames = []
+        deadline = time.time() + self.serport.COM_TIMEOUT
+        while not (frames and stop_on_frame):
+            timeleft = deadline - time.time()
+            self.serport.timeout = max(0, min(self.serport.COM_MIN_TIMEOUT, timeleft))
+            count = self._read_bytes(0, max(1, self.serport.in_waiting))
+            if count == 0:
+                frames.extend(decoder.flush()) #bus quiet, nothing more to complete a frame
+                break
+            frames.extend(decoder.feed(self._rxbuffer[:count]))
+            if timeleft <= 0:
+                break
+        return frames
+
+    def _resync(self, validator, end):
+        """Look for a valid response in the rest of a bad frame and the bytes that follow it
+
+        Stops as soon as a frame passing validator's checks is found or the bus goes quiet.
+        Returns a memoryview of the recovered frame at the start of the receive buffer, or None."""
+        decoder = framing.FrameDecoder(validator.source, validator.destination)
+        frames = decoder.feed(self._rxbuffer[1:end]) #first byte can't start a good frame
+        if not frames:
+            frames = self._drain_input(decoder, True)
+        found = None
+        for frame in frames:
+            checker = framing.ResponseFrameValidator(validator.protocol, validator.source, validator.destination, validator.expected_function, validator.expected_length)
+            try:
+                checker.feed(frame)
+            except HeatmiserResponseError as err:
+                logging.debug("C%s Resync skipped frame: %s"%(validator.source, str(err)))
+                continue
+            found = frame
+            break
+        self.serport.reset_input_buffer() #drop anything left, without waiting
+        self.receive_stats.record_discard(decoder, True)
+        if found is None:
+            return None
+        logging.info("C%s Resynchronised after %i discarded bytes"%(validator.source, decoder.discarded))
+        self._ensure_receive_buffer(len(found))
+        self._rxbuffer[:len(found)] = found
+        return self._rxview[:len(found)]
+
+    def _ensure_receive_buffer(self, length):
+        """Grow receive buffer if a frame of length will not fit, keeping any received data"""
+        if len(self._rxbuffer) < length:
+            newbuffer = bytearray(length)
+            newbuffer[:len(self._rxbuffer)] = self._rxbuffer
+            self._rxbuffer = newbuffer
+            self._rxview = memoryview(newbuffer)
+
+    def _read_bytes(self, offset, length):
+        """read from serial port into receive buffer at offset and log errors
+
+        Returns the number of bytes read"""
+        self._ensure_receive_buffer(offset + length)
         try:
-            return self.serport.read(length)
+            return self.serport.readinto(self._rxview[offset:offset + length])
         except serial.SerialException as err:
             #There is no new data from serial port (or port missing) (Doesn't include no response from stat)
             logging.warning("Gen serial port error: %s" % str(err))
@@ -156,12 +338,13 @@ class HeatmiserAdaptor(object):
             raise
         finally:
             self.serport.timeout = self.serport.COM_TIMEOUT #make sure timeout is reverted
-            self.lastreceivetime = time.time() #record last read time. Used to manage bus settling.
+            self._hold_bus(self.serport.COM_BUS_RESET_TIME) #bus settles from the end of each read
     
     def _receive_message(self, length=MAX_FRAME_RESP_LENGTH):
         """Receive message from serial port and log errors
         
-        Uses two time outs, one on the first byte and another for full data"""
+        Uses two time outs, one on the first byte and another for full data
+        Returns a memoryview of the receive buffer, only valid until the next receive."""
         if not self.serport.isOpen():
             self.connect()
         logging.debug("Gen listening for %d"%length)
@@ -170,21 +353,115 @@ class HeatmiserAdaptor(object):
         timereadstart = time.time()
         self.serport.timeout = self.serport.COM_START_TIMEOUT #wait for start of response
         
-        firstbyteread = self._read_bytes(1)
+        received = self._read_bytes(0, 1)
 
         timereadfirstbyte = time.time()-timereadstart
         logging.debug("Gen waited %.2fs for first byte"%timereadfirstbyte)
-        if len(firstbyteread) == 0:
+        if received == 0:
             raise HeatmiserResponseError("No Response")
         
         # Listen for the rest of the response
         self.serport.timeout = max(self.serport.COM_MIN_TIMEOUT, self.serport.COM_TIMEOUT - timereadfirstbyte) #wait for full time out for rest of response, but not less than COM_MIN_TIMEOUT)
-        byteread = self._read_bytes(length - 1)
+        received += self._read_bytes(1, length - 1)
+
+        return self._rxview[:received]
+
+    def _receive_frame(self, validator, expected_frame_length):
+        """Receive a response frame checking it as it arrives
+
+        Bytes are passed to the validator as they are read, so a bad header fails as soon as
+        it is received and the CRC result is known when the last byte arrives.
+        In header mode the rest of the header and then the rest of the frame are requested
+        exactly, in stream mode whatever is waiting is read.
+        Uses the same two time outs as _receive_message and records the time saved against them,
+        or with adaptive_timeouts the time outs learned for the source address.
+        If the frame is bad, resynchronises on a valid frame following it if there is one.
+        Returns a memoryview of the receive buffer, only valid until the next receive."""
+        if not self.serport.isOpen():
+            self.connect()
+        logging.debug("Gen listening for frame")
+
+        if self.adaptive_timeouts:
+            starttimeout, frametimeout, learned = self.timeouts.timeouts(validator.source, expected_frame_length, self.serport)
+        else:
+            starttimeout, frametimeout, learned = self.serport.COM_START_TIMEOUT, self.serport.COM_TIMEOUT, False
+
+        # Listen for the first byte
+        timereadstart = time.time()
+        self.serport.timeout = starttimeout #wait for start of response
 
-        #Convert back to array
-        data = map(ord, firstbyteread) + map(ord, byteread)
+        received = self._read_bytes(0, 1)
 
-        return data
+        timereadfirstbyte = time.time()-timereadstart
+        logging.debug("Gen waited %.2fs for first byte"%timereadfirstbyte)
+        if received == 0:
+            self.receive_stats.record(timereadfirstbyte, max(timereadfirstbyte, self.serport.COM_START_TIMEOUT))
+            self.timeouts.no_response(validator.source, learned)
+            raise HeatmiserResponseError("No Response")
+
+        # Listen for the rest of the response, checking each block as it arrives
+        remainingtimeout = max(self.serport.COM_MIN_TIMEOUT, frametimeout - timereadfirstbyte)
+        timeoutmoderemaining = max(self.serport.COM_MIN_TIMEOUT, self.serport.COM_TIMEOUT - timereadfirstbyte)
+        deadline = time.time() + remainingtimeout
+        try:
+            frame = self._check_received(validator, 0, received)
+            while frame is None and not validator.complete:
+                self.serport.timeout = max(0, deadline - time.time())
+                if self.receive_mode == RECEIVE_MODE_HEADER:
+                    readlength = validator.remaining
+                else:
+                    readlength = max(1, min(self.serport.in_waiting, validator.remaining))
+                count = self._read_bytes(received, readlength)
+                if count == 0:
+                    logging.warning("C%s Invalid Response: incomplete: %s" %(validator.source, csvlist(self._rxbuffer[:received])))
+                    raise HeatmiserResponseError("Response incomplete after %i bytes"%validator.received)
+                frame = self._check_received(validator, received, received + count)
+                received += count
+        finally:
+            # timeout mode waits out the timeout for anything shorter than expected
+            receivetime = time.time() - timereadstart
+            if received < expected_frame_length:
+                self.receive_stats.record(receivetime, timereadfirstbyte + timeoutmoderemaining)
+            else:
+                self.receive_stats.record(receivetime, receivetime)
+
+        if frame is not None:
+            return frame
+        self.timeouts.record(validator.source, timereadfirstbyte, receivetime - timereadfirstbyte, received)
+        return self._rxview[:received]
+
+    def _receive_response(self, validator, expected_frame_length):
+        """Receive and check a response frame using the configured receive_mode"""
+        if self.receive_mode != RECEIVE_MODE_TIMEOUT:
+            return self._receive_frame(validator, expected_frame_length)
+
+        timereadstart = time.time()
+        try:
+            response = self._receive_message(expected_frame_length)
+        finally:
+            receivetime = time.time() - timereadstart
+            self.receive_stats.record(receivetime, receivetime)
+        try:
+            framing.verify_response(validator.protocol, validator.source, validator.destination, validator.expected_function, validator.expected_length, self._rxbuffer[:len(response)])
+        except HeatmiserResponseErrorCRC:
+            self._clear_input_buffer()
+            raise
+        return response
+
+    def _check_received(self, validator, start, end):
+        """Passes newly received bytes in the receive buffer to validator
+
+        Returns None while the frame is good. If it is bad returns a frame recovered by _resync,
+        or raises the error if there isn't one."""
+        try:
+            validator.feed(self._rxbuffer, start, end)
+        except HeatmiserResponseError as err:
+            logging.warning("C%s Invalid Response: %s: %s" %(validator.source, str(err), csvlist(self._rxbuffer[:end])))
+            frame = self._resync(validator, end) #rest of a bad frame may still be arriving
+            if frame is None:
+                raise
+            return frame
+        return None
 
 ### protocol functions
     
@@ -202,14 +479,10 @@ class HeatmiserAdaptor(object):
 
         logging.debug("C%i written to address %i length %i payload %s"%(network_address, unique_address, length, csvlist(payload)))
         if network_address == BROADCAST_ADDR: # if broadcasting force it to wait longer until next send
-            self.lastreceivetime = time.time() + self.serport.COM_SEND_MIN_TIME - self.serport.COM_BUS_RESET_TIME
+            self._hold_bus(self.serport.COM_SEND_MIN_TIME)
         else: #else listen for acknowledgement
-            response = self._receive_message(FRAME_WRITE_RESP_LENGTH)
-            try:
-                framing.verify_write_ack(protocol, network_address, self.my_master_addr, response)
-            except HeatmiserResponseErrorCRC:
-                self._clear_input_buffer()
-                raise
+            validator = framing.ResponseFrameValidator(protocol, network_address, self.my_master_addr, FUNC_WRITE, DONT_CARE_LENGTH)
+            self._receive_response(validator, FRAME_WRITE_RESP_LENGTH)
 
     def min_time_between_reads(self):
         """Computes the minimum time that adaptor leaves between read commands"""
@@ -217,12 +490,14 @@ class HeatmiserAdaptor(object):
 
     @retryer(max_retries=2)
     def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
-        """Forms read frame and sends to serial link checking the response"""
+        """Forms read frame and sends to serial link checking the response
+
+        Returns payload as a memoryview of the receive buffer, only valid until the next receive"""
         if readall:
-            msg = framing.form_read_frame(network_address, protocol, self.my_master_addr, DCB_START, RW_LENGTH_ALL)
+            msg = self.read_frames.get(network_address, protocol, self.my_master_addr, DCB_START, RW_LENGTH_ALL)
             logging.debug("C %i read request to address %i length %i"%(network_address, DCB_START, RW_LENGTH_ALL))
         else:
-            msg = framing.form_read_frame(network_address, protocol, self.my_master_addr, unique_start_address, expected_length)
+            msg = self.read_frames.get(network_address, protocol, self.my_master_addr, unique_start_address, expected_length)
             logging.debug("C %i read request to address %i length %i"%(network_address, unique_start_address, expected_length))
         try: #sending request
             self._send_message(msg)
@@ -232,20 +507,18 @@ class HeatmiserAdaptor(object):
 
         time1 = time.time()
 
-        try: #listening for response
-            response = self._receive_message(MIN_FRAME_READ_RESP_LENGTH + expected_length)
+        validator = framing.ResponseFrameValidator(protocol, network_address, self.my_master_addr, FUNC_READ, expected_length)
+        try: #listening for and checking response
+            response = self._receive_response(validator, MIN_FRAME_READ_RESP_LENGTH + expected_length)
         except Exception as err:
             logging.warn("C%i read failed from address %i length %i due to %s"%(network_address, unique_start_address, expected_length, str(err)))
             raise
 
-        logging.debug("C%i read in %.2f s from address %i length %i response %s"%(network_address, time.time()-time1, unique_start_address, expected_length, csvlist(response)))
+        readtime = time.time() - time1
+        self.read_calibration.record(network_address, expected_length, readtime)
+        logging.debug("C%i read in %.2f s from address %i length %i response %s"%(network_address, readtime, unique_start_address, expected_length, csvlist(response.tolist())))
 
-        try: #processing response
-            framing.verify_response(protocol, network_address, self.my_master_addr, FUNC_READ, expected_length, response)
-        except HeatmiserResponseErrorCRC:
-            self._clear_input_buffer()
-            raise
-        return response[FR_CONTENTS:-CRC_LENGTH]
+        return response[FR_CONTENTS:-CRC_LENGTH] #payload without copying
 
     def read_all_from_device(self, network_address, protocol, expected_length):
         """Forms read all frame using read_from_device"""
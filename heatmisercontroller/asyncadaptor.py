@@ -0,0 +1,298 @@
+"""Heatmiser adaptor driven by an event loop, so callers aren't blocked by the bus
+
+Transactions are queued and each returns a BusFuture. The port is read without blocking and
+the bus settle wait and response time outs are deadlines rather than sleeps. An application
+calls process when the port is readable or next_deadline passes, for example from its own
+select loop, or run_until_complete does this until a future is done.
+Python 2 has no asyncio, so device transactions are generators run by transactions.run_async."""
+import sys
+import select
+import logging
+import collections
+import io
+
+from .hm_constants import MIN_FRAME_READ_RESP_LENGTH, DCB_START, FUNC_WRITE, FUNC_READ, BROADCAST_ADDR, FRAME_WRITE_RESP_LENGTH, FR_CONTENTS, RW_LENGTH_ALL, CRC_LENGTH, DONT_CARE_LENGTH
+import framing
+from .adaptor import HeatmiserAdaptor
+from .busexecutor import BusFuture
+from .exceptions import HeatmiserError, HeatmiserResponseError
+
+class _Transaction(object):
+    """A queued frame and the progress of its response"""
+    def __init__(self, address, message, check, framelength, attempts, readlength=None):
+        self.future = BusFuture()
+        self.address = address
+        self.message = message
+        self.check = check #ResponseFrameValidator arguments, None if no response expected
+        self.framelength = framelength
+        self.attempts = attempts
+        self.readlength = readlength #payload length for reads, None for writes
+        self.attempt = 0
+        self.validator = None #set once the frame is sent
+        self.sent = None
+        self.deadline = None
+        self.received = 0
+        self.decoder = None #FrameDecoder looking for a good frame after a bad one
+        self.resyncend = None
+        self.error = None #what went wrong, while resynchronising
+
+class AsyncHeatmiserAdaptor(HeatmiserAdaptor):
+    """HeatmiserAdaptor with queued, non blocking transactions
+
+    read_from_device, read_all_from_device and write_to_device are thin wrappers running the
+    queue until their transaction completes. Read payloads are copies, not views of the receive
+    buffer. After a bad frame the rest of it and the bytes following are searched for a good
+    response, as HeatmiserAdaptor._resync, until the bus is quiet, before retrying."""
+    read_attempts = 2
+    write_attempts = 3
+    poll_interval = 0.01 #wait between checks on ports without a fileno to select on
+
+    def __init__(self, setup):
+        self._queue = collections.deque()
+        self._current = None
+        self.transactions = 0
+        super(AsyncHeatmiserAdaptor, self).__init__(setup)
+
+### queuing transactions
+
+    def read_from_device_async(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        """Queue a read, returns a BusFuture for the payload"""
+        if readall:
+            msg = self.read_frames.get(network_address, protocol, self.my_master_addr, DCB_START, RW_LENGTH_ALL)
+        else:
+            msg = self.read_frames.get(network_address, protocol, self.my_master_addr, unique_start_address, expected_length)
+        check = (protocol, network_address, self.my_master_addr, FUNC_READ, expected_length)
+        return self._submit(_Transaction(network_address, msg, check, MIN_FRAME_READ_RESP_LENGTH + expected_length, self.read_attempts, expected_length))
+
+    def read_all_from_device_async(self, network_address, protocol, expected_length):
+        """Queue a read all, returns a BusFuture for the payload"""
+        return self.read_from_device_async(network_address, protocol, DCB_START, expected_length, True)
+
+    def write_to_device_async(self, network_address, protocol, unique_address, length, payload):
+        """Queue a write, returns a BusFuture completing when it is acknowledged, or sent if broadcast"""
+        msg = framing.form_frame(network_address, protocol, self.my_master_addr, FUNC_WRITE, unique_address, length, payload)
+        check = None if network_address == BROADCAST_ADDR else (protocol, network_address, self.my_master_addr, FUNC_WRITE, DONT_CARE_LENGTH)
+        return self._submit(_Transaction(network_address, msg, check, FRAME_WRITE_RESP_LENGTH, self.write_attempts))
+
+    def _submit(self, transaction):
+        """Add transaction to the queue"""
+        self._queue.append(transaction)
+        return transaction.future
+
+    @property
+    def pending(self):
+        """Number of transactions queued or running"""
+        return len(self._queue) + (self._current is not None)
+
+### blocking wrappers
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        """Queued read_from_device, run to completion"""
+        return self.run_until_complete(self.read_from_device_async(network_address, protocol, unique_start_address, expected_length, readall))
+
+    def write_to_device(self, network_address, protocol, unique_address, length, payload):
+        """Queued write_to_device, run to completion"""
+        return self.run_until_complete(self.write_to_device_async(network_address, protocol, unique_address, length, payload))
+
+### event loop
+
+    def next_deadline(self):
+        """Monotonic time process must next be called, None if nothing is queued
+
+        While a response is arriving process should also be called when the port is readable."""
+        if self._current is None and not self._queue:
+            return None
+        if self._current is None or self._current.validator is None:
+            return self.bus_free_time()
+        return self._current.deadline
+
+    def fileno(self):
+        """File descriptor of the port, for select, None if the port doesn't have one"""
+        try:
+            return self.serport.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            return None
+
+    def process(self):
+        """Progress queued transactions as far as possible without blocking, returns next_deadline"""
+        while True:
+            transaction = self._current
+            if transaction is None:
+                if not self._queue:
+                    break
+                transaction = self._current = self._queue.popleft()
+            now = self._clock()
+            try:
+                if transaction.validator is None:
+                    if now < self.busfreeat:
+                        break
+                    self._send(transaction, now)
+                elif transaction.decoder is not None:
+                    if not self._drain(transaction, now):
+                        break
+                elif not self._receive(transaction, now):
+                    break
+            except HeatmiserResponseError as err:
+                self._retry(transaction, err)
+            except Exception: #pylint: disable=broad-except
+                self._complete(transaction, excinfo=sys.exc_info())
+        return self.next_deadline()
+
+    def run_until_complete(self, future):
+        """Process transactions until future is done, waiting on the port, returns its result"""
+        while not future.done():
+            deadline = self.process()
+            if future.done():
+                break
+            if deadline is None:
+                raise HeatmiserError("Bus future can't complete, nothing queued")
+            self._wait(deadline)
+        return future.result()
+
+    def _wait(self, deadline):
+        """Wait until deadline or, while a response is arriving, the port is readable"""
+        wait = deadline - self._clock()
+        if wait <= 0:
+            return
+        fileno = None
+        if self._current is not None and self._current.validator is not None:
+            fileno = self.fileno()
+        if fileno is None:
+            self._sleep(min(wait, self.poll_interval))
+        else:
+            select.select([fileno], [], [], wait)
+
+### transaction states
+
+    def _send(self, transaction, now):
+        """Send the frame, the bus has settled"""
+        transaction.attempt += 1
+        self._send_message(transaction.message)
+        if transaction.check is None: #broadcast, wait longer until next send
+            self._hold_bus(self.serport.COM_SEND_MIN_TIME)
+            self._complete(transaction)
+            return
+        transaction.validator = framing.ResponseFrameValidator(*transaction.check)
+        transaction.sent = now
+        transaction.deadline = now + self.serport.COM_START_TIMEOUT
+        transaction.received = 0
+
+    def _receive(self, transaction, now):
+        """Read what has arrived, returns true if the transaction has completed
+
+        Raises HeatmiserResponseError if the frame is bad or a time out has passed."""
+        validator = transaction.validator
+        while not validator.complete:
+            waiting = self.serport.in_waiting
+            if not waiting:
+                break
+            if transaction.received == 0: #first byte, allow the rest of COM_TIMEOUT
+                transaction.deadline = now + max(self.serport.COM_MIN_TIMEOUT, self.serport.COM_TIMEOUT - (now - transaction.sent))
+            start = transaction.received
+            self.serport.timeout = 0
+            count = self._read_bytes(start, min(waiting, validator.remaining))
+            transaction.received += count
+            validator.feed(self._rxbuffer, start, start + count)
+        if validator.complete:
+            self._received(transaction, now)
+            return True
+        if now >= transaction.deadline:
+            if transaction.received == 0:
+                raise HeatmiserResponseError("No Response")
+            raise HeatmiserResponseError("Response incomplete after %i bytes"%transaction.received)
+        return False
+
+    def _received(self, transaction, now):
+        """Complete transaction with the good frame of transaction.received bytes in the receive buffer"""
+        seconds = now - transaction.sent
+        self.receive_stats.record(seconds, seconds)
+        result = None
+        if transaction.readlength is not None:
+            self.read_calibration.record(transaction.address, transaction.readlength, seconds)
+            result = bytearray(self._rxbuffer[FR_CONTENTS:transaction.received - CRC_LENGTH])
+        logging.debug("C%i transaction complete in %.2f s"%(transaction.address, seconds))
+        self._complete(transaction, result)
+
+    def _start_resync(self, transaction, err, now):
+        """Look for a good frame in the rest of a bad one, process then drains the bytes following it"""
+        validator = transaction.validator
+        transaction.decoder = framing.FrameDecoder(validator.source, validator.destination)
+        transaction.error = err
+        transaction.resyncend = now + self.serport.COM_TIMEOUT
+        transaction.deadline = min(now + self.serport.COM_MIN_TIMEOUT, transaction.resyncend)
+        self._resynced(transaction, transaction.decoder.feed(self._rxbuffer[1:transaction.received]), now) #first byte can't start a good frame
+
+    def _drain(self, transaction, now):
+        """Pass arriving bytes to the resync decoder, returns true once a good frame is found or the bus is quiet
+
+        Quiet is no bytes for COM_MIN_TIMEOUT, waiting at most COM_TIMEOUT, then the transaction is retried."""
+        decoder = transaction.decoder
+        waiting = self.serport.in_waiting
+        while waiting:
+            self.serport.timeout = 0
+            count = self._read_bytes(0, waiting)
+            transaction.deadline = min(now + self.serport.COM_MIN_TIMEOUT, transaction.resyncend)
+            if self._resynced(transaction, decoder.feed(self._rxbuffer[:count]), now):
+                return True
+            waiting = self.serport.in_waiting
+        if now < transaction.deadline:
+            return False
+        if self._resynced(transaction, decoder.flush(), now):
+            return True
+        self.receive_stats.record_discard(decoder, True)
+        self.serport.reset_input_buffer()
+        transaction.decoder = None
+        transaction.received = 0
+        self._retry(transaction, transaction.error)
+        return True
+
+    def _resynced(self, transaction, frames, now):
+        """Complete transaction with the first of frames that is a good response, returns true if one was"""
+        for frame in frames:
+            checker = framing.ResponseFrameValidator(*transaction.check)
+            try:
+                checker.feed(frame)
+            except HeatmiserResponseError as err:
+                logging.debug("C%i Resync skipped frame: %s"%(transaction.address, str(err)))
+                continue
+            self.serport.reset_input_buffer() #drop anything left
+            self.receive_stats.record_discard(transaction.decoder, True)
+            logging.info("C%i Resynchronised after %i discarded bytes"%(transaction.address, transaction.decoder.discarded))
+            transaction.decoder = None
+            self._ensure_receive_buffer(len(frame))
+            self._rxbuffer[:len(frame)] = frame
+            transaction.received = len(frame)
+            self._received(transaction, now)
+            return True
+        return False
+
+    def _retry(self, transaction, err):
+        """Resend after a bad or missing response, failing the transaction after its attempts
+
+        A bad frame is first resynchronised, resending only if no good response follows it."""
+        logging.warn("C%i transaction failed, %s"%(transaction.address, str(err)))
+        if transaction.received and transaction.decoder is None and transaction.validator is not None:
+            self._start_resync(transaction, err, self._clock())
+            return
+        self._hold_bus(self.serport.COM_BUS_RESET_TIME)
+        if transaction.sent is not None:
+            seconds = self._clock() - transaction.sent
+            self.receive_stats.record(seconds, seconds)
+        transaction.validator = None
+        if transaction.attempt < transaction.attempts:
+            logging.warn("Gen retrying due to %s"%str(err))
+            return
+        try:
+            raise HeatmiserResponseError("Failed after %i retries on %s"%(transaction.attempts, str(err)))
+        except HeatmiserResponseError:
+            self._complete(transaction, excinfo=sys.exc_info())
+
+    def _complete(self, transaction, result=None, excinfo=None):
+        """Finish transaction, callbacks may queue more"""
+        if transaction is self._current:
+            self._current = None
+        self.transactions += 1
+        if excinfo is None:
+            transaction.future.set_result(result)
+        else:
+            transaction.future.set_exception(excinfo)
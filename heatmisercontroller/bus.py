@@ -0,0 +1,79 @@
+"""Named RS485 buses, each with its own adaptor and bus thread, so a network can span several
+
+Devices are assigned to a bus in the configuration. Work on different buses runs concurrently,
+each on its own worker thread, and the devices on one bus in turn, so a sweep takes as long as
+the largest bus rather than the sum of them all."""
+import sys
+import threading
+
+from busexecutor import BusExecutor, BusFuture, ExecutorAdaptor
+
+class HeatmiserBus(object):
+    """A named bus, its adaptor and, once started, its BusExecutor"""
+    def __init__(self, name, adaptor):
+        self.name = name
+        self.adaptor = adaptor
+        self.executor = None
+        self.addresses = [] #device addresses in use on this bus
+
+    def __repr__(self):
+        return "Bus %s, %i devices"%(self.name, len(self.addresses))
+
+    @property
+    def device_adaptor(self):
+        """Adaptor for devices on this bus to use, queuing on the bus thread when it is running"""
+        return self.adaptor if self.executor is None else ExecutorAdaptor(self.executor)
+
+    def start_executor(self):
+        """Start the bus thread, returns the BusExecutor"""
+        if self.executor is None:
+            self.executor = BusExecutor(self.adaptor)
+            self.executor.start()
+        return self.executor
+
+    def stop_executor(self):
+        """Stop the bus thread, after queued transactions"""
+        if self.executor is not None:
+            self.executor.stop()
+            self.executor = None
+
+class BroadcastAdaptor(object):
+    """Adaptor for the broadcast device of a network with several buses
+
+    Writes go to every bus, through its device_adaptor, the buses concurrently. Anything else
+    is taken from the first bus's device_adaptor."""
+    def __init__(self, buses):
+        self._buses = list(buses)
+
+    def __getattr__(self, name):
+        return getattr(self._buses[0].device_adaptor, name)
+
+    def write_to_device(self, network_address, protocol, unique_address, length, payload):
+        """Write to every bus, raising the first error once all have been written"""
+        outcomes = run_on_buses(lambda bus: bus.device_adaptor.write_to_device(network_address, protocol, unique_address, length, payload), self._buses)
+        for _, excinfo in outcomes:
+            if excinfo is not None:
+                raise excinfo[0], excinfo[1], excinfo[2]
+
+def _run_into(future, function, *args):
+    """Run function(*args), setting future to its result or exception"""
+    try:
+        future.set_result(function(*args))
+    except Exception: #pylint: disable=broad-except
+        future.set_exception(sys.exc_info())
+
+def run_on_buses(function, buses):
+    """Run function(bus) for each of buses, concurrently on a worker thread for each after the first
+
+    function runs on the caller's side, only the adaptor calls it makes queue on a bus thread.
+    So device locks are never waited for on a bus thread, where a caller holding one could be
+    waiting in turn for the bus thread.
+    Returns list of (result, excinfo) in the order of buses, excinfo None where it succeeded."""
+    futures = [BusFuture() for _ in buses]
+    for future, bus in zip(futures, buses)[1:]:
+        worker = threading.Thread(target=_run_into, args=(future, function, bus), name="HeatmiserBusWorker")
+        worker.daemon = True
+        worker.start()
+    if buses:
+        _run_into(futures[0], function, buses[0])
+    return [future.outcome() for future in futures]
@@ -0,0 +1,178 @@
+"""Runs all transactions on an adaptor in one thread, so threads can share a network
+
+Transactions are queued by priority, writes before interactive reads before background
+polling, and each returns a BusFuture. Devices use an ExecutorAdaptor in place of the
+adaptor, which queues each call and waits for its result. Bus spacing, COM_BUS_RESET_TIME
+and COM_SEND_MIN_TIME, is still enforced by the adaptor, now only ever from one thread."""
+import sys
+import logging
+import threading
+import itertools
+import Queue
+
+from hm_constants import BUS_PRIORITY_WRITE, BUS_PRIORITY_INTERACTIVE
+from .exceptions import HeatmiserError
+
+class BusFuture(object):
+    """Result of a transaction queued on a BusExecutor"""
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._excinfo = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """Returns true if the transaction has run"""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Returns the transaction result, raising its exception if it failed
+
+        Raises HeatmiserError if timeout seconds pass first."""
+        if not self._done.wait(timeout):
+            raise HeatmiserError("Bus transaction not run within %s s"%timeout)
+        if self._excinfo is not None:
+            raise self._excinfo[0], self._excinfo[1], self._excinfo[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """Returns the exception raised by the transaction, None if it succeeded"""
+        if not self._done.wait(timeout):
+            raise HeatmiserError("Bus transaction not run within %s s"%timeout)
+        return None if self._excinfo is None else self._excinfo[1]
+
+    def outcome(self, timeout=None):
+        """Returns (result, excinfo) once the transaction has run, excinfo None if it succeeded"""
+        if not self._done.wait(timeout):
+            raise HeatmiserError("Bus transaction not run within %s s"%timeout)
+        return self._result, self._excinfo
+
+    def add_done_callback(self, callback):
+        """Call callback(future) when the transaction has run, now if it already has"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        """Complete with result"""
+        self._result = result
+        self._finish()
+
+    def set_exception(self, excinfo):
+        """Complete with exception, excinfo as from sys.exc_info"""
+        self._excinfo = excinfo
+        self._finish()
+
+    def _finish(self):
+        """Wake waiters and run callbacks"""
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception: #pylint: disable=broad-except
+                logging.exception("Gen bus future callback failed")
+
+class BusExecutor(object):
+    """Thread owning an adaptor, running transactions from a priority queue"""
+    def __init__(self, adaptor):
+        self.adaptor = adaptor
+        self.transactions = 0
+        self._queue = Queue.PriorityQueue()
+        self._sequence = itertools.count() #keeps equal priorities in order
+        self._local = threading.local()
+        self._thread = None
+
+    def start(self):
+        """Start the bus thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="HeatmiserBus")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the bus thread once the queued transactions have run"""
+        if self._thread is not None:
+            self._queue.put((sys.maxint, next(self._sequence), None, None, None, None))
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        """True if the bus thread is running"""
+        return self._thread is not None
+
+    def set_thread_priority(self, priority):
+        """Set the priority of reads made through an ExecutorAdaptor by the calling thread"""
+        self._local.priority = priority
+
+    def thread_priority(self):
+        """Returns the read priority of the calling thread, interactive unless set"""
+        return getattr(self._local, 'priority', BUS_PRIORITY_INTERACTIVE)
+
+    def in_bus_thread(self):
+        """True if called from the bus thread"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, priority, function, *args, **kwargs):
+        """Queue function(*args, **kwargs) to run on the bus thread, returns a BusFuture"""
+        if self._thread is None:
+            raise HeatmiserError("Bus executor not running")
+        future = BusFuture()
+        self._queue.put((priority, next(self._sequence), future, function, args, kwargs))
+        return future
+
+    def _run(self):
+        """Bus thread, runs transactions until stopped"""
+        logging.info("Gen bus executor started")
+        while True:
+            _, _, future, function, args, kwargs = self._queue.get()
+            if future is None:
+                break
+            try:
+                result = function(*args, **kwargs)
+            except Exception: #pylint: disable=broad-except
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+            self.transactions += 1
+        logging.info("Gen bus executor stopped after %i transactions"%self.transactions)
+
+def _copy_payload(function, *args):
+    """Run adaptor read function, copying the payload before the next receive reuses the buffer"""
+    return bytearray(function(*args))
+
+class ExecutorAdaptor(object):
+    """Stands in for a HeatmiserAdaptor, running transactions on a BusExecutor
+
+    Reads are queued at the calling thread's priority, writes ahead of reads, and each call
+    waits for its result. Read payloads are copies, not views of the receive buffer.
+    Other attributes, such as read_calibration, come from the adaptor."""
+    def __init__(self, executor):
+        self._executor = executor
+        self._adaptor = executor.adaptor
+
+    def __getattr__(self, name):
+        return getattr(self._adaptor, name)
+
+    def _call(self, priority, function, *args):
+        """Run function on the bus thread and return its result, directly if already on it or it isn't running"""
+        if not self._executor.running or self._executor.in_bus_thread():
+            return function(*args)
+        return self._executor.submit(priority, function, *args).result()
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        """Queued read_from_device"""
+        return self._call(self._executor.thread_priority(), _copy_payload, self._adaptor.read_from_device, network_address, protocol, unique_start_address, expected_length, readall)
+
+    def read_all_from_device(self, network_address, protocol, expected_length):
+        """Queued read_all_from_device"""
+        return self._call(self._executor.thread_priority(), _copy_payload, self._adaptor.read_all_from_device, network_address, protocol, expected_length)
+
+    def write_to_device(self, network_address, protocol, unique_address, length, payload):
+        """Queued write_to_device, ahead of reads"""
+        return self._call(BUS_PRIORITY_WRITE, self._adaptor.write_to_device, network_address, protocol, unique_address, length, payload)
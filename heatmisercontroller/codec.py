@@ -0,0 +1,91 @@
+"""Bulk decode and encode of DCB field blocks with precompiled structs
+
+The DCB layout of a device class is fixed, so a struct is compiled once for each run
+of fields read or written together. Single byte fields are 'B', double byte fields
+'H', big endian when read and little endian when written, and multi byte fields 'nB'.
+Fields whose class changes how values are calculated, and unknown fields, are 'nx'
+filler when reading and left to decode themselves.
+Each field has a small function taking its value from the unpacked items, built once,
+so decoding is a single list comprehension over them."""
+import struct
+import operator
+
+from fields import HeatmiserFieldSingle, HeatmiserFieldDouble, HeatmiserFieldMulti
+
+SINGLE, DOUBLE, MULTI, OTHER = range(4)
+KIND_CLASSES = ((SINGLE, HeatmiserFieldSingle), (DOUBLE, HeatmiserFieldDouble), (MULTI, HeatmiserFieldMulti))
+
+def _field_kind(field, methodname):
+    """returns how the codec handles field, OTHER if the class overrides methodname"""
+    for kind, fieldclass in KIND_CLASSES:
+        if isinstance(field, fieldclass):
+            if getattr(type(field), methodname).im_func is getattr(fieldclass, methodname).im_func:
+                return kind
+            break
+    return OTHER
+
+def _value_decoder(kind, position, length, divisor):
+    """returns function getting a field value from the unpacked items"""
+    if kind == SINGLE and divisor == 1:
+        return operator.itemgetter(position)
+    elif kind == SINGLE:
+        return lambda items: items[position]/divisor
+    elif kind == DOUBLE:
+        return lambda items: 1.0*items[position]/divisor #force float, as HeatmiserFieldDouble
+    elif kind == MULTI:
+        end = position + length
+        return lambda items: list(items[position:end])
+    return lambda items: None
+
+def _struct_code(kind, length, writing):
+    """returns struct format code for a field"""
+    if kind == SINGLE:
+        return 'B'
+    elif kind == DOUBLE:
+        return 'H'
+    elif kind == MULTI or writing:
+        return '%iB'%length
+    return '%ix'%length
+
+class BlockCodec(object):
+    """Decoder and encoder for a list of fields contiguous in the DCB"""
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._decoders = []
+        self._writekinds = []
+        readcodes = []
+        writecodes = []
+        position = 0
+        for field in self.fields:
+            kind = _field_kind(field, '_calculate_value')
+            self._decoders.append(_value_decoder(kind, position, field.fieldlength, field.divisor))
+            readcodes.append(_struct_code(kind, field.fieldlength, False))
+            position += {SINGLE: 1, DOUBLE: 1, MULTI: field.fieldlength, OTHER: 0}[kind]
+            kind = _field_kind(field, 'format_data_from_value')
+            self._writekinds.append(kind)
+            writecodes.append(_struct_code(kind, field.fieldlength, True))
+        self._reader = struct.Struct('>' + ''.join(readcodes))
+        #single and multi byte values are already bytes, so only pack if there are doubles
+        self._writer = struct.Struct('<' + ''.join(writecodes)) if DOUBLE in self._writekinds else None
+        self.length = self._reader.size
+
+    def decode(self, buffer, offset=0, indexes=None):
+        """returns values of the fields at indexes, all if None, from buffer starting at offset
+        None for fields that must calculate their own value"""
+        items = self._reader.unpack_from(buffer, offset)
+        decoders = self._decoders if indexes is None else [self._decoders[index] for index in indexes]
+        return [decoder(items) for decoder in decoders]
+
+    def encode(self, values):
+        """returns write payload, as a list of bytes, for values of all the fields"""
+        items = []
+        for field, kind, value in zip(self.fields, self._writekinds, values):
+            if kind == SINGLE or kind == DOUBLE:
+                items.append(value)
+            elif kind == MULTI:
+                items.extend(value)
+            else:
+                items.extend(field.format_data_from_value(value))
+        if self._writer is None:
+            return items
+        return list(bytearray(self._writer.pack(*items)))
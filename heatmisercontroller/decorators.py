@@ -1,13 +1,30 @@
-"""Decorators meethods to support broadcast controller running functions on multiple devices"""
+"""Decorators meethods to support broadcast controller running functions on multiple devices, and device locking"""
+import sys
 import logging
+import functools
 import serial
 
 from .exceptions import HeatmiserResponseError, HeatmiserControllerTimeError
 
+def run_each(function, objects):
+    """Run function(obj) for each of objects in turn
+
+    Returns list of (result, excinfo), excinfo None where it succeeded."""
+    outcomes = []
+    for obj in objects:
+        try:
+            outcomes.append((function(obj), None))
+        except Exception: #pylint: disable=broad-except
+            outcomes.append((None, sys.exc_info()))
+    return outcomes
+
 class ListWrapperClass(object):
-    """Class to provide mutable list as decorator argument"""
+    """Class to provide mutable list as decorator argument
+
+    fan_out(function, objects) runs function on each object, defaults to run_each."""
     def __init__(self):
         self._storedlist = None
+        self.fan_out = run_each
 
     @property
     def list(self):
@@ -34,13 +51,15 @@ def run_function_on_all(liststore):
             func(self, *args, **kwargs)
             results = [None] * len(liststore.list)
             lasterror = None
-            for index, obj in enumerate(liststore.list):
-                try:
-                    results[index] = getattr(obj, func.__name__)(*args, **kwargs)
-                except (HeatmiserResponseError, serial.SerialException, HeatmiserControllerTimeError) as err:
+            outcomes = liststore.fan_out(lambda obj: getattr(obj, func.__name__)(*args, **kwargs), liststore.list)
+            for index, (obj, (result, excinfo)) in enumerate(zip(liststore.list, outcomes)):
+                if excinfo is None:
+                    results[index] = result
+                elif isinstance(excinfo[1], (HeatmiserResponseError, serial.SerialException, HeatmiserControllerTimeError)):
+                    lasterror = excinfo[1]
                     logging.warn("C%i %s failed due to %s"%(obj.set_address, func.__name__, str(lasterror)))
-                    lasterror = err
-                    continue
+                else:
+                    raise excinfo[0], excinfo[1], excinfo[2]
 
             if all(result is None for result in results):
                 raise HeatmiserResponseError("All failed, last error was %s"%(str(lasterror)))
@@ -49,3 +68,12 @@ def run_function_on_all(liststore):
 
         return inner
     return wraps
+
+def device_locked(func):
+    """Decorator holding the device lock while method runs, so threads sharing a device don't interleave reads and writes"""
+    @functools.wraps(func)
+    def inner(self, *args, **kwargs):
+        """Decorator internal"""
+        with self._lock:
+            return func(self, *args, **kwargs)
+    return inner
@@ -20,6 +20,7 @@ class ThermoStatWeek(HeatmiserDevice):
     """Device class for thermostats operating weekly programmode
     Heatmiser prt_e_model."""
     is_hot_water = False #returns True if stat is a model with hotwater control, False otherwise
+    _eager_fields = ('currenttime',)
     
     def __init__(self, adaptor, devicesettings, generalsettings=None):
         self.heat_schedule = None #placeholder for heating schedule object
@@ -65,6 +66,9 @@ class ThermoStatWeek(HeatmiserDevice):
             HeatmiserFieldHeat('wend_heat', 59, [[0, 24], [0, 59], [5, 35]], MAX_AGE_MEDIUM)
             ])
 
+    def _build_schedules(self):
+        """add heating schedule and thermostat"""
+        super(ThermoStatWeek, self)._build_schedules()
         self.heat_schedule = SchedulerWeekHeat()
         self.thermostat = Thermostat('Heating', self)
 
@@ -96,9 +100,9 @@ class ThermoStatWeek(HeatmiserDevice):
         super(ThermoStatWeek, self)._set_expected_field_values()
         self.programmode.expectedvalue = self.programmode.readvalues[self.set_expected_prog_mode]
 
-    def _procfield(self, data, fieldinfo):
+    def _procfield(self, data, fieldinfo, value=None):
         """Process data for a single field storing in relevant."""
-        super(ThermoStatWeek, self)._procfield(data, fieldinfo)
+        super(ThermoStatWeek, self)._procfield(data, fieldinfo, value)
 
         if fieldinfo.name == 'currenttime':
             self._checkcontrollertime()
@@ -239,6 +243,9 @@ class ThermoStatDay(ThermoStatWeek):
             HeatmiserFieldHeat('sun_heat', 175, [[0, 24], [0, 59], [5, 35]], MAX_AGE_MEDIUM)
         ])
 
+    def _build_schedules(self):
+        """add daily heating schedule"""
+        super(ThermoStatDay, self)._build_schedules()
         self.heat_schedule = SchedulerDayHeat()
 
     def _connect_observers(self):
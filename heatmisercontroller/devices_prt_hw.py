@@ -16,6 +16,7 @@ class ThermoStatHotWaterWeek(ThermoStatWeek):
     """Device class for thermostats with hotwater operating weekly programmode
     Heatmiser prt_hw_model."""
     is_hot_water = True
+    _eager_fields = ('currenttime', 'version')
 
     def __init__(self, adaptor, devicesettings, generalsettings=None):
         self.water_schedule = None #placeholder for hot water schedule
@@ -37,13 +38,18 @@ class ThermoStatHotWaterWeek(ThermoStatWeek):
             #7day progamming
         ])
 
+    def _build_schedules(self):
+        """add hot water schedule"""
+        super(ThermoStatHotWaterWeek, self)._build_schedules()
         self.water_schedule = SchedulerWeekWater()
 
+    _floorlimiting = HeatmiserFieldSingleReadOnly('floorlimiting', None, [0, 1], None) #should specify mapping for on and off.
+
     def _configure_fields(self):
         """add dummy field for floor limit"""
         super(ThermoStatHotWaterWeek, self)._configure_fields()
         
-        field = HeatmiserFieldSingleReadOnly('floorlimiting', None, [0, 1], None) #should specify mapping for on and off.
+        field = self._floorlimiting.copy()
         
         #store field pointer as property
         setattr(self, field.name, field)
@@ -56,9 +62,9 @@ class ThermoStatHotWaterWeek(ThermoStatWeek):
         self.wday_water.add_notifable_changed(self.water_schedule.set_raw_field)
         self.wend_water.add_notifable_changed(self.water_schedule.set_raw_field)
 
-    def _procfield(self, data, fieldinfo):
+    def _procfield(self, data, fieldinfo, value=None):
         """Process data for a single field storing in relevant."""
-        super(ThermoStatHotWaterWeek, self)._procfield(data, fieldinfo)
+        super(ThermoStatHotWaterWeek, self)._procfield(data, fieldinfo, value)
         
         if fieldinfo.name == 'version':
             super(ThermoStatHotWaterWeek, self)._procfield([self.version.floorlimiting], self.floorlimiting)
@@ -112,6 +118,10 @@ class ThermoStatHotWaterDay(ThermoStatDay, ThermoStatHotWaterWeek):
             HeatmiserFieldWater('sat_water', 267, [[0, 24], [0, 59]], MAX_AGE_MEDIUM),
             HeatmiserFieldWater('sun_water', 283, [[0, 24], [0, 59]], MAX_AGE_MEDIUM)
         ])
+
+    def _build_schedules(self):
+        """add daily hot water schedule"""
+        super(ThermoStatHotWaterDay, self)._build_schedules()
         self.water_schedule = SchedulerDayWater()
 
     def _connect_observers(self):
@@ -1,17 +1,78 @@
 """generic field definitions for Heatmiser protocol"""
 import logging
 import time
+from array import array
 
 from hm_constants import BYTEMASK
 from .exceptions import HeatmiserResponseError
 from .observer import Notifier
+from .freshness import ExpiryIndex
 
 VALUES_ON_OFF = {'ON': 1, 'OFF': 0} #assusme that default comes first, need to swtich to ordered dictionary to make it possible to get default value
 VALUES_OFF_ON = {'OFF': 0, 'ON': 1}
 VALUES_OFF = {'OFF': 0}
 
+UNREAD = float('-inf') #stored read time for a field that hasn't been read
+
+class FieldStore(object):
+    """Values, data, read times and expected values for a list of fields, indexed by field id
+
+    Devices keep one store for all their fields, so field objects only hold settings.
+    pending holds the read time of bytes received but not decoded yet, UNREAD if none,
+    decoder(fieldid) is called to decode them on first access to the field.
+    expiries indexes when each field with a max_age goes stale, touch must be called
+    when a read time is changed directly."""
+    __slots__ = ('values', 'data', 'readtimes', 'expected', 'pending', 'decoder', 'maxages', 'expiries')
+
+    def __init__(self, count, maxages=None):
+        self.values = [None] * count
+        self.data = [None] * count
+        self.readtimes = array('d', [UNREAD]) * count
+        self.expected = [None] * count
+        self.pending = array('d', [UNREAD]) * count
+        self.decoder = None
+        self.maxages = [None] * count if maxages is None else list(maxages)
+        self.expiries = ExpiryIndex(self.expiry, [index for index, maxage in enumerate(self.maxages) if maxage is not None])
+
+    def __len__(self):
+        return len(self.values)
+
+    def readtime(self, index):
+        """returns read time, including bytes pending decode, UNREAD if not read"""
+        pending = self.pending[index]
+        return self.readtimes[index] if pending == UNREAD else pending
+
+    def expiry(self, index):
+        """returns time field goes stale, the read time if it has no max_age"""
+        maxage = self.maxages[index]
+        return self.readtime(index) if maxage is None else self.readtime(index) + maxage
+
+    def touch(self, index):
+        """update the expiry index after the read time of index changed"""
+        if self.maxages[index] is not None:
+            self.expiries.push(index, self.expiry(index))
+
+    def clear_pending(self, index):
+        """forget bytes pending decode"""
+        if self.pending[index] != UNREAD:
+            self.pending[index] = UNREAD
+            self.touch(index)
+
+_SLOTNAMES = {}
+
+def _slot_names(fieldclass):
+    """returns names of the setting slots of fieldclass and its bases, excluding the state references"""
+    names = _SLOTNAMES.get(fieldclass)
+    if names is None:
+        names = []
+        for base in fieldclass.__mro__:
+            names.extend(name for name in base.__dict__.get('__slots__', ()) if name not in ('_store', '_index', '_notifiers'))
+        names = _SLOTNAMES[fieldclass] = tuple(names)
+    return names
+
 class HeatmiserFieldUnknown(Notifier):
     """Class for variable length unknown read only field"""
+    __slots__ = ('name', 'address', 'dcbaddress', 'max_age', '_length', '_store', '_index')
     writeable = False
     divisor = 1
 
@@ -21,8 +82,52 @@ class HeatmiserFieldUnknown(Notifier):
         self.address = address
         self.dcbaddress = address
         self.max_age = max_age
-        self.fieldlength = length
-        self._reset()
+        self._length = length
+        self._store = FieldStore(1)
+        self._index = 0
+
+    @property
+    def fieldlength(self):
+        """length in bytes, fixed by the class for known fields"""
+        return self._length
+
+    @property
+    def value(self):
+        """value, None if unknown"""
+        if self._store.pending[self._index] != UNREAD:
+            self._store.decoder(self._index)
+        return self._store.values[self._index]
+
+    @value.setter
+    def value(self, value):
+        self._store.clear_pending(self._index)
+        self._store.values[self._index] = value
+
+    @property
+    def data(self):
+        """bytes last read or written"""
+        if self._store.pending[self._index] != UNREAD:
+            self._store.decoder(self._index)
+        return self._store.data[self._index]
+
+    @data.setter
+    def data(self, data):
+        self._store.clear_pending(self._index)
+        self._store.data[self._index] = data
+
+    @property
+    def lastreadtime(self):
+        """time the field was last read or written, None if not read"""
+        if self._store.pending[self._index] != UNREAD:
+            self._store.decoder(self._index)
+        readtime = self._store.readtimes[self._index]
+        return None if readtime == UNREAD else readtime
+
+    @lastreadtime.setter
+    def lastreadtime(self, readtime):
+        self._store.pending[self._index] = UNREAD
+        self._store.readtimes[self._index] = UNREAD if readtime is None else readtime
+        self._store.touch(self._index)
 
     def __int__(self):
         return self.value
@@ -36,6 +141,20 @@ class HeatmiserFieldUnknown(Notifier):
     def __cmp__(self, value):
         return cmp(self.value, value)
 
+    def copy(self, store=None, index=0):
+        """Returns a new field sharing settings with this one, without observers.
+        State is kept in store at index, or a new store if None."""
+        field = object.__new__(type(self))
+        for name in _slot_names(type(self)):
+            setattr(field, name, getattr(self, name))
+        if hasattr(self, '__dict__'):
+            field.__dict__.update(self.__dict__)
+        Notifier.__init__(field)
+        field._store = FieldStore(1) if store is None else store
+        field._index = index
+        field._reset()
+        return field
+
     def _reset(self):
         """Reset data and values to unknown."""
         self.data = None
@@ -100,6 +219,7 @@ class HeatmiserFieldUnknown(Notifier):
 class HeatmiserField(HeatmiserFieldUnknown):
     """Base class for fields providing basic method calls"""
     #single value and hence single range
+    __slots__ = ('validrange', 'readvalues', 'writevalues')
     writeable = True
     fieldlength = 0
 
@@ -107,13 +227,20 @@ class HeatmiserField(HeatmiserFieldUnknown):
         ###valid range list can be [], [min, max], [list of valid values]
         super(HeatmiserField, self).__init__(name, address, max_age, self.fieldlength)
         self.validrange = validrange
-        self.value = None
-        self.expectedvalue = None
         self.writevalues = self.readvalues = readvalues
         #check isinstance(fieldrange[0], (int, long)) and isinstance(fieldrange[1], (int, long))
         if len(validrange) < 2:
             self.validrange = [0, self.maxdatavalue / self.divisor]
 
+    @property
+    def expectedvalue(self):
+        """value the field must have, None if any value in range is valid"""
+        return self._store.expected[self._index]
+
+    @expectedvalue.setter
+    def expectedvalue(self, value):
+        self._store.expected[self._index] = value
+
     def is_value(self, name):
         """Returns true if value matches read value."""
         return self.value == self.readvalues[name]
@@ -138,7 +265,10 @@ class HeatmiserField(HeatmiserFieldUnknown):
 
     def update_data(self, data, readtime):
         """update stored data and readtime if data valid. Compute and store value from data."""
-        value = self._calculate_value(data)
+        self.update_decoded(data, self._calculate_value(data), readtime)
+
+    def update_decoded(self, data, value, readtime):
+        """update stored data, value and readtime if value valid, value already computed from data."""
         if self.expectedvalue is not None and value != self.expectedvalue:
             raise HeatmiserResponseError('Value %i is unexpected for %s, expected %i'%(value, self.name, self.expectedvalue))
         self._validate_range(value)
@@ -189,6 +319,7 @@ class HeatmiserField(HeatmiserFieldUnknown):
 
 class HeatmiserFieldSingle(HeatmiserField):
     """Class for writable 1 byte field"""
+    __slots__ = ()
     maxdatavalue = 255
     fieldlength = 1
 
@@ -202,10 +333,12 @@ class HeatmiserFieldSingle(HeatmiserField):
 
 class HeatmiserFieldSingleReadOnly(HeatmiserFieldSingle):
     """Class for read only 1 byte field"""
+    __slots__ = ()
     writeable = False
 
 class HeatmiserFieldDouble(HeatmiserField):
     """Class for writable 2 byte field"""
+    __slots__ = ()
     maxdatavalue = 65535
     fieldlength = 2
 
@@ -223,14 +356,17 @@ class HeatmiserFieldDouble(HeatmiserField):
 
 class HeatmiserFieldDoubleReadOnly(HeatmiserFieldDouble):
     """Class for read only 2 byte field"""
+    __slots__ = ()
     writeable = False
 
 class HeatmiserFieldDoubleReadOnlyTenths(HeatmiserFieldDoubleReadOnly):
     """Class for read only 2 byte field"""
+    __slots__ = ()
     divisor = 10.0
 
 class HeatmiserFieldMulti(HeatmiserField):
     """Base class for writable multi byte field"""
+    __slots__ = ()
     maxdatavalue = None
 
     def _validate_range(self, values, errortype=HeatmiserResponseError, expectedrange=None):
@@ -241,7 +377,7 @@ class HeatmiserFieldMulti(HeatmiserField):
 
     def _calculate_value(self, data):
         """Calculate value from payload bytes"""
-        return data
+        return list(data)
 
     def format_data_from_value(self, value):
         """Convert field to byte form for writting to device"""
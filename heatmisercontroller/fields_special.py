@@ -9,7 +9,11 @@ from .exceptions import HeatmiserResponseError, HeatmiserControllerTimeError
 
 class HeatmiserFieldHotWaterVersion(HeatmiserFieldSingleReadOnly):
     """Class for version on hotwater models."""
-    floorlimiting = None
+    __slots__ = ('floorlimiting',)
+
+    def __init__(self, name, address, validrange, max_age, readvalues=None):
+        super(HeatmiserFieldHotWaterVersion, self).__init__(name, address, validrange, max_age, readvalues)
+        self.floorlimiting = None
 
     def _calculate_value(self, data):
         """Calculate value from payload bytes"""
@@ -18,6 +22,8 @@ class HeatmiserFieldHotWaterVersion(HeatmiserFieldSingleReadOnly):
 
 class HeatmiserFieldHotWaterDemand(HeatmiserFieldSingle):
     """Class to impliment read and write differences for hotwater demand field."""
+    __slots__ = ()
+
     def __init__(self, name, address, validrange, max_age):
         super(HeatmiserFieldHotWaterDemand, self).__init__(name, address, validrange, max_age, VALUES_ON_OFF)
         self.writevalues = {'PROG': 0, 'OVER_ON': 1, 'OVER_OFF': 2}
@@ -35,6 +41,7 @@ class HeatmiserFieldHotWaterDemand(HeatmiserFieldSingle):
 
 class HeatmiserFieldTime(HeatmiserFieldMulti):
     """Class for time field"""
+    __slots__ = ('timeerr',)
     fieldlength = 4
 
     def __init__(self, name, address, max_age):
@@ -92,8 +99,10 @@ class HeatmiserFieldTime(HeatmiserFieldMulti):
 
 class HeatmiserFieldHeat(HeatmiserFieldMulti):
     """Class for heating schedule field"""
+    __slots__ = ()
     fieldlength = 12
 
 class HeatmiserFieldWater(HeatmiserFieldMulti):
     """Class for hotwater schedule field"""
+    __slots__ = ()
     fieldlength = 16
@@ -1,12 +1,15 @@
 """Functions for creating and checking Heatmiser protocol frames"""
 import logging
+from collections import OrderedDict
 
-from hm_constants import BYTEMASK, MIN_FRAME_SEND_LENGTH, MIN_FRAME_RESP_LENGTH, MIN_FRAME_READ_RESP_LENGTH, FRAME_WRITE_RESP_LENGTH, MAX_PAYLOAD_SEND_LENGTH, RW_LENGTH_ALL, DONT_CARE_LENGTH
+from hm_constants import BYTEMASK, CRC_LENGTH, MIN_FRAME_SEND_LENGTH, MIN_FRAME_RESP_LENGTH, MIN_FRAME_READ_RESP_LENGTH, FRAME_WRITE_RESP_LENGTH, MAX_PAYLOAD_SEND_LENGTH, RW_LENGTH_ALL, DONT_CARE_LENGTH
 from hm_constants import FUNC_WRITE, FUNC_READ
 from hm_constants import FR_LEN_LOW, FR_LEN_HIGH, FR_FUNC_CODE, FR_DEST_ADDR, FR_SOURCE_ADDR
 from hm_constants import MASTER_ADDR_MIN, MASTER_ADDR_MAX, SLAVE_ADDR_MIN, SLAVE_ADDR_MAX
 from hm_constants import HMV3_ID
+from hm_constants import FS_DEST_ADDR, FS_LEN, FS_SOURCE_ADDR, FS_FUNC_CODE, BROADCAST_ADDR, RECEIVE_BUFFER_LENGTH, READ_FRAME_CACHE_LENGTH
 from .exceptions import HeatmiserResponseError, HeatmiserResponseErrorCRC
+from .logging_setup import csvlist
 
 ### low level framing functions
 
@@ -14,9 +17,42 @@ def form_read_frame(destination, protocol, source, start, length):
     """Forms a read message payload, including CRC"""
     return form_frame(destination, protocol, source, FUNC_READ, start, length, [])
 
+class ReadFrameCache(object):
+    """Bounded least recently used cache of formed read frames
+
+    A polling loop sends the same read requests repeatedly, so these are only formed once.
+    Frames are keyed by destination, protocol, source, start and length; returned frames must not be modified.
+    Call invalidate if the master address changes."""
+    def __init__(self, maxsize=READ_FRAME_CACHE_LENGTH):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, destination, protocol, source, start, length):
+        """Returns read frame, forming and caching it if required"""
+        key = (destination, protocol, source, start, length)
+        frame = self._frames.pop(key, None)
+        if frame is None:
+            self.misses += 1
+            frame = form_read_frame(destination, protocol, source, start, length)
+            if len(self._frames) >= self.maxsize:
+                self._frames.popitem(last=False) #drop least recently used
+        else:
+            self.hits += 1
+        self._frames[key] = frame #most recently used last
+        return frame
+
+    def invalidate(self):
+        """Remove all cached frames"""
+        self._frames.clear()
+
 # TODO check master address is in legal range
 def form_frame(destination, protocol, source, function, start, length, payload):
-    """Forms a message payload, including CRC"""
+    """Forms a message payload, including CRC, as a bytearray"""
     _check_protocal(protocol)
     
     start_low = start & BYTEMASK
@@ -31,12 +67,11 @@ def form_frame(destination, protocol, source, function, start, length, payload):
         if length > MAX_PAYLOAD_SEND_LENGTH:
             raise ValueError("Payload to long %s" % length)
         frame_length = MIN_FRAME_SEND_LENGTH + payload_length
-    msg = [destination, frame_length, source, function, start_low, start_high, length_low, length_high]
+    msg = bytearray([destination, frame_length, source, function, start_low, start_high, length_low, length_high])
     if function == FUNC_WRITE:
-        msg = msg + payload
+        msg.extend(payload)
 
-    crc = crc16()
-    msg = msg + crc.run(msg)
+    msg.extend(crc16_bytes(msg))
     return msg
 
 def _check_frame_crc(data):
@@ -46,12 +81,8 @@ def _check_frame_crc(data):
     if datalength < 2:
         raise HeatmiserResponseError("No CRC")
 
-    checksum = data[len(data)-2:]
-    rxmsg = data[:len(data)-2]
-
-    crc = crc16() # Initialises the CRC
-    expectedchecksum = crc.run(rxmsg)
-    if expectedchecksum != checksum:
+    crc = crc16_update(CRC16_INIT, data, 0, datalength - 2)
+    if crc & BYTEMASK != data[datalength - 2] or crc >> 8 != data[datalength - 1]:
         raise HeatmiserResponseErrorCRC("CRC is incorrect")
 
 def _check_response_frame_length(data, expected_length):
@@ -67,6 +98,14 @@ def _check_response_frame_length(data, expected_length):
     if len(data) != frame_len:
         raise HeatmiserResponseError("Frame length does not match header: %s %s" %(len(data), frame_len))
 
+    _check_response_header_length(frame_len, func_code, expected_length)
+
+def _check_response_header_length(frame_len, func_code, expected_length):
+    """Takes frame length and function from header and checks length is possible"""
+    if frame_len < MIN_FRAME_RESP_LENGTH:
+        raise HeatmiserResponseError("Header length too short: %s %s"%(frame_len, MIN_FRAME_RESP_LENGTH))
+    if func_code == FUNC_READ and frame_len < MIN_FRAME_READ_RESP_LENGTH:
+        raise HeatmiserResponseError("Header length too short for read response: %s %s"%(frame_len, MIN_FRAME_READ_RESP_LENGTH))
     if expected_length != RW_LENGTH_ALL and func_code == FUNC_READ and frame_len != MIN_FRAME_READ_RESP_LENGTH + expected_length:
         # Read response length is wrong
         raise HeatmiserResponseError("Response length %s not EXPECTED value %s + %s given read request" %(frame_len, MIN_FRAME_READ_RESP_LENGTH, expected_length))
@@ -120,15 +159,194 @@ def verify_response(protocol, source, destination, expected_function, expected_l
         # check function
         _check_response_frame_function(expected_function, data)
     except HeatmiserResponseError as err:
-        logging.warning("C%s Invalid Response: %s: %s" %(source, str(err), data))
+        logging.warning("C%s Invalid Response: %s: %s" %(source, str(err), csvlist(data)))
         raise
 
     ## missing check that it is valid for this type of controller. Use DCBUnique function not false.
     ## although if needed should be in devices and not in framing
 
+class ResponseFrameValidator(object):
+    """Checks a response frame incrementally as the bytes are received
+
+    Addresses, function and length are checked as soon as the header is complete
+    and the CRC is updated with every byte, so the result is known when the last byte arrives."""
+    HEADER_LENGTH = FR_FUNC_CODE + 1
+
+    def __init__(self, protocol, source, destination, expected_function, expected_length):
+        _check_protocal(protocol)
+        self.protocol = protocol
+        self.source = source
+        self.destination = destination
+        self.expected_function = expected_function
+        self.expected_length = expected_length
+        self.header = []
+        self.received = 0
+        self.frame_length = None
+        self.complete = False
+        self._crc = CRC16_INIT
+        self._checksum = []
+
+    @property
+    def remaining(self):
+        """Number of bytes still required to complete the header or, once the header is known, the frame"""
+        if self.frame_length is None:
+            return self.HEADER_LENGTH - self.received
+        return self.frame_length - self.received
+
+    def feed(self, data, start=0, end=None):
+        """Process data[start:end], raising HeatmiserResponseError as soon as the frame is known to be bad"""
+        if end is None:
+            end = len(data)
+
+        if self.frame_length is None: #store and check header
+            headerend = min(end, start + self.remaining)
+            self.header.extend(data[start:headerend])
+            if len(self.header) == self.HEADER_LENGTH:
+                self._check_header()
+
+        if self.frame_length is None:
+            crcend = end
+        else:
+            if self.received + end - start > self.frame_length:
+                raise HeatmiserResponseError("Response longer than header length: %s"%self.frame_length)
+            crcend = max(start, min(end, start + self.frame_length - CRC_LENGTH - self.received))
+        self._crc = crc16_update(self._crc, data, start, crcend)
+        self._checksum.extend(data[crcend:end])
+        self.received += end - start
+
+        if self.received == self.frame_length:
+            self.complete = True
+            if self._checksum != [self._crc & BYTEMASK, self._crc >> 8]:
+                raise HeatmiserResponseErrorCRC("CRC is incorrect")
+
+    def _check_header(self):
+        """Checks header and records the frame length"""
+        header = self.header
+        _check_response_frame_addresses(self.source, self.destination, header)
+        _check_response_frame_function(self.expected_function, header)
+        frame_len = (header[FR_LEN_HIGH] << 8) | header[FR_LEN_LOW]
+        _check_response_header_length(frame_len, header[FR_FUNC_CODE], self.expected_length)
+        self.frame_length = frame_len
+
+class FrameDecoder(object):
+    """Scans a byte stream for valid frames, resynchronising after corrupt or unexpected bytes
+
+    A frame is accepted when its header is plausible (addresses in range, known function and
+    possible length) and its CRC matches, otherwise one byte is discarded and the scan restarts.
+    Set requests True to also accept master to slave frames, e.g. when decoding a bus capture."""
+
+    def __init__(self, source=None, destination=None, requests=False, max_frame_length=RECEIVE_BUFFER_LENGTH):
+        self.source = source
+        self.destination = destination
+        self.requests = requests
+        self.max_frame_length = max_frame_length
+        self.frames = 0
+        self.discarded = 0
+        self._buffer = bytearray()
+
+    @property
+    def pending(self):
+        """Number of bytes held waiting for the rest of a possible frame"""
+        return len(self._buffer)
+
+    def feed(self, data):
+        """Adds data to the stream, returns list of complete frames found"""
+        self._buffer.extend(data)
+        return self._scan(False)
+
+    def flush(self):
+        """Ends the stream, returns any frames found in held bytes and discards the rest"""
+        return self._scan(True)
+
+    def _scan(self, final):
+        """Removes frames and bad bytes from the buffer, stopping at a possible incomplete frame unless final"""
+        buf = self._buffer
+        frames = []
+        pos = 0
+        while len(buf) - pos >= MIN_FRAME_RESP_LENGTH or (final and pos < len(buf)):
+            frame_len = self._frame_length(buf, pos)
+            if frame_len is not None and pos + frame_len > len(buf):
+                if not final:
+                    break #wait for the rest of the frame
+                frame_len = None
+            if frame_len is not None:
+                crc = crc16_update(CRC16_INIT, buf, pos, pos + frame_len - CRC_LENGTH)
+                if buf[pos + frame_len - 2] == crc & BYTEMASK and buf[pos + frame_len - 1] == crc >> 8:
+                    frames.append(buf[pos:pos + frame_len])
+                    pos += frame_len
+                    continue
+            pos += 1
+            self.discarded += 1
+        del buf[:pos]
+        self.frames += len(frames)
+        return frames
+
+    def _frame_length(self, buf, pos):
+        """Returns frame length if a plausible header starts at pos, otherwise None"""
+        if len(buf) - pos < MIN_FRAME_RESP_LENGTH:
+            return None
+        func = buf[pos + FR_FUNC_CODE]
+        if (MASTER_ADDR_MIN <= buf[pos + FR_DEST_ADDR] <= MASTER_ADDR_MAX and
+                SLAVE_ADDR_MIN <= buf[pos + FR_SOURCE_ADDR] <= SLAVE_ADDR_MAX and
+                (self.destination is None or buf[pos + FR_DEST_ADDR] == self.destination) and
+                (self.source is None or buf[pos + FR_SOURCE_ADDR] == self.source)):
+            frame_len = (buf[pos + FR_LEN_HIGH] << 8) | buf[pos + FR_LEN_LOW]
+            if func == FUNC_WRITE and frame_len == FRAME_WRITE_RESP_LENGTH:
+                return frame_len
+            if func == FUNC_READ and MIN_FRAME_READ_RESP_LENGTH <= frame_len <= self.max_frame_length:
+                return frame_len
+        if self.requests:
+            func = buf[pos + FS_FUNC_CODE]
+            dest = buf[pos + FS_DEST_ADDR]
+            if ((SLAVE_ADDR_MIN <= dest <= SLAVE_ADDR_MAX or dest == BROADCAST_ADDR) and
+                    MASTER_ADDR_MIN <= buf[pos + FS_SOURCE_ADDR] <= MASTER_ADDR_MAX):
+                frame_len = buf[pos + FS_LEN]
+                if func == FUNC_READ and frame_len == MIN_FRAME_SEND_LENGTH:
+                    return frame_len
+                if func == FUNC_WRITE and MIN_FRAME_SEND_LENGTH < frame_len <= MIN_FRAME_SEND_LENGTH + MAX_PAYLOAD_SEND_LENGTH:
+                    return frame_len
+        return None
+
 # Believe this is known as CCITT (0xFFFF)
+# Byte wise table driven version of the crc16 class below, used for all framing.
+CRC16_INIT = 0xffff
+CRC16_POLY = 0x1021
+
+def _build_crc16_table():
+    """Builds the 256 entry lookup table for the CCITT polynomial"""
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ CRC16_POLY) & 0xffff
+            else:
+                crc = (crc << 1) & 0xffff
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _build_crc16_table()
+
+def crc16_update(crc, message, start=0, end=None):
+    """Updates a running CRC with message[start:end], returns new CRC as integer
+
+    message can be a list of integers, bytearray or bytes."""
+    if isinstance(message, str):
+        message = bytearray(message)
+    if end is None:
+        end = len(message)
+    table = CRC16_TABLE
+    for index in xrange(start, end):
+        crc = ((crc << 8) & 0xffff) ^ table[(crc >> 8) ^ message[index]]
+    return crc
+
+def crc16_bytes(message):
+    """Calculates a CRC, returns [low, high] matching crc16.run"""
+    crc = crc16_update(CRC16_INIT, message)
+    return [crc & BYTEMASK, crc >> 8]
+
 # This is the CRC function converted directly from the Heatmiser C code
-# provided in their API
+# provided in their API. Kept as reference for crc16_bytes.
 class crc16:
     """Computes CRC for Heatmiser Message"""
     LookupHigh = [
@@ -0,0 +1,54 @@
+"""Index of when fields expire, so stale fields and the next expiry are found
+without checking every field"""
+import heapq
+
+class ExpiryIndex(object):
+    """Heap of (expiry time, field id) with lazy removal
+
+    expiry(fieldid) returns the current expiry of a field. push is called whenever
+    it changes, and entries that no longer match are dropped when reached."""
+    def __init__(self, expiry, fieldids=()):
+        self._expiry = expiry
+        self._fieldids = set(fieldids)
+        self._heap = []
+        self._compact()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, fieldid, expiry):
+        """Record a new expiry for fieldid"""
+        self._fieldids.add(fieldid)
+        heapq.heappush(self._heap, (expiry, fieldid))
+        if len(self._heap) > 4 * len(self._fieldids) + 16:
+            self._compact()
+
+    def _compact(self):
+        """Rebuild heap with one current entry for each field"""
+        self._heap = [(self._expiry(fieldid), fieldid) for fieldid in self._fieldids]
+        heapq.heapify(self._heap)
+
+    def _is_current(self, entry):
+        """Returns true if the heap entry matches the field's current expiry"""
+        return entry[0] == self._expiry(entry[1])
+
+    def next_expiry(self):
+        """Returns the earliest expiry, None if there are no fields"""
+        heap = self._heap
+        while heap and not self._is_current(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def stale(self, now):
+        """Returns sorted list of field ids expired at now"""
+        heap = self._heap
+        current = []
+        stale = set()
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if entry[1] not in stale and self._is_current(entry):
+                stale.add(entry[1])
+                current.append(entry)
+        for entry in current:
+            heapq.heappush(heap, entry)
+        return sorted(stale)
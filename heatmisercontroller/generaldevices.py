@@ -10,7 +10,7 @@ import logging
 from genericdevice import HeatmiserDevice
 from devices_prt_hw import ThermoStatHotWaterDay
 from fields import HeatmiserFieldUnknown, HeatmiserFieldSingleReadOnly
-from decorators import ListWrapperClass, run_function_on_all
+from decorators import ListWrapperClass, run_function_on_all, run_each
 from hm_constants import DEFAULT_PROTOCOL, DEFAULT_PROG_MODE, BROADCAST_ADDR
 from hm_constants import MAX_AGE_LONG
 from .logging_setup import csvlist
@@ -18,6 +18,11 @@ from .logging_setup import csvlist
 class ThermoStatUnknown(HeatmiserDevice):
     """Device class for unknown thermostats operating unknown programmode"""
 
+    def _load_settings(self, settings, generalsettings):
+        """Loading settings, without prefetch as only the requested fields are known to exist"""
+        super(ThermoStatUnknown, self)._load_settings(settings, generalsettings)
+        self.set_prefetch_fraction = 0
+
     def _configure_fields(self):
         """build dict to map field name to index, map fields tables to properties and set dcb addresses."""
         super(ThermoStatUnknown, self)._configure_fields()
@@ -44,8 +49,9 @@ class HeatmiserBroadcastDevice(ThermoStatHotWaterDay):
     #List wrapper used to provide arguement to dectorator
     _controllerlist = ListWrapperClass()
 
-    def __init__(self, network, long_name, controllerlist=None):
+    def __init__(self, network, long_name, controllerlist=None, fan_out=run_each):
         self._controllerlist.list = controllerlist
+        self._controllerlist.fan_out = fan_out #HeatmiserNetwork runs each bus concurrently
         settings = {
             'address':BROADCAST_ADDR,
             'display_order': 0,
@@ -7,42 +7,60 @@ Ian Horsley 2018
 import logging
 import time
 import copy
+import threading
 import serial
 
-from fields import HeatmiserFieldSingleReadOnly, HeatmiserFieldDoubleReadOnly
+from fields import HeatmiserFieldSingleReadOnly, HeatmiserFieldDoubleReadOnly, UNREAD
 from hm_constants import DEFAULT_PROTOCOL, SLAVE_ADDR_MIN, SLAVE_ADDR_MAX
 from hm_constants import MAX_AGE_LONG
 from hm_constants import FIELD_NAME_LENGTH
+from hm_constants import FIELDRANGES
+from hm_constants import PLAN_CACHE_LENGTH, PLAN_CACHE_TOLERANCE
+from decorators import device_locked
 from .exceptions import HeatmiserResponseError
+from .read_calibration import default_read_time
+from .read_planner import plan_reads, widen_blocks
+from .schema import get_schema
+from .preparedread import PreparedRead
+from .transactions import BusRequest, Return, run_sync, run_async
 from .logging_setup import csvlist
 
 class HeatmiserDevice(object):
     """General device class"""
+    _eager_fields = () #fields with extra processing in _procfield, always decoded when received
 
     ## Initialisation functions and low level functions
     def __init__(self, adaptor, devicesettings, generalsettings=None):
         self._adaptor = adaptor
+        self._lock = threading.RLock() #held by public reads and writes, so threads can share the device
 
         # initalise variables
         self.dcb_length = None #set after building fields
         self.floorlimiting = None
         self.lastwritetime = None
         self.lastreadtime = None
+        self.fields_decoded = 0 #count of fields decoded from received bytes
+        self.fields_skipped = 0 #count of fields received unchanged, so not decoded again
+        self.fields_prefetched = 0 #count of fields due soon read early with other fields
+        self.reads_saved = 0 #count of reads widened by prefetch, each saving a later read
         # initalise variables that may be overriden by settings
         self.set_protocol = DEFAULT_PROTOCOL #
         self.set_expected_prog_mode = None
         self.set_long_name = 'Unknown'
+        self.set_decode_mode = 'eager' #lazy to decode fields on first access
+        self.set_prefetch_fraction = 0 #prefetch fields with less than this fraction of max_age left, 0 for off, as in hmcontroller.spec
+        self.set_prefetch_budget = 0.05 #most extra read time in seconds spent on prefetch per read_fields
         self._load_settings(devicesettings, generalsettings) #take all settings and make them attributes
 
         # initialise external parameters
-        self._buildfields() # add fields to self.fields and insome cases add schdulers (extended regularly)
-        self._configure_fields() #build fieldname to number dictionary and attached fields to attributes add dcb address to fields and add set dcb_length  (extended in unknown to change length)
-        # estimated read time for read_all method
-        self.fullreadtime = self._estimate_read_time(self.dcb_length)
+        self._build_schedules() #add schedulers and thermostat (extended regularly)
+        self._configure_fields() #copy fields from the class schema and attach fields to attributes, set dcb_length  (extended in unknown to change length)
         
         self._set_expected_field_values() #set some fields expected values (extended in week)
         self._connect_observers() #connect various observers methods (extended regularly)
-        self.rawdata = [None] * self.dcb_length
+        self.rawdata = bytearray(self.dcb_length)
+        self._plancache = {} #sorted tuple of field ids: (blocks,) from _plan_reads
+        self._plancoefficients = None #read time fit the cached plans were made with
     
     def _load_settings(self, settings, generalsettings):
         """Loading settings from dictionary into properties"""
@@ -54,7 +72,7 @@ class HeatmiserDevice(object):
             setattr(self, "set_" + name, value)
 
     def _buildfields(self):
-        """build list of fields"""
+        """build list of prototype fields, only called once per class when compiling the schema"""
         self.fields = [
             HeatmiserFieldDoubleReadOnly('DCBlen', 0, [], MAX_AGE_LONG),
             HeatmiserFieldSingleReadOnly('vendor', 2, [0, 1], MAX_AGE_LONG, {'heatmiser': 0, 'OEM': 1}),
@@ -63,6 +81,10 @@ class HeatmiserDevice(object):
             HeatmiserFieldSingleReadOnly('address', 11, [SLAVE_ADDR_MIN, SLAVE_ADDR_MAX], MAX_AGE_LONG),
         ]
     
+    def _build_schedules(self):
+        """called to create schedulers and other objects fed by fields"""
+        pass
+
     def _set_expected_field_values(self):
         """set the expected values for fields that should be fixed"""
         self.address.expectedvalue = self.set_address
@@ -80,24 +102,54 @@ class HeatmiserDevice(object):
         return self._csvlist_field_names_from(fields)
         
     def _configure_fields(self):
-        """build dict to map field name to index, map fields tables to properties and set dcb addresses."""
-        self.fields.sort(key=lambda field: field.address)
-        
-        dcbaddress = 0
-        self.fieldsbyname = {}
-        self._fieldnametonum = {}
-        for key, field in enumerate(self.fields):
-            #set dcbaddress
-            field.dcbaddress = dcbaddress
-            dcbaddress += field.fieldlength
-            #add field to key lookup
-            self._fieldnametonum[field.name] = key
+        """copy fields from the class schema, which holds the field order, name to index dict and dcb addresses, and map fields to properties.
+        field values, data and read times are kept in arrays in self._fieldstate, indexed by field id."""
+        schema = self._schema = get_schema(type(self))
+        self._fieldstate = schema.new_store()
+        self._fieldstate.decoder = self._decode_pending
+        self.fields = schema.new_fields(self._fieldstate)
+        self._rawvalid = bytearray(len(self.fields)) #1 if field value is decoded, or pending, from its bytes in rawdata
+        self._fieldnametonum = schema.nametonum #shared, don't modify
+        self.fieldsbyname = dict(zip(schema.names, self.fields))
+        for field in self.fields:
             #store field pointer as property
             setattr(self, field.name, field)
-            #store field pointer in dictionary
-            self.fieldsbyname[field.name] = field
         #record maximum dcb length
-        self.dcb_length = dcbaddress
+        self.dcb_length = schema.dcb_length
+        self._fieldsegments = schema.get_segments((getattr(self, 'set_expected_model', None), self.set_expected_prog_mode), self._get_field_segments)
+
+    def _get_readable_ranges(self):
+        """returns list of [first, last] unique addresses the device serves contiguously
+        from FIELDRANGES for the expected model and program mode. Empty if the table
+        doesn't cover every field, for example if the device isn't the expected model."""
+        modelranges = FIELDRANGES.get(getattr(self, 'set_expected_model', None), {})
+        ranges = []
+        for firstname, lastname in modelranges.get(self.set_expected_prog_mode, []):
+            if firstname not in self.fieldsbyname or lastname not in self.fieldsbyname:
+                return []
+            lastfield = self.fieldsbyname[lastname]
+            ranges.append([self.fieldsbyname[firstname].address, lastfield.address + lastfield.fieldlength - 1])
+        for field in self.fields:
+            if not any(first <= field.address and field.address + field.fieldlength - 1 <= last for first, last in ranges):
+                return []
+        return ranges
+
+    def _get_field_segments(self):
+        """returns segment key for each field, fields in different segments can't be read together
+        fields in the same readable range share a segment, so reads can bridge gaps inside a range,
+        otherwise a new segment starts at every address gap"""
+        ranges = self._get_readable_ranges()
+        if ranges:
+            return [[first <= field.address <= last for first, last in ranges].index(True) for field in self.fields]
+        segments = []
+        segment = 0
+        previousfield = None
+        for field in self.fields:
+            if previousfield is not None and field.address != previousfield.address + previousfield.fieldlength:
+                segment += 1
+            segments.append(segment)
+            previousfield = field
+        return segments
     
     def _connect_observers(self):
         """called to connect obersers to fields"""
@@ -109,10 +161,19 @@ class HeatmiserDevice(object):
         """Return subset of raw data"""
         return self.rawdata[getattr(self, startfieldname).dcbaddress:getattr(self, endfieldname).last_dcb_byte_address()]
     
+    @device_locked
     def read_all(self):
         """Returns all the rawdata having got it from the device"""
+        return run_sync(self._adaptor, self._read_all_transaction())
+
+    def read_all_async(self):
+        """read_all on an AsyncHeatmiserAdaptor, returns a BusFuture for the rawdata"""
+        return run_async(self._adaptor, self._read_all_transaction())
+
+    def _read_all_transaction(self):
+        """Transaction for read_all"""
         try:
-            self.rawdata = self._adaptor.read_all_from_device(self.set_address, self.set_protocol, self.dcb_length)
+            rawdata = yield BusRequest('read_all_from_device', self.set_address, self.set_protocol, self.dcb_length)
         except serial.SerialException as err:
             logging.warn("C%i Read all failed, Serial Port error %s"%(self.set_address, str(err)))
             raise
@@ -120,13 +181,14 @@ class HeatmiserDevice(object):
         logging.info("C%i Read all"%(self.set_address))
 
         self.lastreadtime = time.time()
-        self._procpayload(self.rawdata)
-        return self.rawdata
+        self._procpayload(rawdata)
+        raise Return(self.rawdata)
 
     def read_field(self, fieldname, maxage=None):
         """Returns a fields value, gets from the device if to old"""
         return self.read_fields([fieldname], maxage)[0]
     
+    @device_locked
     def read_fields(self, fieldnames, maxage=None):
         """Returns a list of field values, gets from the device if any are to old"""
         #only get field from network if
@@ -135,14 +197,78 @@ class HeatmiserDevice(object):
         # maxage >=0, older than maxage
         # maxage = 0, always
         
-        fieldids = [self._fieldnametonum[fieldname] for fieldname in fieldnames if hasattr(self, fieldname) and (maxage == 0 or not getattr(self, fieldname).check_data_fresh(maxage))]
-        fieldids = list(set(fieldids)) #remove duplicates, ordering doesn't matter
-
+        fieldids = self._stale_fieldids(fieldnames, maxage)
         if len(fieldids) > 0:
             self._get_fields(fieldids)
 
-        return [self.fieldsbyname[fieldname].get_value() if hasattr(self, fieldname) else None for fieldname in fieldnames]
+        return self._field_values(fieldnames)
+
+    def read_fields_async(self, fieldnames, maxage=None):
+        """read_fields on an AsyncHeatmiserAdaptor, returns a BusFuture for the values
+
+        Transactions on one device must not overlap, wait for the future before starting another."""
+        return run_async(self._adaptor, self._read_fields_transaction(fieldnames, maxage))
+
+    def _read_fields_transaction(self, fieldnames, maxage):
+        """Transaction for read_fields"""
+        fieldids = self._stale_fieldids(fieldnames, maxage)
+        if len(fieldids) > 0:
+            yield self._fields_transaction(fieldids)
+        raise Return(self._field_values(fieldnames))
+
+    def _stale_fieldids(self, fieldnames, maxage):
+        """Returns set of ids of fieldnames that must be read, maxage as for read_fields"""
+        now = time.time()
+        fieldids = set()
+        for fieldname in fieldnames:
+            fieldid = self._fieldnametonum.get(fieldname)
+            if fieldid is not None and self._is_stale(fieldid, maxage, now):
+                fieldids.add(fieldid)
+        return fieldids
+
+    def _field_values(self, fieldnames):
+        """Returns list of values of fieldnames, None for names that aren't fields"""
+        return [self.fieldsbyname[fieldname].get_value() if fieldname in self.fieldsbyname else None for fieldname in fieldnames]
+
+    def prepare(self, fieldnames):
+        """Returns a PreparedRead for fieldnames, its read(maxage) is read_fields without repeating the lookups"""
+        return PreparedRead(self, fieldnames)
+
+    @device_locked
+    def get_fields(self, fieldnames):
+        """gets fields from device whatever their age, without decoding values"""
+        self._get_fields(set(self._fieldnametonum[fieldname] for fieldname in fieldnames))
+
+    def _is_stale(self, fieldid, maxage, now):
+        """Returns true if field must be read from the device, maxage as for read_fields"""
+        state = self._fieldstate
+        readtime = state.readtime(fieldid)
+        if maxage == 0 or readtime == UNREAD:
+            return True
+        elif maxage == -1:
+            return False
+        elif maxage is None:
+            return state.expiry(fieldid) < now
+        return readtime + maxage < now
+
+    def stale_fields(self, now=None):
+        """Returns names of fields older than their max_age"""
+        if now is None:
+            now = time.time()
+        return [self.fields[fieldid].name for fieldid in self._fieldstate.expiries.stale(now)]
+
+    def next_expiry(self, fieldnames=None):
+        """Returns the time the next field, of fieldnames if given, becomes older than its max_age
+
+        None if no field has a max_age. UNREAD fields expire at -inf."""
+        state = self._fieldstate
+        if fieldnames is None:
+            return state.expiries.next_expiry()
+        expiries = [state.expiry(self._fieldnametonum[fieldname]) for fieldname in fieldnames
+                    if fieldname in self._fieldnametonum and state.maxages[self._fieldnametonum[fieldname]] is not None]
+        return min(expiries) if expiries else None
     
+    @device_locked
     def get_field_range(self, firstfieldname, lastfieldname=None):
         """gets fieldrange from device
         safe for blocks crossing gaps in dcb"""
@@ -152,36 +278,66 @@ class HeatmiserDevice(object):
         firstfieldid = self._fieldnametonum[firstfieldname]
         lastfieldid = self._fieldnametonum[lastfieldname]
             
-        blockstoread = self._get_field_blocks_from_id_range(firstfieldid, lastfieldid)
+        blockstoread = self._plan_reads(range(firstfieldid, lastfieldid + 1))
         fieldstring = firstfieldname.ljust(FIELD_NAME_LENGTH) + " " + lastfieldname.ljust(FIELD_NAME_LENGTH)
         self._get_field_blocks(blockstoread, fieldstring)
     
     def _get_fields(self, fieldids):
         """gets fields from device
         safe for blocks crossing gaps in dcb"""
-        blockstoread = self._get_field_blocks_from_id_list(fieldids)
-        self._get_field_blocks(blockstoread, self._csvlist_field_names_from_ids(fieldids))
+        run_sync(self._adaptor, self._fields_transaction(fieldids))
+
+    def _fields_transaction(self, fieldids):
+        """Transaction for _get_fields"""
+        fieldids = tuple(sorted(fieldids))
+        blockstoread = self._cached_plan(fieldids)
+        if blockstoread is not None and self.set_prefetch_fraction > 0:
+            self._prefetch(blockstoread)
+        yield self._field_blocks_transaction(blockstoread, self._csvlist_field_names_from_ids(fieldids))
+
+    def _prefetch(self, blocks):
+        """Widen planned blocks over fields with less than prefetch_fraction of their max_age left"""
+        state = self._fieldstate
+        now = time.time()
+        def due(fieldid):
+            """true if field expires soon"""
+            maxage = state.maxages[fieldid]
+            return maxage is not None and state.expiry(fieldid) - now < self.set_prefetch_fraction * maxage
+        spans = [[self._fieldnametonum[first.name], self._fieldnametonum[last.name]] for first, last, _ in blocks]
+        planned = [list(span) for span in spans]
+        added = widen_blocks(spans, self.fields, self._fieldsegments, due, self._estimate_read_time, self.set_prefetch_budget)
+        if not added:
+            return
+        self.fields_prefetched += len(added)
+        self.reads_saved += sum(1 for span, plan in zip(spans, planned) if span != plan)
+        for block, (first, last) in zip(blocks, spans):
+            block[:] = [self.fields[first], self.fields[last], self.fields[last].address + self.fields[last].fieldlength - self.fields[first].address]
+        logging.debug("C%i Prefetching %s"%(self.set_address, self._csvlist_field_names_from_ids(added)))
     
     def _get_field_blocks(self, blockstoread, fieldstring):
-        """gets field blocks from device
-        NOT safe for dcb gaps"""
-        #blockstoread list of [field, field, blocklength in bytes]
-        estimatedreadtime = self._estimate_blocks_read_time(blockstoread)
+        """gets field blocks from device, or reads all if blockstoread is None
+        blocks may include address gaps, the filler bytes are discarded"""
+        run_sync(self._adaptor, self._field_blocks_transaction(blockstoread, fieldstring))
 
-        if estimatedreadtime < self.fullreadtime - 0.02: #if to close to full read time, then read all
+    def _field_blocks_transaction(self, blockstoread, fieldstring):
+        """Transaction for _get_field_blocks"""
+        #blockstoread list of [field, field, blocklength in bytes]
+        if blockstoread is not None:
             try:
                 for firstfield, lastfield, blocklength in blockstoread:
                     logging.debug("C%i Reading ui %i to %i len %i, proc %s to %s"%(self.set_address, firstfield.address, lastfield.address, blocklength, firstfield.name, lastfield.name))
-                    rawdata = self._adaptor.read_from_device(self.set_address, self.set_protocol, firstfield.address, blocklength)
+                    rawdata = yield BusRequest('read_from_device', self.set_address, self.set_protocol, firstfield.address, blocklength)
                     self.lastreadtime = time.time()
+                    if blocklength != lastfield.last_dcb_byte_address() - firstfield.dcbaddress + 1:
+                        rawdata = self._strip_gaps(rawdata, firstfield, lastfield)
                     self._procpartpayload(rawdata, firstfield.name, lastfield.name)
             except serial.SerialException as err:
                 logging.warn("C%i Read failed of fields %s, Serial Port error %s"%(self.set_address, fieldstring, str(err)))
                 raise
             logging.info("C%i Read fields %s, in %i blocks"%(self.set_address, fieldstring, len(blockstoread)))
         else:
-            logging.debug("C%i Read fields %s by read_all, %0.3f %0.3f"%(self.set_address, fieldstring, estimatedreadtime, self.fullreadtime))
-            self.read_all()
+            logging.debug("C%i Read fields %s by read_all, %0.3f"%(self.set_address, fieldstring, self.fullreadtime))
+            yield self._read_all_transaction()
               
         #data can only be requested from the controller in contiguous blocks
         #functions takes a first and last field and separates out the individual blocks available for the controller type
@@ -203,41 +359,81 @@ class HeatmiserDevice(object):
 
         return blocks
     
-    def _get_field_blocks_from_id_list(self, fieldids):
-        """Takes range of fieldids and returns field blocks
-        Splits by invalid fields. Uses timing to determine the optimum blocking"""
-        #find blocks between lowest and highest field
-        fullfieldblock = self._get_field_blocks_from_id_range(min(fieldids), max(fieldids))
-        readblocks = []
-        for firstfield, lastfield, _ in fullfieldblock:
-            #find fields in that block
-            inblock = [fieldid for fieldid in fieldids if self._fieldnametonum[firstfield.name] <= fieldid <= self._fieldnametonum[lastfield.name]]
-            if len(inblock) > 0:
-                #if single read is shorter than individual
-                readlen = self.fields[max(inblock)].last_dcb_byte_address() - self.fields[min(inblock)].dcbaddress + 1
-                if self._estimate_read_time(readlen) < sum([self._estimate_read_time(self.fields[fieldid].fieldlength) for fieldid in inblock]):
-                    readblocks.append([self.fields[min(inblock)], self.fields[max(inblock)], readlen])
-                else:
-                    for ids in inblock:
-                        readblocks.append([self.fields[ids], self.fields[ids], self.fields[ids].fieldlength])
-        return readblocks
-    
-    def _estimate_blocks_read_time(self, blocks):
-        """estimates read time for a set of blocks, including the COM_BUS_RESET_TIME between blocks
-        excludes the COM_BUS_RESET_TIME before first block"""
-        readtimes = [self._estimate_read_time(x[2]) for x in blocks]
-        return sum(readtimes) + self._adaptor.min_time_between_reads() * (len(blocks) - 1)
+    def _plan_reads(self, fieldids):
+        """Takes fieldids and returns the quickest field blocks to read them, None if read_all is quicker"""
+        fieldids = sorted(fieldids) #fields are sorted by address
+        fields = [self.fields[fieldid] for fieldid in fieldids]
+        segments = [self._fieldsegments[fieldid] for fieldid in fieldids]
+        blocks, _ = plan_reads(fields, segments, self._estimate_read_time, self._adaptor.min_time_between_reads(), self.fullreadtime)
+        return blocks
     
-    @staticmethod
-    def _estimate_read_time(length):
+    def _cached_plan(self, fieldids):
+        """Returns a copy of _plan_reads(fieldids) from the plan cache, fieldids a sorted tuple
+
+        The cache is emptied when full, or when the read time fit for the device has moved
+        by more than PLAN_CACHE_TOLERANCE since the cached plans were made."""
+        coefficients = self._read_coefficients()
+        if self._plancoefficients is None or any(abs(new - old) > PLAN_CACHE_TOLERANCE * abs(old) for new, old in zip(coefficients, self._plancoefficients)):
+            self._plancache.clear()
+            self._plancoefficients = coefficients
+        plan = self._plancache.get(fieldids)
+        if plan is None:
+            if len(self._plancache) >= PLAN_CACHE_LENGTH:
+                self._plancache.clear()
+            plan = self._plancache[fieldids] = (self._plan_reads(fieldids),)
+        return None if plan[0] is None else [list(block) for block in plan[0]]
+
+    def _read_coefficients(self):
+        """Returns (intercept, slope, time between reads) the read plans depend on"""
+        if self._adaptor is None:
+            return default_read_time(0), default_read_time(1) - default_read_time(0), 0.0
+        return self._adaptor.read_calibration.coefficients(self.set_address) + (self._adaptor.min_time_between_reads(),)
+
+    @property
+    def fullreadtime(self):
+        """estimated read time for read_all method"""
+        return self._estimate_read_time(self.dcb_length)
+
+    def _estimate_read_time(self, length):
         """"estimates the read time for a call to read_from_device without COM_BUS_RESET_TIME
-        based on empirical measurements of one prt_hw_model and 5 prt_e_model"""
-        return length * 0.002075 + 0.070727
+        using the adaptor's calibration for this device, default model if there is no adaptor"""
+        if self._adaptor is None:
+            return default_read_time(length)
+        return self._adaptor.read_calibration.estimate(self.set_address, length)
+
+    def _needs_decode(self, field):
+        """Returns true if field must be decoded when received, even in lazy mode
+        because observers must be notified, a value checked or there is extra processing"""
+        return field.has_observers() or getattr(field, 'expectedvalue', None) is not None or field.name in self._eager_fields
+
+    def _decode_pending(self, fieldid):
+        """Decode field bytes received in lazy mode, called on first access to the field"""
+        readtime = self._fieldstate.pending[fieldid]
+        self._fieldstate.clear_pending(fieldid)
+        field = self.fields[fieldid]
+        dcbadd = field.dcbaddress
+        self.fields_decoded += 1
+        try:
+            field.update_data(self.rawdata[dcbadd:dcbadd+field.fieldlength], readtime)
+        except HeatmiserResponseError as err:
+            self._rawvalid[fieldid] = 0
+            logging.warn("C%i Field %s process failed due to %s"%(self.set_address, field.name, str(err)))
 
-    def _procfield(self, data, fieldinfo):
-        """Process data for a single field storing in relevant."""
+    def _procfield(self, data, fieldinfo, value=None):
+        """Process data for a single field storing in relevant. value if already decoded from data."""
         #logging.debug("Processing %s data %s"%(fieldinfo.name, csvlist(data)))
-        fieldinfo.update_data(data, self.lastreadtime)
+        if value is None:
+            fieldinfo.update_data(data, self.lastreadtime)
+        else:
+            fieldinfo.update_decoded(data, value, self.lastreadtime)
+
+    def _strip_gaps(self, rawdata, firstfield, lastfield):
+        """Returns the field bytes from a read of firstfield to lastfield, without filler bytes from address gaps"""
+        payload = bytearray()
+        for field in self.fields[self._fieldnametonum[firstfield.name]:self._fieldnametonum[lastfield.name] + 1]:
+            offset = field.address - firstfield.address
+            payload.extend(rawdata[offset:offset + field.fieldlength])
+        return payload
 
     def _procpartpayload(self, rawdata, firstfieldname, lastfieldname):
         """Wraps procpayload by converting fieldnames to fieldids"""
@@ -248,27 +444,65 @@ class HeatmiserDevice(object):
         lastfieldid = self._fieldnametonum[lastfieldname]
         self._procpayload(rawdata, firstfieldid, lastfieldid)
         
-    def _procpayload(self, rawdata, firstfieldid=0, lastfieldid=False):
-        """Split payload with field information and processes each field"""
-        logging.debug("C%i Processing Payload from field %i to %i"%(self.set_address, firstfieldid, lastfieldid))
-        if not lastfieldid:
-            lastfieldid = len(self.fields)
+    def _procpayload(self, rawdata, firstfieldid=0, lastfieldid=None):
+        """Split payload with field information and processes each field
+
+        rawdata can be a list, bytearray or memoryview, it is copied once into self.rawdata
+        and the fields decoded together by the schema codec. Fields whose bytes match those their value came from are not decoded again,
+        only their read time is set to self.lastreadtime.
+        In lazy decode mode fields are only marked as received at self.lastreadtime,
+        and decoded on first access, unless _needs_decode. Fields not wholly within rawdata are left alone."""
+        logging.debug("C%i Processing Payload from field %i to %s"%(self.set_address, firstfieldid, lastfieldid))
+        if lastfieldid is None:
+            lastfieldid = len(self.fields) - 1
         
         fullfirstdcbadd = self.fields[firstfieldid].dcbaddress
+        while lastfieldid >= firstfieldid and self.fields[lastfieldid].dcbaddress + self.fields[lastfieldid].fieldlength > fullfirstdcbadd + len(rawdata):
+            lastfieldid -= 1 #bytes not received are never decoded or marked fresh
+        previousdata = self.rawdata[fullfirstdcbadd:fullfirstdcbadd+len(rawdata)]
+        try:
+            self.rawdata[fullfirstdcbadd:fullfirstdcbadd+len(rawdata)] = rawdata
+        except ValueError as err:
+            logging.warn("C%i Payload not valid bytes, %s"%(self.set_address, str(err)))
+            return
         
-        for field in self.fields[firstfieldid:lastfieldid + 1]:
-            length = field.fieldlength
-            dcbadd = field.dcbaddress - fullfirstdcbadd #adjust for the start of the request
-            
+        state = self._fieldstate
+        readtime = self.lastreadtime
+        lazy = self.set_decode_mode == 'lazy' and readtime is not None
+        todecode = []
+        for fieldid, field in enumerate(self.fields[firstfieldid:lastfieldid + 1], firstfieldid):
+            dcbadd = field.dcbaddress
+            if self._rawvalid[fieldid] and readtime is not None and previousdata[dcbadd-fullfirstdcbadd:dcbadd-fullfirstdcbadd+field.fieldlength] == self.rawdata[dcbadd:dcbadd+field.fieldlength]:
+                if state.pending[fieldid] != UNREAD:
+                    state.pending[fieldid] = readtime
+                else:
+                    state.readtimes[fieldid] = readtime
+                state.touch(fieldid)
+                self.fields_skipped += 1
+                continue
+            self._rawvalid[fieldid] = 1
+            if lazy and not self._needs_decode(field):
+                state.pending[fieldid] = readtime
+                state.touch(fieldid)
+                continue
+            todecode.append(fieldid)
+        if not todecode:
+            return
+
+        values = self._schema.get_codec(firstfieldid, lastfieldid).decode(self.rawdata, fullfirstdcbadd, [fieldid - firstfieldid for fieldid in todecode])
+        self.fields_decoded += len(todecode)
+        for fieldid, value in zip(todecode, values):
+            field = self.fields[fieldid]
+            dcbadd = field.dcbaddress
             try:
-                self._procfield(rawdata[dcbadd:dcbadd+length], field)
+                self._procfield(self.rawdata[dcbadd:dcbadd+field.fieldlength], field, value)
             except HeatmiserResponseError as err:
+                self._rawvalid[fieldid] = 0
                 logging.warn("C%i Field %s process failed due to %s"%(self.set_address, field.name, str(err)))
-
-        self.rawdata[fullfirstdcbadd:fullfirstdcbadd+len(rawdata)] = rawdata
     
     ## Basic set field functions
     
+    @device_locked
     def set_field(self, fieldname, values):
         """Set a field (single member of fields) on a device to a state or values. Defined for all known field lengths."""
         #values must not be list for field length 1 or 2
@@ -278,7 +512,7 @@ class HeatmiserDevice(object):
         
         field.is_writable()
         field.check_values(numericvalues)
-        payloadbytes = field.format_data_from_value(numericvalues)
+        payloadbytes = self._schema.get_codec(fieldid, fieldid).encode([numericvalues])
         
         printvalues = numericvalues if isinstance(numericvalues, list) else [numericvalues] #adjust for logging
             
@@ -290,19 +524,28 @@ class HeatmiserDevice(object):
         logging.info("C%i set field %s to %s"%(self.set_address, fieldname.ljust(FIELD_NAME_LENGTH), csvlist(printvalues)))
         
         self.lastwritetime = time.time()
+        self._rawvalid[fieldid] = 0 #rawdata no longer matches value
         field.update_value(numericvalues, self.lastwritetime)
     
+    @device_locked
     def set_fields(self, fieldnames, values):
         """Set multiple fields on a device to a state or payload."""
         #It groups adjacent fields and issues multiple sets if required.
         #inputs must be matching length lists
-        
+        run_sync(self._adaptor, self._set_fields_transaction(fieldnames, values))
+
+    def set_fields_async(self, fieldnames, values):
+        """set_fields on an AsyncHeatmiserAdaptor, returns a BusFuture completing once all are written"""
+        return run_async(self._adaptor, self._set_fields_transaction(fieldnames, values))
+
+    def _set_fields_transaction(self, fieldnames, values):
+        """Transaction for set_fields"""
         fields = [getattr(self, fieldname) for fieldname in fieldnames if hasattr(self, fieldname)]#Get fields
         outputdata = self._get_payload_blocks_from_list(fields, values)
         try:
             for fields, lengthbytes, payloadbytes, writtenvalues in outputdata:
                 logging.debug("C%i Setting ui %i len %i, proc %s to %s"%(self.set_address, fields[0].address, lengthbytes, fields[0].name, fields[-1].name))
-                self._adaptor.write_to_device(self.set_address, self.set_protocol, fields[0].address, lengthbytes, payloadbytes)
+                yield BusRequest('write_to_device', self.set_address, self.set_protocol, fields[0].address, lengthbytes, payloadbytes)
                 self.lastwritetime = time.time()
                 self._update_fields_values(writtenvalues, fields)
         except serial.SerialException as err:
@@ -313,11 +556,11 @@ class HeatmiserDevice(object):
     def _update_fields_values(self, values, fields):
         """update the field values once data successfully written"""
         for field, value in zip(fields, values):
+            self._rawvalid[self._fieldnametonum[field.name]] = 0 #rawdata no longer matches value
             field.update_value(value, self.lastwritetime)
     
-    @staticmethod
-    def _get_payload_blocks_from_list(fields, values):
-        """Converts list of fields and values into groups of payload data"""
+    def _get_payload_blocks_from_list(self, fields, values):
+        """Converts list of fields and values into groups of payload data, encoded by the schema codec"""
         #returns fields, lengthbytes, payloadbytes, values
         sortedfields = sorted(enumerate(fields), key=lambda fielde: fielde[1].address)
         
@@ -334,12 +577,14 @@ class HeatmiserDevice(object):
             if len(outputdata) > 0 and field.dcbaddress - previousfield.last_dcb_byte_address() == 1: #if follows previous field ##Shouldn't this be based on unique address?
                 outputdata[-1][0].append(field)
                 outputdata[-1][1] += field.fieldlength
-                outputdata[-1][2].extend(field.format_data_from_value(valuescopy[orginalindex]))
                 outputdata[-1][3].append(valuescopy[orginalindex])
 
             else:
-                outputdata.append([[field], field.fieldlength, field.format_data_from_value(valuescopy[orginalindex]), [valuescopy[orginalindex]]])
+                outputdata.append([[field], field.fieldlength, None, [valuescopy[orginalindex]]])
             previousfield = field
+        for block in outputdata:
+            codec = self._schema.get_codec(self._fieldnametonum[block[0][0].name], self._fieldnametonum[block[0][-1].name])
+            block[2] = codec.encode(block[3])
         return outputdata
 
 DEVICETYPES = {
@@ -32,6 +32,12 @@ CRC_LENGTH = 2
 FUNC_READ = 0
 FUNC_WRITE = 1
 
+# Define methods of receiving response frames
+RECEIVE_MODE_TIMEOUT = 'timeout' # read expected length and wait for timeout if shorter
+RECEIVE_MODE_STREAM = 'stream' # read bytes as they arrive, checking as they are received
+RECEIVE_MODE_HEADER = 'header' # read header and then exact remaining length
+DEFAULT_RECEIVE_MODE = RECEIVE_MODE_HEADER
+
 BROADCAST_ADDR = 0xff
 RW_LENGTH_ALL = 0xffff
 DCB_START = 0x00
@@ -61,6 +67,17 @@ MAX_AGE_USHORT = 11
 
 FIELD_NAME_LENGTH = 13
 MAX_UNIQUE_ADDRESS = 298
+RECEIVE_BUFFER_LENGTH = MIN_FRAME_READ_RESP_LENGTH + MAX_UNIQUE_ADDRESS + 1 # largest model DCB plus framing
+READ_FRAME_CACHE_LENGTH = 128 # read requests remembered by each adaptor
+READ_TIME_INTERCEPT = 0.070727 # default read time model, seconds
+READ_TIME_SLOPE = 0.002075 # seconds per byte read
+PLAN_CACHE_LENGTH = 64 # read plans remembered by each device
+PLAN_CACHE_TOLERANCE = 0.05 # plans are made again once the read time fit moves by this fraction
+
+BUS_PRIORITY_WRITE = 0 # bus executor queue priorities, lowest first
+BUS_PRIORITY_INTERACTIVE = 1
+BUS_PRIORITY_BACKGROUND = 2
+DEFAULT_BUS = 'serial' # name of the bus configured by the [serial] section
 
 CURRENT_TIME_DAY = 0
 CURRENT_TIME_HOUR = 1
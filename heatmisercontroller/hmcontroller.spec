@@ -7,8 +7,15 @@
   write_max_retries = integer()
   read_max_retries = integer()
   my_master_addr = integer()
+  receive_mode = option('timeout', 'stream', 'header', default='header') #how to listen for responses
+  adaptive_timeouts = boolean(default = False) #learn response timeouts for each device, stream and header modes only
+  adaptive_timeout_quantile = float(0, 1, default = 0.95) #fraction of recent responses the learned timeout covers
+  adaptive_timeout_margin = float(1, 10, default = 1.5) #multiplier on the learned response times
+  adaptive_timeout_max_factor = float(1, 10, default = 3) #learned timeouts limited to this times the configured ones
+  read_calibration_file = string(default = '') #json file of fitted read times for each bus, written by hm_calibrate_read_times.py
 
 [ serial ]
+  transport = option('serial', 'tcp', 'rfc2217', 'loop', default='serial') #tcp and rfc2217 reach an Ethernet serial server, port is then host:port
   baudrate = integer()
 	timeout = integer(0, 32)
 	write_timeout = integer(0, 32)
@@ -19,16 +26,50 @@
 	COM_MIN_TIMEOUT = float(default=0.1) # min remaining time after first byte read
 	COM_SEND_MIN_TIME = float(default=1)  #minimum time between sending commands to a device (broadcast only??)
 	COM_BUS_RESET_TIME = float(default=0.1)
+	keepalive_idle = integer(1, 7200, default=10) #tcp, seconds idle before keepalive probes
+	keepalive_interval = integer(1, 600, default=5) #tcp, seconds between keepalive probes
+	keepalive_count = integer(1, 20, default=3) #tcp, unanswered probes before the connection is dropped
+	reconnect_backoff = float(0, 60, default=0.5) #tcp, wait after a failed connect, doubling for each further failure
+	reconnect_backoff_max = float(0, 3600, default=30)
+	pool_size = integer(1, 4, default=2) #tcp, sockets at once, so a reconnect overlaps the old socket draining
+
+[ buses ] #further buses, each with its own port, the [serial] settings are used for any not set
+  [[ __many__ ]]
+    port = string()
+    transport = option('serial', 'tcp', 'rfc2217', 'loop', default=None)
+    baudrate = integer(default=None)
+    timeout = integer(0, 32, default=None)
+    write_timeout = integer(0, 32, default=None)
+    COM_TIMEOUT = float(default=None)
+    COM_START_TIMEOUT = float(default=None)
+    COM_MIN_TIMEOUT = float(default=None)
+    COM_SEND_MIN_TIME = float(default=None)
+    COM_BUS_RESET_TIME = float(default=None)
+    keepalive_idle = integer(1, 7200, default=None)
+    keepalive_interval = integer(1, 600, default=None)
+    keepalive_count = integer(1, 20, default=None)
+    reconnect_backoff = float(0, 60, default=None)
+    reconnect_backoff_max = float(0, 3600, default=None)
+    pool_size = integer(1, 4, default=None)
 
 [ devicesgeneral ]
   autocorrectime = boolean(default = True)
   max_age_variables = integer(default = 60) #variables like holidaymins, etc.
   max_age_time = integer(default = 86400) #time tends to drift very slowly, so it shouldn't need checking very often
   max_age_temp = integer(default = 10) #temperature is something that might be sampled very regularly
+  decode_mode = option('eager', 'lazy', default='eager') #lazy only decodes fields without observers when they are used
+  prefetch_fraction = float(0, 1, default = 0) #widen reads over fields with less than this fraction of max_age left, off by default, 0.25 suits polling
+  prefetch_budget = float(0, 10, default = 0.05) #most extra read time in seconds spent prefetching per read
+
+[ scheduler ]
+  duty_cycle = float(0.01, 1, default = 0.5) #fraction of time the poll scheduler may use the bus
+  batch_window = float(0, 3600, default = 2) #fields due to go stale within this many seconds are read together
+  retry_interval = float(0, 86400, default = 60) #seconds before retrying a device or field that failed
   
 [ devices ]
   [[ __many__ ]]
     address = integer(0, 32)
+    bus = string(default=serial) #name of a bus in [buses], or serial for the [serial] port
     display_order = integer(0, 32, default=32)
     long_name = string(max=25, default=)
     protocol = integer(default=3)
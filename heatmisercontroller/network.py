@@ -6,18 +6,26 @@ Ian Horsley 2018
 """
 
 import os
+import time
 import logging
+from collections import OrderedDict
 
 # Import our own stuff
 from genericdevice import DEVICETYPES
 from generaldevices import HeatmiserBroadcastDevice, ThermoStatUnknown
 from adaptor import HeatmiserAdaptor
-from hm_constants import SLAVE_ADDR_MIN, SLAVE_ADDR_MAX
-from .exceptions import HeatmiserResponseError
+from bus import HeatmiserBus, BroadcastAdaptor, run_on_buses
+from decorators import run_each
+from hm_constants import SLAVE_ADDR_MIN, SLAVE_ADDR_MAX, DEFAULT_BUS
+from .transactions import Return, run_sync, run_async
+from .exceptions import HeatmiserResponseError, HeatmiserControllerSetupInitError
 import setup as hms
 
 class HeatmiserNetwork(object):
-    """Class that connects a set of devices (from configuration) and an adpator."""
+    """Class that connects a set of devices (from configuration) and an adpator for each bus.
+
+    The [serial] section configures the default bus, [buses] any others. With more than one
+    bus each runs on its own bus thread, and network wide reads and writes run on the buses concurrently."""
     ### stat list setup
 
     def __init__(self, configfile=None):
@@ -35,12 +43,17 @@ class HeatmiserNetwork(object):
             logging.error(err)
             raise
         
-        # Initialize and connect to heatmiser network, probably through serial port
-        self.adaptor = HeatmiserAdaptor(self._setup)
+        # Initialize and connect to heatmiser network, probably through serial port, with an adaptor for each bus
+        self.buses = OrderedDict()
+        self.buses[DEFAULT_BUS] = HeatmiserBus(DEFAULT_BUS, HeatmiserAdaptor(self._setup))
+        for busname in settings['buses']:
+            if busname == DEFAULT_BUS:
+                raise HeatmiserControllerSetupInitError("Bus name %s is used by the [serial] section"%busname)
+            self.buses[busname] = HeatmiserBus(busname, HeatmiserAdaptor(hms.HeatmiserControllerBusSetup(self._setup, busname)))
+        self.scheduler_settings = dict(settings['scheduler'])
         
         # Load device list from settings or find devices if none listed
         self.controllers = []
-        self._addresses_in_use = []
         if 'devices' in settings:
             if len(settings['devices']):
                 self._set_stat_list(settings['devices'], settings['devicesgeneral'])
@@ -48,8 +61,25 @@ class HeatmiserNetwork(object):
             self.find_devices()
         
         # Create a broadcast device
-        setattr(self, "All", HeatmiserBroadcastDevice(self.adaptor, "Broadcast to All", self.controllers))
+        setattr(self, "All", HeatmiserBroadcastDevice(self.adaptor, "Broadcast to All", self.controllers, self._fan_out))
         self._current = self.All
+
+        if len(self.buses) > 1:
+            self.start_bus_executor()
+
+    @property
+    def adaptor(self):
+        """Adaptor for the default bus"""
+        return self.buses[DEFAULT_BUS].adaptor
+
+    @adaptor.setter
+    def adaptor(self, adaptor):
+        self.buses[DEFAULT_BUS].adaptor = adaptor
+
+    @property
+    def executor(self):
+        """BusExecutor of the default bus, None if transactions aren't run on a bus thread"""
+        return self.buses[DEFAULT_BUS].executor
       
     def _set_stat_list(self, statlist, generalsettings):
         """Store list of devives and create objects for each"""
@@ -66,39 +96,118 @@ class HeatmiserNetwork(object):
         self._current = self.controllers[0]
     
     def add_device(self, name, controllersettings, generalsettings=None):
-        """Add device to network"""
+        """Add device to network, on the bus named in its settings"""
+        busname = controllersettings.get('bus', DEFAULT_BUS)
+        if busname not in self.buses:
+            raise HeatmiserControllerSetupInitError("Device %s is on bus %s, which isn't configured"%(name, busname))
+        bus = self.buses[busname]
+        if controllersettings['address'] in bus.addresses:
+            logging.warn("C%i address used twice on bus %s"%(controllersettings['address'], busname))
         expected_model = controllersettings['expected_model']
         expected_prog_mode = controllersettings['expected_prog_mode']
-        new_device = DEVICETYPES[expected_model][expected_prog_mode](self.adaptor, controllersettings, generalsettings)
+        new_device = DEVICETYPES[expected_model][expected_prog_mode](bus.device_adaptor, controllersettings, generalsettings)
         setattr(self, name, new_device)
         setattr(new_device, 'name', name) #make name avaliable when accessing by id
-        self._addresses_in_use.append(controllersettings['address'])
+        setattr(new_device, 'busname', busname)
+        bus.addresses.append(controllersettings['address'])
         return new_device
     
     def find_devices(self, max_address=SLAVE_ADDR_MAX):
-        """Find devices on the network not in the configuration file"""
-        unused_addresses = [address for address in range(SLAVE_ADDR_MIN, max_address + 1) if address not in self._addresses_in_use]
+        """Find devices on the network not in the configuration file, returns list of new devices
+
+        The buses are searched concurrently, see run_on_buses."""
+        buses = self.buses.values()
+        outcomes = run_on_buses(lambda bus: run_sync(bus.device_adaptor, self._probe_transaction(bus, max_address)), buses)
+        found = []
+        for bus, (probed, excinfo) in zip(buses, outcomes):
+            if excinfo is not None:
+                raise excinfo[0], excinfo[1], excinfo[2]
+            found.extend(self._add_found_device(bus, controllersettings) for controllersettings in probed)
+        return found
+
+    def find_devices_async(self, max_address=SLAVE_ADDR_MAX, busname=DEFAULT_BUS):
+        """find_devices on a bus with an AsyncHeatmiserAdaptor, returns a BusFuture for the list of new devices"""
+        bus = self.buses[busname]
+        return run_async(bus.adaptor, self._find_devices_transaction(bus, max_address))
+
+    def _find_devices_transaction(self, bus, max_address):
+        """Transaction for find_devices on one bus"""
+        probed = yield self._probe_transaction(bus, max_address)
+        raise Return([self._add_found_device(bus, controllersettings) for controllersettings in probed])
+
+    def _probe_transaction(self, bus, max_address):
+        """Transaction reading the model of each unused address on bus, returns list of settings for devices found"""
+        found = []
+        unused_addresses = [address for address in range(SLAVE_ADDR_MIN, max_address + 1) if address not in bus.addresses]
         for address in unused_addresses:
             try:
                 controllersettings = {'address': address}
-                test_device = ThermoStatUnknown(self.adaptor, controllersettings, self._setup.settings['devicesgeneral'])
+                test_device = ThermoStatUnknown(bus.device_adaptor, controllersettings, self._setup.settings['devicesgeneral'])
                 # use fields from device rather to set the expected mode and type
-                test_device.read_fields(['model', 'programmode'], 0)
+                yield test_device._read_fields_transaction(['model', 'programmode'], 0)
             except HeatmiserResponseError as err:
                 logging.info("C%i device not found, library error %s"%(address, err))
             else:
                 model = test_device.model.read_value_text()
                 prog_mode = test_device.programmode.read_value_text()
-                logging.info("C%i device %s found, with program %s"%(address, model, prog_mode))
-                controllersettings = {
+                logging.info("C%i device %s found on bus %s, with program %s"%(address, model, bus.name, prog_mode))
+                found.append({
                     'address': address,
+                    'bus': bus.name,
                     'expected_model': model,
                     'expected_prog_mode': prog_mode
-                }
-                new_device = self.add_device("C%i"%address, controllersettings, self._setup.settings['devicesgeneral'])
-                self.controllers.append(new_device)
-                self._addresses_in_use.append(address)
+                })
+        raise Return(found)
+
+    def _add_found_device(self, bus, controllersettings):
+        """Add a device found on bus, named by its address and, off the default bus, the bus name"""
+        name = "C%i"%controllersettings['address'] if bus.name == DEFAULT_BUS else "%s_C%i"%(bus.name, controllersettings['address'])
+        new_device = self.add_device(name, controllersettings, self._setup.settings['devicesgeneral'])
+        self.controllers.append(new_device)
+        return new_device
     
+    @property
+    def device_adaptor(self):
+        """Adaptor for devices on the default bus to use, queuing on the bus executor when it is running"""
+        return self.buses[DEFAULT_BUS].device_adaptor
+
+    def start_bus_executor(self):
+        """Run all transactions on a thread for each bus, so several threads can share the network.
+
+        Returns the BusExecutor of the default bus."""
+        for bus in self.buses.values():
+            bus.start_executor()
+        self._set_device_adaptors()
+        return self.executor
+
+    def stop_bus_executor(self):
+        """Stop the bus threads, after queued transactions, and return to calling the adaptors directly"""
+        for bus in self.buses.values():
+            bus.stop_executor()
+        self._set_device_adaptors()
+
+    def _set_device_adaptors(self):
+        """Point all devices at their bus's device_adaptor, and broadcasts at every bus"""
+        for device in self.controllers:
+            device._adaptor = self.buses[device.busname].device_adaptor
+        self.All._adaptor = self.device_adaptor if len(self.buses) < 2 else BroadcastAdaptor(self.buses.values())
+
+    def _fan_out(self, function, devices):
+        """Run function(device) for each of devices, the buses concurrently and the devices on a bus in turn
+
+        Returns list of (result, excinfo) in the order of devices, excinfo None where it succeeded."""
+        groups = OrderedDict()
+        for index, device in enumerate(devices):
+            groups.setdefault(getattr(device, 'busname', DEFAULT_BUS), []).append(index)
+        if len(groups) < 2:
+            return run_each(function, devices)
+        buses = [self.buses[busname] for busname in groups]
+        outcomes = [None] * len(devices)
+        for indexes, (busoutcomes, excinfo) in zip(groups.values(), run_on_buses(lambda bus: run_each(function, [devices[index] for index in groups[bus.name]]), buses)):
+            for index, outcome in zip(indexes, busoutcomes if excinfo is None else [(None, excinfo)] * len(indexes)):
+                outcomes[index] = outcome
+        return outcomes
+
     def get_stat_address(self, shortname):
         """Get network address from device name."""
         if isinstance(shortname, basestring):
@@ -119,8 +228,24 @@ class HeatmiserNetwork(object):
         return getattr(self, name)
 
     def run_method_on_all(self, method, *args, **kwargs):
-        """Run a method on all devices"""
+        """Run a method on all devices, concurrently across buses
+
+        Raises the first error, once all devices have run."""
         results = []
-        for obj in self.controllers:
-            results.append(getattr(obj, method)(*args, **kwargs))
+        for result, excinfo in self._fan_out(lambda obj: getattr(obj, method)(*args, **kwargs), self.controllers):
+            if excinfo is not None:
+                raise excinfo[0], excinfo[1], excinfo[2]
+            results.append(result)
         return results
+
+    def next_expiry(self, fieldnames=None):
+        """Returns the time the next field on any device, of fieldnames if given, becomes to old, None if none can"""
+        expiries = [device.next_expiry(fieldnames) for device in self.controllers] #no bus access, so run here
+        expiries = [expiry for expiry in expiries if expiry is not None]
+        return min(expiries) if expiries else None
+
+    def stale_fields(self, now=None):
+        """Returns list of (device, stale field names) for devices with stale fields"""
+        if now is None:
+            now = time.time()
+        return [(device, names) for device, names in [(device, device.stale_fields(now)) for device in self.controllers] if names]
@@ -40,15 +40,63 @@ class Observable(object):
 
 class Notifier(object):
     """Object that notfies observers when value changes.
-    Either triggers on is/is not or on any change."""
+    Either triggers on is/is not or on any change.
+    Subclasses provide value. Notifiers are only created when the first observer is added."""
+    __slots__ = ('_notifiers',)
+
     def __init__(self):
-        self.value = None
-        self.nots_is = {}
-        self.nots_is_not = self.GeneralNotifier(self)
-        self.nots_changed = self.GeneralNotifier(self)
-        self.previousvalue = None
-        self.notify_value_change = lambda _: True # no action, unless observers added
-    
+        self._notifiers = None
+
+    class Notifiers(object):
+        """Notifiers and previous value for one Notifier"""
+        __slots__ = ('nots_is', 'nots_is_not', 'nots_changed', 'previousvalue', 'notify')
+
+        def __init__(self, outer):
+            self.nots_is = {}
+            self.nots_is_not = outer.GeneralNotifier(outer)
+            self.nots_changed = outer.GeneralNotifier(outer)
+            self.previousvalue = None
+            self.notify = None
+
+    def _create_notifiers(self):
+        """Create notifiers if not already created."""
+        if self._notifiers is None:
+            self._notifiers = self.Notifiers(self)
+        return self._notifiers
+
+    @property
+    def nots_is(self):
+        """Notifiers for value is, by value"""
+        return self._create_notifiers().nots_is
+
+    @property
+    def nots_is_not(self):
+        """Notifier for value is not"""
+        return self._create_notifiers().nots_is_not
+
+    @property
+    def nots_changed(self):
+        """Notifier for any change"""
+        return self._create_notifiers().nots_changed
+
+    @property
+    def previousvalue(self):
+        """Value when observers were last notified"""
+        return None if self._notifiers is None else self._notifiers.previousvalue
+
+    @previousvalue.setter
+    def previousvalue(self, value):
+        self._create_notifiers().previousvalue = value
+
+    def has_observers(self):
+        """Returns true if observers will be notified of value changes."""
+        return self._notifiers is not None and self._notifiers.notify is not None
+
+    def notify_value_change(self, value):
+        """Notifies observers, no action unless observers added."""
+        if self._notifiers is not None and self._notifiers.notify is not None:
+            self._notifiers.notify(value)
+
     def notify_value_change_is(self, value):
         """Nofifies observers if value is, otherwise notifies other observers."""
         if value in self.nots_is:
@@ -77,13 +125,13 @@ class Notifier(object):
     def add_notifable_is(self, value, method):
         """Add notifable for value is."""
         self.nots_is.setdefault(value, self.GeneralNotifier(self)).add_observer(method)
-        self.notify_value_change = self.notify_value_change_is
+        self._notifiers.notify = self.notify_value_change_is
     def delete_notifable_is(self, value, method):
         """Remove notifiable."""
         self.nots_is.get(value, self.GeneralNotifierCompare(self)).delete_observer(method)
     def add_notifable_is_not(self, method):
         """Add notifable for value is not."""
-        self.notify_value_change = self.notify_value_change_is
+        self._create_notifiers().notify = self.notify_value_change_is
         self.nots_is_not.add_observer(method)
     def delete_notifable_is_not(self, method):
         """Remove notifiable."""
@@ -91,7 +139,7 @@ class Notifier(object):
     def add_notifable_changed(self, method):
         """Add notifable for value changes."""
         self.nots_changed.add_observer(method)
-        self.notify_value_change = self.notify_value_change_changed
+        self._notifiers.notify = self.notify_value_change_changed
     def delete_notifable_changed(self, method):
         """Remove notifiable."""
         self.nots_changed.delete_observer(method)
@@ -0,0 +1,196 @@
+"""Polls the devices on a network keeping every field within its max_age
+
+The scheduler owns the bus while it runs, other reads and writes should not be made.
+Each pass reads, for every device, the fields due to go stale within batch_window
+of now in one planned read, so fields are read before they pass max_age. Devices are read in order of the shortest max_age
+due on them, so MAX_AGE_USHORT temperatures come before MAX_AGE_LONG settings.
+Bus use is limited to duty_cycle by resting after each read in proportion to its
+length. Devices set with prefetch_fraction widen reads over fields due soon, the
+summary reports the reads that saves."""
+import time
+import logging
+
+import serial
+
+from hm_constants import BUS_PRIORITY_BACKGROUND
+from .exceptions import HeatmiserResponseError
+
+class BusUsage(object):
+    """Time spent reading against elapsed time"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset counts and start time"""
+        self.start = time.time()
+        self.busy = 0.0
+        self.reads = 0
+        self.errors = 0
+
+    def record(self, seconds, error=False):
+        """Record a device read taking seconds"""
+        self.busy += seconds
+        self.reads += 1
+        if error:
+            self.errors += 1
+
+    def utilisation(self, now=None):
+        """Fraction of time since reset spent reading"""
+        elapsed = (time.time() if now is None else now) - self.start
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return "Bus %.1f%% busy, %i reads in %.0f s, %i errors"%(100 * self.utilisation(), self.reads, time.time() - self.start, self.errors)
+
+class FreshnessStats(object):
+    """Age of fields when refreshed against their max_age, grouped by max_age"""
+    def __init__(self):
+        self.groups = {} #max_age: [refreshes, late, sum of ages, worst age]
+
+    def reset(self):
+        """Forget recorded refreshes"""
+        self.groups = {}
+
+    def record(self, maxage, previousread, readtime):
+        """Record a field with maxage, last read at previousread, read again at readtime"""
+        group = self.groups.setdefault(maxage, [0, 0, 0.0, 0.0])
+        age = readtime - previousread
+        group[0] += 1
+        if age > maxage:
+            group[1] += 1
+        group[2] += age
+        group[3] = max(group[3], age)
+
+    def summary(self):
+        """Returns a line for each max_age of target, mean and worst age when refreshed"""
+        lines = []
+        for maxage in sorted(self.groups):
+            refreshes, late, sumages, worst = self.groups[maxage]
+            lines.append("max_age %6i s, %5i refreshes, mean age %8.1f s, worst %8.1f s, %5.1f%% late"%(maxage, refreshes, sumages / refreshes, worst, 100.0 * late / refreshes))
+        return lines
+
+class PollScheduler(object):
+    """Keeps the fields of every device on a network within their max_age"""
+    def __init__(self, network, duty_cycle=0.5, batch_window=2.0, retry_interval=60.0):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError("duty_cycle %s must be more than 0 and at most 1"%duty_cycle)
+        self.network = network
+        self.duty_cycle = duty_cycle
+        self.batch_window = batch_window
+        self.retry_interval = retry_interval
+        self.usage = BusUsage()
+        self.freshness = FreshnessStats()
+        self._nextread = 0.0 #earliest time the duty cycle allows the next read
+        self._deviceheld = {} #device: time to retry after a failed read
+        self._fieldheld = {} #(device, fieldname): time to retry after a field failed to process
+        self._savedstart = self._reads_saved()
+
+    def _reads_saved(self):
+        """Total reads saved by prefetch across devices"""
+        return sum(device.reads_saved for device in self.network.controllers)
+
+    def _held(self, key, held, now):
+        """Returns true if key is held from reading at now"""
+        until = held.get(key)
+        if until is None:
+            return False
+        elif until <= now:
+            del held[key]
+            return False
+        return True
+
+    def due_reads(self, now):
+        """Returns list of (shortest max_age, device, fieldnames) to read at now, most urgent first"""
+        reads = []
+        for device in self.network.controllers:
+            if self._held(device, self._deviceheld, now):
+                continue
+            names = [name for name in device.stale_fields(now + self.batch_window) if not self._held((device, name), self._fieldheld, now)]
+            if names:
+                reads.append((min(device.fieldsbyname[name].max_age for name in names), device, names))
+        reads.sort(key=lambda read: (read[0], read[1].next_expiry(read[2])))
+        return reads
+
+    def next_due(self, now):
+        """Returns the time the next read will be due, None if no field has a max_age"""
+        times = [until for until in self._deviceheld.values() + self._fieldheld.values() if until > now]
+        for device in self.network.controllers:
+            if self._held(device, self._deviceheld, now):
+                continue
+            held = set(name for helddevice, name in self._fieldheld.keys() if helddevice is device and self._held((device, name), self._fieldheld, now))
+            if held:
+                expiry = device.next_expiry([name for name in device.fieldsbyname if device.fieldsbyname[name].max_age is not None and name not in held])
+            else:
+                expiry = device.next_expiry()
+            if expiry is not None:
+                times.append(expiry - self.batch_window)
+        due = min(times) if times else None
+        return due if due is None else max(due, self._nextread)
+
+    @staticmethod
+    def _read_times(device):
+        """Returns list of (name, max_age, last read time) for fields with a max_age"""
+        return [(field.name, field.max_age, device.next_expiry([field.name]) - field.max_age) for field in device.fields if field.max_age is not None]
+
+    def _read(self, device, names):
+        """Read names from device, recording bus time and the freshness achieved by all fields read"""
+        previous = self._read_times(device)
+        start = time.time()
+        try:
+            device.get_fields(names)
+        except (HeatmiserResponseError, serial.SerialException) as err:
+            end = time.time()
+            self.usage.record(end - start, True)
+            self._deviceheld[device] = end + self.retry_interval
+            logging.warn("C%i Scheduled read failed, retry in %i s, %s"%(device.set_address, self.retry_interval, str(err)))
+        else:
+            end = time.time()
+            self.usage.record(end - start)
+            for (name, maxage, previousread), (_, _, readtime) in zip(previous, self._read_times(device)):
+                if readtime >= start:
+                    if previousread != float('-inf'):
+                        self.freshness.record(maxage, previousread, readtime)
+                elif name in names:
+                    self._fieldheld[(device, name)] = end + self.retry_interval
+                    logging.warn("C%i Scheduled read of %s not processed, retry in %i s"%(device.set_address, name, self.retry_interval))
+        self._nextread = end + (end - start) * (1 - self.duty_cycle) / self.duty_cycle
+
+    def poll(self):
+        """Make the reads due now, as far as the duty cycle allows
+
+        Returns the time of the next due read, None if there are no fields to keep fresh.
+        With the network's bus executors running, reads queue behind writes and interactive reads."""
+        for bus in getattr(self.network, 'buses', {}).values():
+            if bus.executor is not None:
+                bus.executor.set_thread_priority(BUS_PRIORITY_BACKGROUND)
+        for _, device, names in self.due_reads(time.time()):
+            if time.time() < self._nextread:
+                break
+            self._read(device, names)
+        return self.next_due(time.time())
+
+    def run(self, duration=None, idle=60.0):
+        """Poll until duration seconds have passed, or forever if None
+
+        Sleeps between passes until the next read is due, at most idle seconds."""
+        end = None if duration is None else time.time() + duration
+        while end is None or time.time() < end:
+            due = self.poll()
+            now = time.time()
+            wait = idle if due is None else min(idle, max(0.0, due - now))
+            if end is not None:
+                wait = min(wait, end - now)
+            if wait > 0:
+                time.sleep(wait)
+
+    def summary(self):
+        """Returns lines reporting bus use, freshness achieved against max_age and fields stale now"""
+        lines = [repr(self.usage)]
+        saved = self._reads_saved() - self._savedstart
+        elapsed = time.time() - self.usage.start
+        lines.append("Prefetch widened %i reads, %.0f a day"%(saved, saved * 86400.0 / elapsed if elapsed > 0 else 0))
+        lines.extend(self.freshness.summary())
+        stale = sum(len(names) for _, names in self.network.stale_fields())
+        total = sum(len([field for field in device.fields if field.max_age is not None]) for device in self.network.controllers)
+        lines.append("%i of %i fields stale now"%(stale, total))
+        return lines
@@ -0,0 +1,28 @@
+"""Field name lists compiled once for repeated reads from a device"""
+import time
+
+class PreparedRead(object):
+    """Handle from HeatmiserDevice.prepare, holding the field ids and fields for a list of names
+
+    read only checks freshness, reads stale fields using the device plan cache and collects values.
+    Names that aren't fields on the device read as None, as for read_fields."""
+    def __init__(self, device, fieldnames):
+        self.device = device
+        self.fieldnames = tuple(fieldnames)
+        self._fields = tuple(device.fieldsbyname.get(fieldname) for fieldname in self.fieldnames) #result template
+        self._fieldids = tuple(sorted(set(device._fieldnametonum[fieldname] for fieldname in self.fieldnames if fieldname in device.fieldsbyname)))
+        if self._fieldids:
+            device._cached_plan(self._fieldids) #plan the read of every field now
+
+    def __len__(self):
+        return len(self.fieldnames)
+
+    def read(self, maxage=None):
+        """Returns list of field values, getting those older than maxage from the device, maxage as for read_fields"""
+        device = self.device
+        with device._lock:
+            now = time.time()
+            fieldids = tuple(fieldid for fieldid in self._fieldids if device._is_stale(fieldid, maxage, now))
+            if fieldids:
+                device._get_fields(fieldids)
+            return [None if field is None else field.get_value() for field in self._fields]
@@ -0,0 +1,131 @@
+"""Fits the time taken by read_from_device against read length from observed reads
+
+Each adaptor keeps a fit for every device address and one across all its devices.
+Estimates use the device fit, then the adaptor fit, then the default model measured
+on one prt_hw_model and 5 prt_e_model. Addresses are only unique on a bus, so a
+calibration file holds the fits of each bus under its name."""
+import json
+import logging
+
+from hm_constants import READ_TIME_INTERCEPT, READ_TIME_SLOPE, DEFAULT_BUS
+
+def default_read_time(length):
+    """estimates the read time for a call to read_from_device without COM_BUS_RESET_TIME"""
+    return length * READ_TIME_SLOPE + READ_TIME_INTERCEPT
+
+class ReadTimeFit(object):
+    """Online least squares fit of read time = intercept + slope * length
+
+    Older samples are down weighted by decay on each new sample, so the fit follows
+    changes to the bus. With only one read length seen the slope can't be fitted, so
+    a fallback slope is used and only the intercept is fitted."""
+    def __init__(self, decay=0.995, min_samples=5):
+        self.decay = decay
+        self.min_samples = min_samples
+        self.samples = 0
+        self._sums = [0.0] * 5 #weight, x, y, xx, xy
+
+    def add(self, length, seconds):
+        """Add an observed read"""
+        self.samples += 1
+        for index, value in enumerate([1, length, seconds, length * length, length * seconds]):
+            self._sums[index] = self._sums[index] * self.decay + value
+
+    def coefficients(self, fallbackslope=READ_TIME_SLOPE):
+        """Returns fitted (intercept, slope) or None if there are to few samples"""
+        if self.samples < self.min_samples:
+            return None
+        weight, sumx, sumy, sumxx, sumxy = self._sums
+        meanx = sumx / weight
+        meany = sumy / weight
+        varx = sumxx / weight - meanx * meanx
+        slope = fallbackslope
+        if varx > 1: #lengths spread by more than a byte
+            fitted = (sumxy / weight - meanx * meany) / varx
+            if fitted > 0:
+                slope = fitted
+        return meany - slope * meanx, slope
+
+    def get_state(self):
+        """Returns state as a dict that can be stored as json"""
+        return {'samples': self.samples, 'sums': list(self._sums)}
+
+    def set_state(self, state):
+        """Restores state from get_state"""
+        self.samples = state['samples']
+        self._sums = list(state['sums'])
+
+class ReadTimeCalibration(object):
+    """Read time fits for one adaptor, for each device address and combined"""
+    def __init__(self, decay=0.995, min_samples=5):
+        self.decay = decay
+        self.min_samples = min_samples
+        self.combined = ReadTimeFit(decay, min_samples)
+        self.devices = {}
+
+    def record(self, address, length, seconds):
+        """Record an observed read of length bytes from address"""
+        self.combined.add(length, seconds)
+        if address not in self.devices:
+            self.devices[address] = ReadTimeFit(self.decay, self.min_samples)
+        self.devices[address].add(length, seconds)
+
+    def coefficients(self, address=None):
+        """Returns (intercept, slope) for address, falling back to the adaptor fit and then the default model"""
+        slope = READ_TIME_SLOPE
+        coefficients = self.combined.coefficients(slope)
+        if coefficients is not None:
+            slope = coefficients[1]
+        if address in self.devices:
+            devicecoefficients = self.devices[address].coefficients(slope)
+            if devicecoefficients is not None:
+                return devicecoefficients
+        if coefficients is not None:
+            return coefficients
+        return READ_TIME_INTERCEPT, READ_TIME_SLOPE
+
+    def estimate(self, address, length):
+        """estimates the read time for a call to read_from_device without COM_BUS_RESET_TIME"""
+        intercept, slope = self.coefficients(address)
+        return length * slope + intercept
+
+    def get_state(self):
+        """Returns all fits as a dict that can be stored as json"""
+        return {'combined': self.combined.get_state(),
+                'devices': dict((str(address), fit.get_state()) for address, fit in self.devices.iteritems())}
+
+    def set_state(self, state):
+        """Restores fits from get_state"""
+        self.combined.set_state(state['combined'])
+        self.devices = {}
+        for address, fitstate in state['devices'].iteritems():
+            self.devices[int(address)] = ReadTimeFit(self.decay, self.min_samples)
+            self.devices[int(address)].set_state(fitstate)
+
+    def save(self, filename, busname=DEFAULT_BUS):
+        """Write fits for busname to json file, keeping those saved for other buses"""
+        try:
+            buses = _read_buses(filename)
+        except (IOError, ValueError):
+            buses = {} #no file yet, or not fits
+        buses[busname] = self.get_state()
+        with open(filename, 'w') as fhandle:
+            json.dump(buses, fhandle, indent=1)
+
+    def load(self, filename, busname=DEFAULT_BUS):
+        """Read fits for busname from json file, keeping current fits if they can't be read"""
+        try:
+            self.set_state(_read_buses(filename)[busname])
+        except (IOError, ValueError, KeyError) as err:
+            logging.warning("Read time calibration for bus %s not loaded from %s, %s"%(busname, filename, str(err)))
+            return False
+        logging.info("Read time calibration for bus %s loaded from %s"%(busname, filename))
+        return True
+
+def _read_buses(filename):
+    """Returns dict of bus name: fits state from json file, a file from before buses is the default bus"""
+    with open(filename) as fhandle:
+        buses = json.load(fhandle)
+    if 'combined' in buses:
+        buses = {DEFAULT_BUS: buses}
+    return buses
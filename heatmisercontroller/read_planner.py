@@ -0,0 +1,87 @@
+"""Plans the minimum time set of reads to get a set of fields from a device
+
+Fields can only be read together if the device will return every address between them,
+so each field is given a segment key and a read can't span fields in different segments."""
+
+def plan_reads(fields, segments, readtime, betweentime, fullreadtime=None):
+    """Returns (blocks, estimated time) for reading fields
+
+    fields must be sorted by address with segments the matching list of segment keys.
+    readtime(length) estimates a single read, betweentime is the wait between reads.
+    blocks is a list of [firstfield, lastfield, length in bytes], or None if a single
+    read all, taking fullreadtime, is quicker.
+    Solved by dynamic programming over the fields, best[j] being the quickest way to
+    read the first j fields, each ending with a read of fields i to j - 1."""
+    count = len(fields)
+    best = [0.0] + [None] * count
+    start = [0] * (count + 1)
+    for j in range(1, count + 1):
+        last = fields[j - 1]
+        end = last.address + last.fieldlength
+        for i in range(j, 0, -1):
+            if segments[i - 1] != segments[j - 1]:
+                break
+            cost = best[i - 1] + betweentime + readtime(end - fields[i - 1].address)
+            if best[j] is None or cost < best[j]:
+                best[j] = cost
+                start[j] = i - 1
+    total = best[count] - betweentime if count > 0 else 0.0
+
+    if fullreadtime is not None and fullreadtime <= total:
+        return None, fullreadtime
+
+    blocks = []
+    j = count
+    while j > 0:
+        first = fields[start[j]]
+        last = fields[j - 1]
+        blocks.append([first, last, last.address + last.fieldlength - first.address])
+        j = start[j]
+    blocks.reverse()
+    return blocks, total
+
+def _span(fields, first, last):
+    """bytes read from fields first to last"""
+    return fields[last].address + fields[last].fieldlength - fields[first].address
+
+def _nearest_due(segments, due, start, stop, step):
+    """Returns index of the first due field from start to stop in steps, without leaving start's segment, else None"""
+    for index in range(start, stop + step, step):
+        if segments[index] != segments[start - step]:
+            return None
+        if due(index):
+            return index
+    return None
+
+def widen_blocks(blocks, fields, segments, due, readtime, budget):
+    """Widens planned reads over nearby fields that are due soon, returns indexes of due fields added
+
+    blocks is a list of [first index, last index] into fields, every field sorted by address
+    with segments their segment keys, and is changed in place. due(index) is true for fields
+    worth reading early. Blocks grow over the nearest due field on either side, taking in any
+    fields between, cheapest first while the extra read time across all blocks is within budget.
+    Blocks don't grow into their neighbours, plan_reads chose not to join them."""
+    added = []
+    for number, block in enumerate(blocks):
+        low = blocks[number - 1][1] + 1 if number > 0 else 0
+        high = blocks[number + 1][0] - 1 if number + 1 < len(blocks) else len(fields) - 1
+        while True:
+            blocktime = readtime(_span(fields, block[0], block[1]))
+            options = []
+            if block[0] > low:
+                index = _nearest_due(segments, due, block[0] - 1, low, -1)
+                if index is not None:
+                    options.append((readtime(_span(fields, index, block[1])) - blocktime, index, block[1]))
+            if block[1] < high:
+                index = _nearest_due(segments, due, block[1] + 1, high, 1)
+                if index is not None:
+                    options.append((readtime(_span(fields, block[0], index)) - blocktime, block[0], index))
+            if not options:
+                break
+            cost, first, last = min(options)
+            if cost > budget:
+                break
+            budget -= cost
+            added.extend(index for index in range(first, last + 1) if (index < block[0] or index > block[1]) and due(index))
+            block[0], block[1] = first, last
+    return added
@@ -0,0 +1,61 @@
+"""Field schema compiled once for each device class
+
+The field list, its address order, dcb addresses and read segments are the same
+for every device of a class, so they are built once and shared by reference.
+Devices only create copies of the prototype fields, with their values held in a
+FieldStore indexed by field id."""
+from fields import FieldStore
+from codec import BlockCodec
+
+class DeviceSchema(object):
+    """Field layout for a device class, built from the prototype fields of _buildfields
+
+    Treat as read only, it is shared by every device of the class."""
+    def __init__(self, fields):
+        fields = sorted(fields, key=lambda field: field.address)
+        dcbaddress = 0
+        for field in fields:
+            field.dcbaddress = dcbaddress
+            dcbaddress += field.fieldlength
+        self.fields = tuple(fields)
+        self.names = tuple(field.name for field in fields)
+        self.addresses = tuple(field.address for field in fields)
+        self.dcbaddresses = tuple(field.dcbaddress for field in fields)
+        self.lengths = tuple(field.fieldlength for field in fields)
+        self.nametonum = dict((name, key) for key, name in enumerate(self.names))
+        self.dcb_length = dcbaddress
+        self._segments = {}
+        self._codecs = {}
+
+    def new_store(self):
+        """returns an empty store for the fields of one device"""
+        return FieldStore(len(self.fields), [field.max_age for field in self.fields])
+
+    def new_fields(self, store):
+        """returns per device copies of the prototype fields, keeping their state in store"""
+        return [field.copy(store, index) for index, field in enumerate(self.fields)]
+
+    def get_codec(self, firstfieldid, lastfieldid):
+        """returns the codec for fields firstfieldid to lastfieldid, compiling it on first use"""
+        codec = self._codecs.get((firstfieldid, lastfieldid))
+        if codec is None:
+            codec = self._codecs[(firstfieldid, lastfieldid)] = BlockCodec(self.fields[firstfieldid:lastfieldid + 1])
+        return codec
+
+    def get_segments(self, key, build):
+        """returns the read segments for key, a (model, program mode) pair, calling build the first time"""
+        segments = self._segments.get(key)
+        if segments is None:
+            segments = self._segments[key] = tuple(build())
+        return segments
+
+_SCHEMAS = {}
+
+def get_schema(deviceclass):
+    """returns the schema for deviceclass, compiling it on first use"""
+    schema = _SCHEMAS.get(deviceclass)
+    if schema is None:
+        prototype = deviceclass.__new__(deviceclass)
+        prototype._buildfields()
+        schema = _SCHEMAS[deviceclass] = DeviceSchema(prototype.fields)
+    return schema
@@ -156,3 +156,11 @@ class HeatmiserControllerFileSetup(HeatmiserControllerSetup):
         except (ValueError, KeyError) as err:
             logging.warning("Configuration parse failed : " + str(err))
             raise
+
+class HeatmiserControllerBusSetup(HeatmiserControllerSetup):
+    """Settings for a named bus, the [serial] settings with those set for the bus in [buses] over them"""
+    def __init__(self, setup, busname):
+        super(HeatmiserControllerBusSetup, self).__init__()
+        serialsettings = dict(setup.settings['serial'])
+        serialsettings.update((name, value) for name, value in setup.settings['buses'][busname].iteritems() if value is not None)
+        self.settings = {'controller': dict(setup.settings['controller'], busname=busname), 'serial': serialsettings}
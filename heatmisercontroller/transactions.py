@@ -0,0 +1,96 @@
+"""Device transactions written once as generators, run blocking or on an AsyncHeatmiserAdaptor
+
+A transaction yields a BusRequest for each adaptor call and is sent the result, or has the
+exception thrown in. It may also yield another transaction, to run it and get its result.
+Python 2 generators can't return a value, so a transaction ends with raise Return(value).
+run_sync makes the adaptor calls directly, run_async queues them on an AsyncHeatmiserAdaptor
+and returns a BusFuture."""
+import sys
+
+from .busexecutor import BusFuture
+
+class BusRequest(object):
+    """Adaptor call yielded by a transaction"""
+    __slots__ = ('method', 'args')
+
+    def __init__(self, method, *args):
+        self.method = method
+        self.args = args
+
+class Return(Exception):
+    """Raised by a transaction to finish with value"""
+    def __init__(self, value=None):
+        super(Return, self).__init__()
+        self.value = value
+
+def _advance(stack, value, excinfo):
+    """Run the transactions on stack until one yields a BusRequest
+
+    Returns (request, None, None), or (None, value, excinfo) when the outermost finishes."""
+    while stack:
+        generator = stack[-1]
+        try:
+            if excinfo is None:
+                item = generator.send(value)
+            else:
+                item = generator.throw(*excinfo)
+        except Return as ret:
+            stack.pop()
+            value, excinfo = ret.value, None
+            continue
+        except StopIteration:
+            stack.pop()
+            value, excinfo = None, None
+            continue
+        except Exception: #pylint: disable=broad-except
+            stack.pop()
+            value, excinfo = None, sys.exc_info()
+            continue
+        value = excinfo = None
+        if isinstance(item, BusRequest):
+            return item, None, None
+        stack.append(item) #nested transaction, started by sending None
+    return None, value, excinfo
+
+def run_sync(adaptor, transaction):
+    """Run transaction calling adaptor directly, returns its value"""
+    stack = [transaction]
+    request, value, excinfo = _advance(stack, None, None)
+    while request is not None:
+        try:
+            value = getattr(adaptor, request.method)(*request.args)
+        except Exception: #pylint: disable=broad-except
+            value, excinfo = None, sys.exc_info()
+        request, value, excinfo = _advance(stack, value, excinfo)
+    if excinfo is not None:
+        raise excinfo[0], excinfo[1], excinfo[2]
+    return value
+
+class _AsyncRun(object):
+    """Runs a transaction on an AsyncHeatmiserAdaptor, resuming it as each request completes"""
+    def __init__(self, adaptor, transaction):
+        self.future = BusFuture()
+        self._adaptor = adaptor
+        self._stack = [transaction]
+
+    def step(self, value=None, excinfo=None):
+        """Advance until the next request is queued or the transaction finishes"""
+        request, value, excinfo = _advance(self._stack, value, excinfo)
+        if request is not None:
+            getattr(self._adaptor, request.method + '_async')(*request.args).add_done_callback(self._resume)
+        elif excinfo is not None:
+            self.future.set_exception(excinfo)
+        else:
+            self.future.set_result(value)
+
+    def _resume(self, future):
+        """Callback from a completed request"""
+        self.step(future._result, future._excinfo)
+
+def run_async(adaptor, transaction):
+    """Start transaction, queuing its requests on adaptor, returns a BusFuture for its value
+
+    Runs until its first request is queued, the rest runs as the adaptor processes the queue."""
+    run = _AsyncRun(adaptor, transaction)
+    run.step()
+    return run.future
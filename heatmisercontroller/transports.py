@@ -0,0 +1,225 @@
+"""Transports the adaptor can reach the RS485 bus through, chosen by transport in [serial]
+
+Each is a pyserial port, so the adaptor uses them all in the same way.
+serial - a local serial port, port is the device such as /dev/ttyUSB0
+tcp - raw TCP to an Ethernet serial server, port is host:port
+rfc2217 - an RFC2217 serial server, port is host:port
+loop - in memory loopback, for testing without hardware"""
+import time
+import errno
+import socket
+import select
+import logging
+import threading
+import array
+
+import serial
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError
+from serial.urlhandler import protocol_socket, protocol_loop, protocol_rfc2217
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+DEFAULT_TRANSPORT = 'serial'
+
+def _url_port(scheme):
+    """port property for url handler ports, taking host:port or a full url"""
+    def setport(self, port):
+        """add scheme if not given"""
+        if port is not None and '://' not in port:
+            port = scheme + port
+        SerialBase.port.fset(self, port)
+    return property(SerialBase.port.fget, setport)
+
+class LoopbackTransport(protocol_loop.Serial):
+    """In memory loopback, anything written is read back"""
+    port = _url_port('loop://')
+
+class RFC2217Transport(protocol_rfc2217.Serial):
+    """Serial server using RFC2217, port is host:port"""
+    port = _url_port('rfc2217://')
+
+class TcpTransport(protocol_socket.Serial):
+    """Raw TCP to an Ethernet serial server, port is host:port
+
+    Sockets use TCP keepalive, so a server gone away is noticed. close doesn't wait for the
+    server, the old socket drains in the background while a replacement connects, at most
+    pool_size sockets at once, so reopening after an error is quick. Failed connects back off
+    from reconnect_backoff, doubling up to reconnect_backoff_max."""
+    port = _url_port('socket://')
+    connect_timeout = 5.0
+    keepalive_idle = 10
+    keepalive_interval = 5
+    keepalive_count = 3
+    reconnect_backoff = 0.5
+    reconnect_backoff_max = 30.0
+    pool_size = 2
+    drain_timeout = 1.0
+
+    def __init__(self, *args, **kwargs):
+        self._pool = threading.Condition()
+        self._spare = None #connected socket ready for the next open
+        self._wantspare = False
+        self._connecting = False
+        self._draining = 0
+        self._failures = 0
+        self._retryat = 0.0
+        self.reconnects = 0 #opens using a socket connected in the background
+        super(TcpTransport, self).__init__(*args, **kwargs)
+
+    def open(self):
+        """Open port, taking the socket connected in the background if there is one"""
+        self.logger = None
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        sock = self._take_spare()
+        if sock is None:
+            sock = self._connect()
+        else:
+            self.reconnects += 1
+        self._socket = sock
+        self.is_open = True
+        self.reset_input_buffer()
+
+    def close(self):
+        """Close port without waiting, the socket drains in the background while a replacement connects"""
+        if self.is_open:
+            sock, self._socket = self._socket, None
+            self.is_open = False
+            with self._pool:
+                self._wantspare = True
+                if sock is not None:
+                    self._draining += 1
+            if sock is not None:
+                self._start(self._drain, sock)
+            self._start_spare()
+
+    def close_pool(self):
+        """Stop connecting replacements and close any spare socket, for when the port is finished with"""
+        with self._pool:
+            self._wantspare = False
+            sock, self._spare = self._spare, None
+        if sock is not None:
+            sock.close()
+
+    @property
+    def in_waiting(self):
+        """Bytes received and not read"""
+        if not self.is_open:
+            raise PortNotOpenError()
+        if fcntl is None:
+            return protocol_socket.Serial.in_waiting.fget(self)
+        count = array.array('i', [0])
+        fcntl.ioctl(self._socket.fileno(), termios.FIONREAD, count)
+        return count[0]
+
+    def _connect(self):
+        """Connect a new socket, raises SerialException on failure or while backing off"""
+        with self._pool:
+            wait = self._retryat - time.time()
+            if wait > 0:
+                raise SerialException("Could not open port %s: backing off %.1f s after %i failures"%(self.portstr, wait, self._failures))
+        address = self.from_url(self.portstr)
+        try:
+            sock = socket.create_connection(address, timeout=self.connect_timeout)
+        except socket.error as err:
+            with self._pool:
+                self._failures += 1
+                self._retryat = time.time() + min(self.reconnect_backoff_max, self.reconnect_backoff * 2 ** (self._failures - 1))
+            raise SerialException("Could not open port %s: %s"%(self.portstr, err))
+        with self._pool:
+            self._failures = 0
+            self._retryat = 0.0
+        self._configure_socket(sock)
+        return sock
+
+    def _configure_socket(self, sock):
+        """Set keepalive and no delay, and non blocking as reads select"""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in (('TCP_KEEPIDLE', self.keepalive_idle), ('TCP_KEEPINTVL', self.keepalive_interval), ('TCP_KEEPCNT', self.keepalive_count)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), int(value))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+
+    @staticmethod
+    def _start(function, *args):
+        """Run function on a daemon thread"""
+        thread = threading.Thread(target=function, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def _start_spare(self):
+        """Start connecting a replacement socket if one is wanted and the pool has room"""
+        with self._pool:
+            if not self._wantspare or self._spare is not None or self._connecting or self._draining >= self.pool_size:
+                return
+            self._connecting = True
+        self._start(self._connect_spare)
+
+    def _connect_spare(self):
+        """Background connect of a replacement socket"""
+        sock = None
+        try:
+            sock = self._connect()
+        except SerialException as err:
+            logging.warn("Gen background reconnect failed, %s"%str(err))
+        with self._pool:
+            self._connecting = False
+            if self._wantspare and sock is not None:
+                self._spare, sock = sock, None
+            self._pool.notify_all()
+        if sock is not None:
+            sock.close()
+
+    def _take_spare(self):
+        """Returns the spare socket if it is still connected, waiting for one connecting, else None"""
+        with self._pool:
+            deadline = time.time() + self.connect_timeout
+            while self._connecting and time.time() < deadline:
+                self._pool.wait(deadline - time.time())
+            self._wantspare = False
+            sock, self._spare = self._spare, None
+        if sock is not None and not self._connected(sock):
+            sock.close()
+            sock = None
+        return sock
+
+    @staticmethod
+    def _connected(sock):
+        """Returns false if the server has closed sock"""
+        try:
+            return sock.recv(1, socket.MSG_PEEK) != b''
+        except socket.error as err:
+            return err.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+    def _drain(self, sock):
+        """Stop sending on sock and read until the server closes it or drain_timeout, then close it"""
+        try:
+            sock.shutdown(socket.SHUT_WR)
+            deadline = time.time() + self.drain_timeout
+            while time.time() < deadline:
+                readable, _, _ = select.select([sock], [], [], deadline - time.time())
+                if not readable or not sock.recv(4096):
+                    break
+        except (socket.error, select.error):
+            pass
+        finally:
+            sock.close()
+            with self._pool:
+                self._draining -= 1
+        self._start_spare()
+
+TRANSPORTS = {'serial': serial.Serial, 'tcp': TcpTransport, 'rfc2217': RFC2217Transport, 'loop': LoopbackTransport}
+
+def create_transport(name):
+    """Returns an unopened port for transport name"""
+    try:
+        return TRANSPORTS[name]()
+    except KeyError:
+        raise ValueError("Unknown transport %s, expected one of %s"%(name, ', '.join(sorted(TRANSPORTS))))
@@ -30,7 +30,9 @@ setup(name='heatmisercontroller',
         'bin/hm_get_example.py',
         'bin/hm_set_example.py',
         'bin/hm_find_example.py',
-        'bin/hm_check_time_example.py'
+        'bin/hm_check_time_example.py',
+        'bin/hm_calibrate_read_times.py',
+        'bin/hm_poll_scheduler.py'
       ],
 
       include_package_data=True,
@@ -1,7 +1,9 @@
 """Lookbock self class for overloading serial port in unitests and mock adaptor"""
 import serial
+from serial.urlhandler.protocol_loop import Serial as LoopSerial
 import logging
 from heatmisercontroller.adaptor import HeatmiserAdaptor
+from heatmisercontroller.framing import crc16_bytes
 from heatmisercontroller.exceptions import HeatmiserResponseError
 
 class SerialTestClass(object):
@@ -26,6 +28,49 @@ class SerialTestClass(object):
             self.serialPort.COM_TIMEOUT = noTimeOut
             self.serialPort.COM_MIN_TIMEOUT = noTimeOut
 
+class ResponderSerial(LoopSerial):
+    """A loopback port that answers each write with the next queued response, rather than echoing it"""
+    def __init__(self):
+        super(ResponderSerial, self).__init__('loop://', timeout=0, baudrate=4800)
+        self.COM_BUS_RESET_TIME = 0.01
+        self.COM_START_TIMEOUT = 0.1
+        self.COM_TIMEOUT = 0.2
+        self.COM_MIN_TIMEOUT = 0.05
+        self.COM_SEND_MIN_TIME = 0.01
+        self.requests = []
+        self.responses = []
+
+    def write(self, data):
+        """Store request and queue response, None for no response"""
+        self.requests.append(bytearray(data))
+        response = self.responses.pop(0) if self.responses else None
+        if response is not None:
+            super(ResponderSerial, self).write(bytearray(response))
+        return len(data)
+
+def response_frame(source, function, payload, start=0, destination=129):
+    """Forms a response frame from a device, reads include start and payload length"""
+    frame = [destination, 0, 0, source, function]
+    if function == 0:
+        frame.extend([start & 255, start >> 8, len(payload) & 255, len(payload) >> 8])
+    frame.extend(payload)
+    frame[1], frame[2] = (len(frame) + 2) & 255, (len(frame) + 2) >> 8
+    return frame + list(crc16_bytes(frame))
+
+class FakeClock(object):
+    """Clock for an adaptor's _clock and _sleep, time only passes when slept or advanced"""
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """advance the clock, recording the time slept"""
+        self.slept += seconds
+        self.now += seconds
+
 class SetupTestClass(object):
     """Dummy serial config for unittesting"""
     def __init__(self):
@@ -1,12 +1,13 @@
 """Unittests for heatmisercontroller.adaptor module"""
 import unittest
 import logging
+import time
 
 from heatmisercontroller.adaptor import HeatmiserAdaptor
 from heatmisercontroller.exceptions import HeatmiserResponseError
-from mock_serial import SerialTestClass, SetupTestClass
-from heatmisercontroller.hm_constants import HMV3_ID
-from heatmisercontroller.framing import crc16
+from mock_serial import SerialTestClass, SetupTestClass, FakeClock
+from heatmisercontroller.hm_constants import HMV3_ID, FUNC_WRITE, FRAME_WRITE_RESP_LENGTH, RECEIVE_BUFFER_LENGTH, RECEIVE_MODE_TIMEOUT, RECEIVE_MODE_STREAM, RECEIVE_MODE_HEADER
+from heatmisercontroller.framing import crc16, ResponseFrameValidator
 
 class TestSerial(unittest.TestCase):
     """Low level serial send and recieve message tests"""
@@ -37,32 +38,121 @@ class TestSerial(unittest.TestCase):
         #self.func._disconnect() # make sure checks the reconnect function
         ret = self.func._receive_message(len(self.goodmessage))
         # Check that the returned data from the serial port == goodmessage
-        self.assertEqual(ret, self.goodmessage)
+        self.assertEqual(ret, bytearray(self.goodmessage))
         
     def test_receivemsg_2(self):
         self.serialport.serialPort.write(self.goodmessage)
         ret = self.func._receive_message(2)
         # Check that the returned data from the serial port == goodmessage
-        self.assertEqual(ret, self.goodmessage[:2])
+        self.assertEqual(ret, bytearray(self.goodmessage[:2]))
         
     def test_receivemsg_3(self):
         self.serialport.serialPort.write(self.goodmessage)
         ret = self.func._receive_message(1)
         # Check that the returned data from the serial port == goodmessage
-        self.assertEqual(ret, self.goodmessage[:1])
+        self.assertEqual(ret, bytearray(self.goodmessage[:1]))
     
     def test_receivemsg_4(self):
         self.serialport.serialPort.write(self.goodmessage)
         ret = self.func._receive_message(1)
         # Check that the returned data from the serial port == goodmessage
-        self.assertEqual(ret, self.goodmessage[0:1])
+        self.assertEqual(ret, bytearray(self.goodmessage[0:1]))
         ret = self.func._receive_message(1)
         # Check that the returned data from the serial port == goodmessage
-        self.assertEqual(ret, self.goodmessage[1:2])
+        self.assertEqual(ret, bytearray(self.goodmessage[1:2]))
         self.func._clear_input_buffer()
         with self.assertRaises(HeatmiserResponseError):
             self.func._receive_message(1)
     
+    def test_receiveframe(self):
+        goodresponse = [129, 7, 0, 5, 1, 116, 39]
+        self.serialport.serialPort.write(goodresponse)
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        self.assertEqual(bytearray(goodresponse), self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH))
+
+    def test_receiveframe_badheader(self):
+        self.serialport.serialPort.COM_TIMEOUT = 0 #don't wait when clearing buffer
+        self.serialport.serialPort.write([129, 7, 0, 6, 1, 116, 39])
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH)
+        self.assertEqual(validator.HEADER_LENGTH, len(validator.header))
+        self.assertEqual(0, self.serialport.serialPort.in_waiting)
+
+    def test_receiveframe_resync(self):
+        goodresponse = [129, 7, 0, 5, 1, 116, 39]
+        self.serialport.serialPort.write([0] + goodresponse)
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        self.assertEqual(bytearray(goodresponse), self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH))
+        self.assertEqual(1, self.func.receive_stats.resyncs)
+        self.assertEqual(0, self.serialport.serialPort.in_waiting)
+
+    def test_clear_input_buffer_quiet(self):
+        """Clearing stops once the bus is quiet rather than waiting for COM_TIMEOUT"""
+        self.serialport.serialPort.write(self.goodmessage)
+        starttime = time.time()
+        self.func._clear_input_buffer()
+        self.assertLess(time.time() - starttime, self.serialport.serialPort.COM_TIMEOUT / 2.0)
+        self.assertEqual(len(self.goodmessage), self.func.receive_stats.discarded)
+        self.assertEqual(0, self.serialport.serialPort.in_waiting)
+
+    def test_receiveframe_incomplete(self):
+        self.serialport.serialPort.COM_TIMEOUT = 0
+        self.serialport.serialPort.COM_MIN_TIMEOUT = 0
+        self.serialport.serialPort.write([129, 7, 0, 5, 1, 116])
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH)
+
+    def test_receiveframe_adaptive(self):
+        """Learned timeouts give up on an incomplete frame well before COM_TIMEOUT"""
+        goodresponse = [129, 7, 0, 5, 1, 116, 39]
+        self.func.adaptive_timeouts = True
+        for _ in range(self.func.timeouts.min_samples):
+            self.serialport.serialPort.write(goodresponse)
+            validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+            self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH)
+        self.assertTrue(self.func.timeouts.timeouts(5, FRAME_WRITE_RESP_LENGTH, self.serialport.serialPort)[2])
+        self.serialport.serialPort.write(goodresponse[:-1])
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        starttime = time.time()
+        with self.assertRaises(HeatmiserResponseError):
+            self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH)
+        self.assertLess(time.time() - starttime, self.serialport.serialPort.COM_TIMEOUT / 2.0)
+
+    def test_receiveframe_modes(self):
+        goodresponse = [129, 7, 0, 5, 1, 116, 39]
+        for mode in [RECEIVE_MODE_STREAM, RECEIVE_MODE_HEADER]:
+            self.func.receive_mode = mode
+            self.serialport.serialPort.write(goodresponse)
+            validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+            self.assertEqual(bytearray(goodresponse), self.func._receive_frame(validator, FRAME_WRITE_RESP_LENGTH))
+
+    def test_receiveframe_short_saving(self):
+        #frame shorter than expected, timeout mode would wait for COM_TIMEOUT
+        self.serialport.serialPort.write([129, 7, 0, 5, 1, 116, 39])
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        self.func._receive_frame(validator, 20)
+        self.assertEqual(1, self.func.receive_stats.frames)
+        self.assertLess(self.func.receive_stats.receivetime, 0.5)
+        self.assertGreater(self.func.receive_stats.saved_time(), 0.5)
+        self.func.receive_stats.reset()
+        self.assertEqual(0, self.func.receive_stats.frames)
+
+    def test_receive_buffer_reused(self):
+        rxbuffer = self.func._rxbuffer
+        for _ in range(2):
+            self.serialport.serialPort.write(self.goodmessage)
+            ret = self.func._receive_message(len(self.goodmessage))
+            self.assertEqual(self.goodmessage, ret.tolist())
+        self.assertIs(rxbuffer, self.func._rxbuffer)
+
+    def test_receive_buffer_grows(self):
+        message = [x % 256 for x in range(RECEIVE_BUFFER_LENGTH + 5)]
+        self.serialport.serialPort.write(message)
+        ret = self.func._receive_message(len(message))
+        self.assertEqual(message, ret.tolist())
+
     def test_receivemsg_none(self):
         with self.assertRaises(HeatmiserResponseError):
             self.func._receive_message(1)
@@ -73,6 +163,51 @@ class TestSerial(unittest.TestCase):
         # update settings
         self.func._update_settings(self.setup.settings)
 
+    def test_updatesettings_master_change(self):
+        self.func.read_frames.get(5, HMV3_ID, self.func.my_master_addr, 34, 8)
+        self.func._update_settings(self.setup.settings)
+        self.assertEqual(1, len(self.func.read_frames))
+        self.setup.settings['controller']['my_master_addr'] = 130
+        self.func._update_settings(self.setup.settings)
+        self.assertEqual(0, len(self.func.read_frames))
+
+    def use_fake_clock(self):
+        """Time the bus settle with a FakeClock"""
+        clock = FakeClock()
+        self.func._clock = clock
+        self.func._sleep = clock.sleep
+        return clock
+
+    def test_settle_gap(self):
+        """Work after a receive is done inside the settle gap, only the rest is waited"""
+        clock = self.use_fake_clock()
+        self.serialport.serialPort.write(self.goodmessage)
+        self.func._receive_message(len(self.goodmessage))
+        received = clock.now
+        clock.now += 0.04 #processing the response
+        self.func._send_message(self.goodmessage)
+        self.assertAlmostEqual(0.1, clock.now - received)
+        self.assertEqual(1, self.func.bus_timing.sends)
+        self.assertAlmostEqual(0.06, self.func.bus_timing.waited)
+        self.assertAlmostEqual(0.06, clock.slept)
+        self.assertEqual(0, self.func.bus_timing.overruns)
+
+    def test_settle_overrun(self):
+        clock = self.use_fake_clock()
+        self.func._hold_bus(0.02)
+        clock.now += 0.03
+        self.func._send_message(self.goodmessage)
+        self.assertEqual(1, self.func.bus_timing.overruns)
+        self.assertEqual(0, clock.slept)
+
+    def test_settle_clock_step(self):
+        """A deadline far ahead, after the clock stepped back, is only waited for one gap"""
+        clock = self.use_fake_clock()
+        self.func._hold_bus(0.05)
+        self.func.busfreeat += 3600
+        self.func._send_message(self.goodmessage)
+        self.assertAlmostEqual(0.05, clock.slept)
+
 class TestReadWrite(unittest.TestCase):
     """Tests for write to and read from device"""
     def setUp(self):
@@ -102,19 +237,20 @@ class TestReadWrite(unittest.TestCase):
         self.assertEqual(retasarray, goodrequest)
         
     def test_sendto_2(self):
-        """Not good test as triggers retries but fails."""
+        """Bad CRC followed by a good acknowledgement resynchronises on the good one."""
         goodresponse = [129, 7, 0, 5, 1, 0, 0, 129, 7, 0, 5, 1, 116, 39]
         #goodrequest = [5, 11, 129, 1, 12, 0, 1, 0, 1, 19, 67]
         # Setup response
         self.serialport.serialPort.write(goodresponse)
         # Send message
+        self.func.write_to_device(5, HMV3_ID, 12, 1, [1])
+        self.assertEqual(1, self.func.receive_stats.resyncs)
+
+    def test_sendto_3(self):
+        """Bad CRC with nothing following fails after retries."""
+        self.serialport.serialPort.write([129, 7, 0, 5, 1, 0, 0])
         with self.assertRaises(HeatmiserResponseError):
             self.func.write_to_device(5, HMV3_ID, 12, 1, [1])
-        # # Use serial to receive raw transmission
-        # ret = self.serialport.serialPort.read(len(goodrequest))
-        # retasarray = map(ord,ret)
-        # # Check that the returned data from the serial port == goodmessage
-        # self.assertEqual(retasarray, goodrequest)
 
     def test_readfrom_1(self):
         goodresponse = [129, 15, 0, 5, 0, 34, 0, 4, 0, 1, 2, 3, 4, 48, 246]
@@ -128,7 +264,16 @@ class TestReadWrite(unittest.TestCase):
         retasarray = map(ord, ret)
         # Check that the returned data from the serial port == goodmessage
         self.assertEqual(retasarray, goodrequest)
+        self.assertEqual(1, self.func.read_calibration.devices[5].samples)
         
+    def test_readfrom_timeoutmode(self):
+        self.func.receive_mode = RECEIVE_MODE_TIMEOUT
+        goodresponse = [129, 15, 0, 5, 0, 34, 0, 4, 0, 1, 2, 3, 4, 48, 246]
+        self.serialport.serialPort.write(goodresponse)
+        self.assertEqual([1, 2, 3, 4], self.func.read_from_device(5, HMV3_ID, 34, 4).tolist())
+        self.assertEqual(1, self.func.receive_stats.frames)
+        self.assertEqual(0, self.func.receive_stats.saved_time())
+
     def test_readall(self):
         goodresponse = [129, 21, 0, 5, 0, 0, 0, 10, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 33, 245]
         goodrequest = [5, 10, 129, 0, 0, 0, 255, 255, 65, 6]
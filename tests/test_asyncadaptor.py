@@ -0,0 +1,133 @@
+"""Unittests for heatmisercontroller.asyncadaptor and transactions modules"""
+import unittest
+import logging
+
+from heatmisercontroller.asyncadaptor import AsyncHeatmiserAdaptor
+from heatmisercontroller.transactions import BusRequest, Return, run_sync, run_async
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.hm_constants import HMV3_ID, PROG_MODE_DAY, FUNC_READ, FUNC_WRITE, BROADCAST_ADDR
+from heatmisercontroller.exceptions import HeatmiserResponseError
+
+from mock_serial import SetupTestClass, ResponderSerial, response_frame
+
+class TestAsyncAdaptor(unittest.TestCase):
+    """Unittests for queued non blocking transactions on a loopback port"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.port = ResponderSerial()
+        self.func = AsyncHeatmiserAdaptor(SetupTestClass())
+        self.func.serport = self.port
+
+    def test_read(self):
+        self.port.responses = [response_frame(5, FUNC_READ, [1, 2, 3, 4], 34)]
+        self.assertEqual(bytearray([1, 2, 3, 4]), self.func.read_from_device(5, HMV3_ID, 34, 4))
+        self.assertEqual([bytearray([5, 10, 129, 0, 34, 0, 4, 0, 172, 13])], self.port.requests)
+        self.assertEqual(1, self.func.read_calibration.devices[5].samples)
+
+    def test_write(self):
+        self.port.responses = [response_frame(5, FUNC_WRITE, [])]
+        self.assertIsNone(self.func.write_to_device(5, HMV3_ID, 12, 1, [1]))
+        self.assertEqual([bytearray([5, 11, 129, 1, 12, 0, 1, 0, 1, 19, 67])], self.port.requests)
+
+    def test_broadcast(self):
+        self.func.write_to_device(BROADCAST_ADDR, HMV3_ID, 12, 1, [1])
+        self.assertEqual(1, len(self.port.requests))
+
+    def test_queue(self):
+        self.port.responses = [response_frame(5, FUNC_READ, [1], 34), response_frame(6, FUNC_READ, [2], 34)]
+        first = self.func.read_from_device_async(5, HMV3_ID, 34, 1)
+        second = self.func.read_from_device_async(6, HMV3_ID, 34, 1)
+        self.assertEqual(2, self.func.pending)
+        self.func.process() #first answered at once, second waits for the bus to settle
+        self.assertTrue(first.done())
+        self.assertFalse(second.done())
+        self.assertEqual(bytearray([2]), self.func.run_until_complete(second))
+        self.assertEqual(bytearray([1]), first.result())
+        self.assertEqual(0, self.func.pending)
+        self.assertIsNone(self.func.next_deadline())
+
+    def test_settle_deadline(self):
+        self.port.responses = [response_frame(5, FUNC_READ, [1], 34)]
+        self.func.read_from_device(5, HMV3_ID, 34, 1)
+        self.func.read_from_device_async(5, HMV3_ID, 34, 1)
+        self.func.process() #bus hasn't settled, nothing sent
+        self.assertEqual(1, len(self.port.requests))
+        self.assertEqual(self.func.bus_free_time(), self.func.next_deadline())
+
+    def test_retry(self):
+        self.port.responses = [None, response_frame(5, FUNC_READ, [1], 34)]
+        self.assertEqual(bytearray([1]), self.func.read_from_device(5, HMV3_ID, 34, 1))
+        self.assertEqual(2, len(self.port.requests))
+
+    def test_bad_frame(self):
+        self.port.responses = [response_frame(5, FUNC_READ, [1], 34)[:-1] + [0]] * 2
+        future = self.func.read_from_device_async(5, HMV3_ID, 34, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            self.func.run_until_complete(future)
+        self.assertEqual(2, len(self.port.requests))
+
+    def test_resync_after_bad_frame(self):
+        good = response_frame(5, FUNC_READ, [7], 34)
+        self.port.responses = [good[:-1] + [0] + good]
+        self.assertEqual(bytearray([7]), self.func.read_from_device(5, HMV3_ID, 34, 1))
+        self.assertEqual(1, len(self.port.requests)) #found in the bytes following, not resent
+        self.assertEqual(1, self.func.receive_stats.resyncs)
+
+    def test_resync_skips_tail(self):
+        #header from another device fails early, the rest of its frame must not start the response
+        self.port.responses = [response_frame(6, FUNC_READ, [9, 9, 9, 9], 34) + response_frame(5, FUNC_READ, [7], 34)]
+        self.assertEqual(bytearray([7]), self.func.read_from_device(5, HMV3_ID, 34, 1))
+        self.assertEqual(1, len(self.port.requests))
+
+    def test_resync_then_retry(self):
+        self.port.responses = [response_frame(5, FUNC_READ, [1], 34)[:-1] + [0] + [1, 2, 3], response_frame(5, FUNC_READ, [7], 34)]
+        self.assertEqual(bytearray([7]), self.func.read_from_device(5, HMV3_ID, 34, 1))
+        self.assertEqual(2, len(self.port.requests))
+        self.assertEqual(0, self.func.serport.in_waiting)
+
+class TestTransactions(unittest.TestCase):
+    """Unittests for running transactions blocking and on the async adaptor"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.port = ResponderSerial()
+        self.adaptor = AsyncHeatmiserAdaptor(SetupTestClass())
+        self.adaptor.serport = self.port
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.func = ThermoStatHotWaterDay(self.adaptor, settings)
+
+    @staticmethod
+    def _nested():
+        """transaction yielding a sub transaction that catches an error"""
+        def inner():
+            """sub transaction"""
+            try:
+                yield BusRequest('read_from_device', 1, HMV3_ID, 34, 1)
+            except HeatmiserResponseError:
+                raise Return('caught')
+        result = yield inner()
+        raise Return([result])
+
+    def test_nested(self):
+        self.assertEqual(['caught'], run_sync(self.adaptor, self._nested()))
+        self.assertEqual(['caught'], self.adaptor.run_until_complete(run_async(self.adaptor, self._nested())))
+
+    def test_read_fields_async(self):
+        self.port.responses = [response_frame(1, FUNC_READ, [0, 1, 0, 0, 0, 0, 0, 170], 32)]
+        future = self.func.read_fields_async(['tempholdmins', 'airtemp'], 0)
+        self.assertFalse(future.done())
+        self.assertEqual([1, 17], self.adaptor.run_until_complete(future))
+        self.assertEqual([1, 17], self.func.read_fields(['tempholdmins', 'airtemp']))
+
+    def test_set_fields_async(self):
+        self.port.responses = [response_frame(1, FUNC_WRITE, [])]
+        self.adaptor.run_until_complete(self.func.set_fields_async(['tempholdmins'], [5]))
+        self.assertEqual(5, self.func.tempholdmins.get_value())
+        self.assertEqual(bytearray([1, 12, 129, 1, 32, 0, 2, 0, 5, 0]), self.port.requests[0][:-2])
+
+    def test_sync_wrapper(self):
+        self.port.responses = [response_frame(1, FUNC_READ, [0, 1, 0, 0, 0, 0, 0, 170], 32)]
+        self.assertEqual([1, 17], self.func.read_fields(['tempholdmins', 'airtemp'], 0))
+        self.assertEqual(1, self.adaptor.transactions)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Unittests for heatmisercontroller.busexecutor module"""
+import unittest
+import logging
+import os
+import threading
+
+from heatmisercontroller.busexecutor import BusExecutor, ExecutorAdaptor, BusFuture
+from heatmisercontroller.network import HeatmiserNetwork
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.hm_constants import HMV3_ID, PROG_MODE_DAY, BUS_PRIORITY_WRITE, BUS_PRIORITY_INTERACTIVE, BUS_PRIORITY_BACKGROUND
+from heatmisercontroller.exceptions import HeatmiserError, HeatmiserResponseError
+
+from mock_serial import SetupTestClass, MockHeatmiserAdaptor
+
+class TestBusExecutor(unittest.TestCase):
+    """Unittests for the bus thread and its queue"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.executor = BusExecutor(MockHeatmiserAdaptor(SetupTestClass()))
+        self.executor.start()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def test_priority(self):
+        release = threading.Event()
+        order = []
+        self.executor.submit(BUS_PRIORITY_BACKGROUND, release.wait)
+        futures = [self.executor.submit(priority, order.append, priority) for priority in [BUS_PRIORITY_BACKGROUND, BUS_PRIORITY_INTERACTIVE, BUS_PRIORITY_WRITE, BUS_PRIORITY_INTERACTIVE]]
+        release.set()
+        for future in futures:
+            future.result(1)
+        self.assertEqual([BUS_PRIORITY_WRITE, BUS_PRIORITY_INTERACTIVE, BUS_PRIORITY_INTERACTIVE, BUS_PRIORITY_BACKGROUND], order)
+
+    def test_exception(self):
+        future = self.executor.submit(BUS_PRIORITY_INTERACTIVE, self.executor.adaptor.read_from_device, 1, HMV3_ID, 0, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            future.result(1)
+        self.assertIsInstance(future.exception(), HeatmiserResponseError)
+
+    def test_callback(self):
+        results = []
+        future = self.executor.submit(BUS_PRIORITY_INTERACTIVE, sum, [1, 2])
+        future.result(1)
+        future.add_done_callback(lambda done: results.append(done.result()))
+        self.assertEqual([3], results)
+
+    def test_timeout(self):
+        with self.assertRaises(HeatmiserError):
+            BusFuture().result(0.01)
+
+    def test_stop_runs_queued(self):
+        release = threading.Event()
+        self.executor.submit(BUS_PRIORITY_INTERACTIVE, release.wait)
+        future = self.executor.submit(BUS_PRIORITY_BACKGROUND, sum, [1])
+        release.set()
+        self.executor.stop()
+        self.assertTrue(future.done())
+        with self.assertRaises(HeatmiserError):
+            self.executor.submit(BUS_PRIORITY_INTERACTIVE, sum, [1])
+
+class TestExecutorAdaptor(unittest.TestCase):
+    """Unittests for devices sharing the bus thread"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.adaptor = MockHeatmiserAdaptor(SetupTestClass())
+        self.executor = BusExecutor(self.adaptor)
+        self.executor.start()
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.func = ThermoStatHotWaterDay(ExecutorAdaptor(self.executor), settings)
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def test_read_and_write(self):
+        self.adaptor.setresponse([bytearray([0, 1, 0, 0, 0, 0, 0, 170])])
+        self.assertEqual([1, 17], self.func.read_fields(['tempholdmins', 'airtemp'], 0))
+        self.func.set_field('tempholdmins', 5)
+        self.assertEqual((1, HMV3_ID, 32, 2, [5, 0]), self.adaptor.arguments[-1])
+        self.assertEqual(2, self.executor.transactions)
+
+    def test_threads(self):
+        self.adaptor.setresponse([[0, 1, 0, 0, 0, 0, 0, 170]] * 20)
+        results = []
+        def reader():
+            """read from another thread"""
+            results.append(self.func.read_fields(['tempholdmins', 'airtemp'], 0))
+        threads = [threading.Thread(target=reader) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([[1, 17]] * 20, results)
+        self.assertEqual(20, self.executor.transactions)
+
+    def test_attributes(self):
+        self.assertIs(self.adaptor.read_calibration, self.func._adaptor.read_calibration)
+
+class TestNetworkExecutor(unittest.TestCase):
+    """Unittests for starting the bus thread on a network"""
+    def test_start_stop(self):
+        configfile = os.path.join(os.path.abspath(os.path.dirname(__file__)), "hmcontroller.conf")
+        hmn = HeatmiserNetwork(configfile)
+        executor = hmn.start_bus_executor()
+        self.assertTrue(executor.running)
+        self.assertIsInstance(hmn.controllers[0]._adaptor, ExecutorAdaptor)
+        self.assertIsInstance(hmn.All._adaptor, ExecutorAdaptor)
+        hmn.stop_bus_executor()
+        self.assertIs(hmn.adaptor, hmn.controllers[0]._adaptor)
+        self.assertFalse(executor.running)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Unittests for heatmisercontroller.read_calibration module"""
+import unittest
+import logging
+import os
+import tempfile
+
+from heatmisercontroller.read_calibration import ReadTimeFit, ReadTimeCalibration, default_read_time
+from heatmisercontroller.devices_prt_e import ThermoStatDay
+from heatmisercontroller.hm_constants import HMV3_ID, PROG_MODE_DAY, READ_TIME_INTERCEPT, READ_TIME_SLOPE
+
+from mock_serial import SetupTestClass, MockHeatmiserAdaptor
+
+class TestReadTimeFit(unittest.TestCase):
+    """Tests for fitting read times"""
+    def test_fit(self):
+        fit = ReadTimeFit(decay=1)
+        for length in [1, 50, 100, 150, 200]:
+            fit.add(length, 0.1 + 0.004 * length)
+        intercept, slope = fit.coefficients()
+        self.assertAlmostEqual(0.1, intercept)
+        self.assertAlmostEqual(0.004, slope)
+
+    def test_too_few(self):
+        fit = ReadTimeFit(min_samples=5)
+        fit.add(1, 0.1)
+        self.assertIsNone(fit.coefficients())
+
+    def test_single_length(self):
+        """only intercept fitted if every read is the same length"""
+        fit = ReadTimeFit()
+        for _ in range(5):
+            fit.add(100, 0.5)
+        intercept, slope = fit.coefficients(0.003)
+        self.assertAlmostEqual(0.003, slope)
+        self.assertAlmostEqual(0.2, intercept)
+
+class TestReadTimeCalibration(unittest.TestCase):
+    """Tests for per adaptor and per device calibration"""
+    def setUp(self):
+        self.calibration = ReadTimeCalibration(decay=1)
+        for length in [1, 50, 100, 150, 200]:
+            self.calibration.record(1, length, 0.1 + 0.004 * length)
+
+    def test_default(self):
+        self.assertEqual((READ_TIME_INTERCEPT, READ_TIME_SLOPE), ReadTimeCalibration().coefficients(1))
+        self.assertEqual(default_read_time(10), ReadTimeCalibration().estimate(1, 10))
+
+    def test_device_and_adaptor(self):
+        self.assertAlmostEqual(0.9, self.calibration.estimate(1, 200))
+        self.assertAlmostEqual(0.9, self.calibration.estimate(2, 200)) #adaptor fit
+        for _ in range(5):
+            self.calibration.record(2, 100, 0.7)
+        self.assertAlmostEqual(0.7, self.calibration.estimate(2, 100))
+        self.assertAlmostEqual(0.9, self.calibration.estimate(1, 200))
+
+    def test_save_load(self):
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        try:
+            self.calibration.save(filename)
+            loaded = ReadTimeCalibration(decay=1)
+            self.assertTrue(loaded.load(filename))
+        finally:
+            os.remove(filename)
+        self.assertEqual(self.calibration.coefficients(1), loaded.coefficients(1))
+        self.assertFalse(loaded.load(filename))
+
+    def test_save_load_buses(self):
+        handle, filename = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        annex = ReadTimeCalibration(decay=1)
+        for _ in range(5):
+            annex.record(1, 10, 0.5)
+        try:
+            self.calibration.save(filename)
+            annex.save(filename, 'Annex')
+            loaded = ReadTimeCalibration(decay=1)
+            self.assertTrue(loaded.load(filename, 'Annex'))
+            self.assertEqual(annex.coefficients(1), loaded.coefficients(1))
+            self.assertTrue(loaded.load(filename))
+            self.assertEqual(self.calibration.coefficients(1), loaded.coefficients(1))
+            self.assertFalse(loaded.load(filename, 'Loft'))
+        finally:
+            os.remove(filename)
+
+    def test_device_estimate(self):
+        logging.basicConfig(level=logging.ERROR)
+        adaptor = MockHeatmiserAdaptor(SetupTestClass())
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_e_model', 'expected_prog_mode':PROG_MODE_DAY}
+        device = ThermoStatDay(adaptor, settings)
+        self.assertAlmostEqual(default_read_time(device.dcb_length), device.fullreadtime)
+        adaptor.read_calibration = self.calibration
+        self.assertAlmostEqual(0.1 + 0.004 * device.dcb_length, device.fullreadtime)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Unittests for heatmisercontroller.codec module"""
+import unittest
+import random
+
+from heatmisercontroller.codec import BlockCodec
+from heatmisercontroller.schema import get_schema
+from heatmisercontroller.devices_prt_e import ThermoStatWeek, ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterWeek, ThermoStatHotWaterDay
+from heatmisercontroller.generaldevices import ThermoStatUnknown
+
+DEVICECLASSES = [ThermoStatWeek, ThermoStatDay, ThermoStatHotWaterWeek, ThermoStatHotWaterDay, ThermoStatUnknown]
+
+class TestCodec(unittest.TestCase):
+    """Unittests for bulk decode and encode"""
+    def test_decode_matches_fields(self):
+        rand = random.Random(1)
+        for deviceclass in DEVICECLASSES:
+            schema = get_schema(deviceclass)
+            rawdata = bytearray(rand.randint(0, 255) for _ in range(schema.dcb_length))
+            values = schema.get_codec(0, len(schema.fields) - 1).decode(rawdata)
+            for field, value in zip(schema.fields, values):
+                if value is not None:
+                    data = rawdata[field.dcbaddress:field.dcbaddress + field.fieldlength]
+                    self.assertEqual(field._calculate_value(data), value)
+                    self.assertIs(type(field._calculate_value(data)), type(value))
+
+    def test_decode_part(self):
+        schema = get_schema(ThermoStatDay)
+        first = schema.nametonum['tempholdmins']
+        last = schema.nametonum['airtemp']
+        rawdata = bytearray([9, 0, 1, 0, 0, 0, 0, 0, 170])
+        self.assertEqual([1, 17.0], schema.get_codec(first, last).decode(rawdata, 1, [0, 3]))
+
+    def test_decode_overridden(self):
+        schema = get_schema(ThermoStatHotWaterDay)
+        version = schema.nametonum['version']
+        self.assertEqual([None], schema.get_codec(version, version).decode(bytearray([0x85])))
+
+    def test_encode_matches_fields(self):
+        schema = get_schema(ThermoStatHotWaterDay)
+        first = schema.nametonum['frosttemp']
+        last = schema.nametonum['holidayhours']
+        fields = schema.fields[first:last + 1]
+        values = [12, 20, 30, 1, 0, 1, 1, 300]
+        expected = []
+        for field, value in zip(fields, values):
+            expected.extend(field.format_data_from_value(value))
+        self.assertEqual(expected, BlockCodec(fields).encode(values))
+
+    def test_encode_multi(self):
+        schema = get_schema(ThermoStatDay)
+        first = schema.nametonum['mon_heat']
+        setarray = [[1, 0, 17, 9, 0, 20, 13, 0, 17, 20, 0, 20], [1, 0, 18, 9, 0, 21, 13, 0, 18, 20, 0, 21]]
+        self.assertEqual(setarray[0] + setarray[1], schema.get_codec(first, first + 1).encode(setarray))
+
+    def test_shared(self):
+        schema = get_schema(ThermoStatDay)
+        self.assertIs(schema.get_codec(0, 3), schema.get_codec(0, 3))
+
+if __name__ == '__main__':
+    unittest.main()
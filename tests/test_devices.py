@@ -99,6 +99,13 @@ class TestReadingData(unittest.TestCase):
         self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 0], 'tempholdmins', 'airtemp')
         self.assertEqual(1, self.func.tempholdmins.value)
         
+    def test_procpartpayload_memoryview(self):
+        response = bytearray([9, 9, 0, 1, 0, 0, 0, 0, 0, 170, 9, 9])
+        self.func._procpartpayload(memoryview(response)[2:10], 'tempholdmins', 'airtemp')
+        self.assertEqual(1, self.func.tempholdmins.value)
+        self.assertEqual(17, self.func.airtemp.value)
+        self.assertEqual(bytearray([0, 1, 0, 0, 0, 0, 0, 170]), self.func.read_raw_data('tempholdmins', 'errorcode'))
+
     def test_readall(self):
         setup = SetupTestClass()
         adaptor = MockHeatmiserAdaptor(setup)
@@ -151,6 +158,18 @@ class TestReadingData(unittest.TestCase):
         self.func.airtemp.lastreadtime = 0 #force reread
         self.assertEqual(18, self.func.read_field('airtemp', None))
         
+    def test_read_dcblen(self):
+        #field id 0 is a last field, fields beyond the bytes read are not decoded or marked fresh
+        setup = SetupTestClass()
+        adaptor = MockHeatmiserAdaptor(setup)
+        self.func = ThermoStatDay(adaptor, self.settings2)
+        adaptor.setresponse([[0, self.func.dcb_length]])
+        self.assertEqual([self.func.dcb_length], self.func.read_fields(['DCBlen'], 0))
+        self.assertIsNone(self.func.keylock.lastreadtime)
+        self.assertIsNone(self.func.airtemp.value)
+        self.func._procpayload([0, self.func.dcb_length, 0])
+        self.assertIsNone(self.func.address.lastreadtime)
+
     def test_read_fields(self):
         setup = SetupTestClass()
         adaptor = MockHeatmiserAdaptor(setup)
@@ -242,6 +261,156 @@ def get_offset(timenum):
     
 YEAR2000 = (30 * 365 + 7) * 86400 #get some funny effects if you use times from 1970
         
+class TestSharedSchema(unittest.TestCase):
+    """Unittests for fields built from the class schema"""
+    def setUp(self):
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.dev1 = ThermoStatHotWaterDay(None, settings)
+        self.dev2 = ThermoStatHotWaterDay(None, dict(settings, address=2))
+
+    def test_shared_settings(self):
+        self.assertIs(self.dev1._fieldnametonum, self.dev2._fieldnametonum)
+        self.assertIs(self.dev1._fieldsegments, self.dev2._fieldsegments)
+        self.assertIs(self.dev1.mon_heat.validrange, self.dev2.mon_heat.validrange)
+        self.assertEqual(self.dev1.dcb_length, self.dev2.dcb_length)
+
+    def test_separate_state(self):
+        self.assertIsNot(self.dev1.airtemp, self.dev2.airtemp)
+        self.assertEqual(1, self.dev1.address.expectedvalue)
+        self.assertEqual(2, self.dev2.address.expectedvalue)
+        self.assertIsNot(self.dev1.heat_schedule, self.dev2.heat_schedule)
+        self.assertIsNot(self.dev1.floorlimiting, self.dev2.floorlimiting)
+        self.dev1._procpayload([1], self.dev1._fieldnametonum['keylock'], self.dev1._fieldnametonum['keylock'])
+        self.assertEqual(1, self.dev1.keylock.value)
+        self.assertIsNone(self.dev2.keylock.value)
+
+class TestLazyDecode(unittest.TestCase):
+    """Unittests for decoding fields on first access"""
+    def setUp(self):
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY, 'decode_mode':'lazy'}
+        self.func = ThermoStatHotWaterDay(None, settings)
+        self.func.lastreadtime = 100.0
+
+    def test_decode_on_access(self):
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 170], 'tempholdmins', 'airtemp')
+        airtempid = self.func._fieldnametonum['airtemp']
+        self.assertEqual(None, self.func._fieldstate.values[airtempid])
+        self.assertEqual(1, self.func._fieldstate.values[self.func._fieldnametonum['tempholdmins']]) #has observers
+        self.assertEqual(17, self.func.airtemp.value)
+        self.assertEqual(100.0, self.func.airtemp.lastreadtime)
+        self.assertEqual(17, self.func._fieldstate.values[airtempid])
+
+    def test_decode_invalid(self):
+        self.func._procpartpayload([5], 'errorcode', 'errorcode')
+        self.assertEqual(None, self.func.errorcode.value)
+        self.assertEqual(None, self.func.errorcode.lastreadtime)
+
+    def test_set_after_receive(self):
+        self.func._procpartpayload([1], 'keylock', 'keylock')
+        self.func.keylock.update_value(0, 101.0)
+        self.assertEqual(0, self.func.keylock.value)
+
+    def test_read_fields(self):
+        setup = SetupTestClass()
+        adaptor = MockHeatmiserAdaptor(setup)
+        self.func._adaptor = adaptor
+        adaptor.setresponse([[0, 1, 0, 0, 0, 0, 0, 170]])
+        self.assertEqual([1, 17], self.func.read_fields(['tempholdmins', 'airtemp'], 0))
+
+class TestChangeOnlyDecode(unittest.TestCase):
+    """Unittests for skipping decode of unchanged fields"""
+    def setUp(self):
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.func = ThermoStatHotWaterDay(MockHeatmiserAdaptor(SetupTestClass()), settings)
+        self.func.lastreadtime = 100.0
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 170], 'tempholdmins', 'airtemp')
+
+    def test_unchanged(self):
+        self.assertEqual(4, self.func.fields_decoded)
+        self.func.lastreadtime = 200.0
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 180], 'tempholdmins', 'airtemp')
+        self.assertEqual(5, self.func.fields_decoded)
+        self.assertEqual(3, self.func.fields_skipped)
+        self.assertEqual(18, self.func.airtemp.value)
+        self.assertEqual(200.0, self.func.tempholdmins.lastreadtime)
+
+    def test_invalid_decoded_again(self):
+        self.func._procpartpayload([5], 'errorcode', 'errorcode')
+        self.func._procpartpayload([5], 'errorcode', 'errorcode')
+        self.assertEqual(0, self.func.fields_skipped)
+        self.assertEqual(None, self.func.errorcode.lastreadtime)
+
+    def test_written(self):
+        self.func.set_field('tempholdmins', 5)
+        self.func._procpartpayload([0, 1], 'tempholdmins', 'tempholdmins')
+        self.assertEqual(0, self.func.fields_skipped)
+        self.assertEqual(1, self.func.tempholdmins.value)
+
+class TestExpiry(unittest.TestCase):
+    """Unittests for the field expiry index"""
+    def setUp(self):
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.func = ThermoStatHotWaterDay(MockHeatmiserAdaptor(SetupTestClass()), settings)
+        self.func.lastreadtime = 100.0
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 170], 'tempholdmins', 'airtemp')
+
+    def test_next_expiry(self):
+        self.assertEqual(float('-inf'), self.func.next_expiry())
+        self.assertEqual(111.0, self.func.next_expiry(['airtemp', 'tempholdmins']))
+        self.assertEqual(None, self.func.next_expiry(['notafield']))
+
+    def test_stale_fields(self):
+        self.assertNotIn('airtemp', self.func.stale_fields(110.0))
+        self.assertIn('airtemp', self.func.stale_fields(112.0))
+        self.assertNotIn('tempholdmins', self.func.stale_fields(112.0))
+        self.assertIn('currenttime', self.func.stale_fields(112.0))
+
+    def test_reread(self):
+        self.func.lastreadtime = 150.0
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 170], 'tempholdmins', 'airtemp')
+        self.assertEqual(161.0, self.func.next_expiry(['airtemp']))
+        self.assertNotIn('airtemp', self.func.stale_fields(160.0))
+
+    def test_lazy(self):
+        self.func.set_decode_mode = 'lazy'
+        self.func.lastreadtime = 150.0
+        self.func._procpartpayload([0, 2, 0, 0, 0, 0, 0, 170], 'tempholdmins', 'airtemp')
+        self.assertEqual(215.0, self.func.next_expiry(['tempholdmins']))
+        self.assertEqual(2, self.func.tempholdmins.value)
+        self.assertEqual(215.0, self.func.next_expiry(['tempholdmins']))
+
+class TestPreparedRead(unittest.TestCase):
+    """Unittests for prepared reads and the plan cache"""
+    def setUp(self):
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.adaptor = MockHeatmiserAdaptor(SetupTestClass())
+        self.func = ThermoStatHotWaterDay(self.adaptor, settings)
+
+    def test_read(self):
+        handle = self.func.prepare(['airtemp', 'tempholdmins', 'notafield', 'airtemp'])
+        self.adaptor.setresponse([[0, 1, 0, 0, 0, 0, 0, 170]])
+        self.assertEqual([17, 1, None, 17], handle.read())
+        self.assertEqual([(1, HMV3_ID, 32, 8, False)], self.adaptor.arguments)
+        self.assertEqual([17, 1, None, 17], handle.read(-1))
+        self.assertEqual(1, len(self.adaptor.arguments))
+
+    def test_plan_cache(self):
+        handle = self.func.prepare(['airtemp', 'tempholdmins'])
+        self.assertEqual(1, len(self.func._plancache))
+        self.adaptor.setresponse([[0, 1, 0, 0, 0, 0, 0, 170]])
+        self.func.read_fields(['tempholdmins', 'airtemp'])
+        self.assertEqual(1, len(self.func._plancache))
+        plan = self.func._cached_plan(handle._fieldids)
+        plan[0][2] = 0 #callers may change the copy
+        self.assertEqual(8, self.func._cached_plan(handle._fieldids)[0][2])
+
+    def test_plan_cache_calibration(self):
+        self.func.prepare(['airtemp', 'tempholdmins'])
+        for _ in range(10):
+            self.adaptor.read_calibration.record(1, 8, 1.0)
+        self.func.prepare(['airtemp'])
+        self.assertEqual(1, len(self.func._plancache))
+
 class TestTimeFunctions(unittest.TestCase):
     """Unittests for time functions"""
     def setUp(self):
@@ -6,7 +6,7 @@ import unittest
 import datetime
 import time
 
-from heatmisercontroller.fields import HeatmiserFieldUnknown, HeatmiserField, HeatmiserFieldSingleReadOnly, HeatmiserFieldDoubleReadOnly
+from heatmisercontroller.fields import HeatmiserFieldUnknown, HeatmiserField, HeatmiserFieldSingleReadOnly, HeatmiserFieldDoubleReadOnly, FieldStore
 from heatmisercontroller.fields_special import HeatmiserFieldTime
 from heatmisercontroller.hm_constants import MAX_AGE_LONG, CURRENT_TIME_DAY, CURRENT_TIME_HOUR, CURRENT_TIME_MIN, CURRENT_TIME_SEC
 from heatmisercontroller.exceptions import HeatmiserResponseError, HeatmiserControllerTimeError
@@ -138,3 +138,34 @@ class TestUpdates(unittest.TestCase):
         with self.assertRaises(HeatmiserResponseError):
             field.update_data([3], None)
 
+class TestFieldStore(unittest.TestCase):
+    """Unittests for field state held in a shared store"""
+    def setUp(self):
+        self.prototype = HeatmiserFieldDoubleReadOnly('airtemp', 38, [], MAX_AGE_LONG)
+        self.store = FieldStore(3)
+        self.field = self.prototype.copy(self.store, 2)
+
+    def test_state_in_store(self):
+        self.field.update_data([0, 17], 5.0)
+        self.assertEqual(17, self.store.values[2])
+        self.assertEqual([0, 17], self.store.data[2])
+        self.assertEqual(5.0, self.store.readtimes[2])
+        self.assertEqual(None, self.store.values[0])
+        self.assertEqual(None, self.prototype.value)
+
+    def test_unread(self):
+        self.assertEqual(None, self.field.lastreadtime)
+        self.assertFalse(self.field.check_data_valid())
+        self.field.lastreadtime = 0
+        self.assertTrue(self.field.check_data_valid())
+
+    def test_no_dict(self):
+        self.assertFalse(hasattr(self.field, '__dict__'))
+        self.assertIs(self.prototype.validrange, self.field.validrange)
+
+    def test_observers_not_copied(self):
+        calls = []
+        self.prototype.add_notifable_changed(calls.append)
+        field = self.prototype.copy(self.store, 1)
+        field.update_data([0, 1], 5.0)
+        self.assertEqual([], calls)
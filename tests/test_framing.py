@@ -1,13 +1,12 @@
-"""Complete set of tests for framing functions
-
-## Imported crc16 function not tested"""
+"""Complete set of tests for framing functions"""
 
 import unittest
 import logging
 
 from heatmisercontroller.framing import _check_frame_crc, _check_response_frame_length, _check_response_frame_addresses, _check_response_frame_function, verify_response, form_frame
+from heatmisercontroller.framing import crc16, crc16_bytes, crc16_update, CRC16_INIT, ResponseFrameValidator, FrameDecoder, ReadFrameCache
 from heatmisercontroller.exceptions import HeatmiserResponseError, HeatmiserResponseErrorCRC
-from heatmisercontroller.hm_constants import HMV3_ID
+from heatmisercontroller.hm_constants import HMV3_ID, FUNC_READ, FUNC_WRITE
 
 class TestFraming(unittest.TestCase):
     """Unitests for framing"""
@@ -34,6 +33,21 @@ class TestFraming(unittest.TestCase):
         _check_frame_crc(self.goodresponsemessage)
         _check_frame_crc(self.goodackmessage)
     
+    def test_crc_table_matches_nibble(self):
+        for message in [self.goodreadmessage, self.goodresponsemessage, range(256), []]:
+            self.assertEqual(crc16().run(message), crc16_bytes(message))
+
+    def test_crc_table_types(self):
+        expected = crc16_bytes(self.goodackmessage[:-2])
+        self.assertEqual(expected, self.goodackmessage[-2:])
+        self.assertEqual(expected, crc16_bytes(bytearray(self.goodackmessage[:-2])))
+        self.assertEqual(expected, crc16_bytes(str(bytearray(self.goodackmessage[:-2]))))
+
+    def test_crc_update_incremental(self):
+        crc = crc16_update(CRC16_INIT, self.goodackmessage, 0, 3)
+        crc = crc16_update(crc, self.goodackmessage, 3, 5)
+        self.assertEqual(crc, crc16_update(CRC16_INIT, self.goodackmessage[:5]))
+
     #length
     def test_framechecklength(self):
         #crc = crc16()
@@ -93,14 +107,116 @@ class TestFraming(unittest.TestCase):
         with self.assertRaises(HeatmiserResponseError):
             verify_response(HMV3_ID, 5, 129, 0, 1, self.badackmessage)
             
+    #incremental
+    def test_validator_good_bytewise(self):
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_READ, 1)
+        for index in range(len(self.goodresponsemessage)):
+            self.assertFalse(validator.complete)
+            validator.feed(self.goodresponsemessage, index, index + 1)
+        self.assertTrue(validator.complete)
+        self.assertEqual(0, validator.remaining)
+
+    def test_validator_good_blocks(self):
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        validator.feed(self.goodackmessage[:3])
+        self.assertEqual(2, validator.remaining)
+        validator.feed(bytearray(self.goodackmessage[3:]))
+        self.assertTrue(validator.complete)
+
+    def test_validator_bad_header(self):
+        validator = ResponseFrameValidator(HMV3_ID, 6, 129, FUNC_READ, 1)
+        validator.feed(self.goodresponsemessage[:4])
+        with self.assertRaises(HeatmiserResponseError):
+            validator.feed(self.goodresponsemessage[4:5])
+
+    def test_validator_bad_length(self):
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_READ, 2)
+        with self.assertRaises(HeatmiserResponseError):
+            validator.feed(self.goodresponsemessage[:5])
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            validator.feed([129, 5, 0, 5, 1])
+
+    def test_validator_too_long(self):
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        with self.assertRaises(HeatmiserResponseError):
+            validator.feed(self.goodackmessage + [0])
+
+    def test_validator_bad_crc(self):
+        validator = ResponseFrameValidator(HMV3_ID, 5, 129, FUNC_WRITE, 1)
+        validator.feed(self.goodackmessage[:-1])
+        with self.assertRaises(HeatmiserResponseErrorCRC):
+            validator.feed([0])
+
+    #frame decoder
+    def test_decoder_noise(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed([0, 3] + self.goodackmessage + [255] + self.goodresponsemessage)
+        self.assertEqual([bytearray(self.goodackmessage), bytearray(self.goodresponsemessage)], frames)
+        self.assertEqual(2, decoder.frames)
+        self.assertEqual(3, decoder.discarded)
+
+    def test_decoder_bytewise(self):
+        decoder = FrameDecoder()
+        frames = []
+        for byte in self.goodresponsemessage:
+            frames.extend(decoder.feed([byte]))
+        self.assertEqual([bytearray(self.goodresponsemessage)], frames)
+        self.assertEqual(0, decoder.pending)
+
+    def test_decoder_bad_crc(self):
+        decoder = FrameDecoder(5, 129)
+        frames = decoder.feed(self.goodackmessage[:-1] + [0] + self.goodackmessage)
+        self.assertEqual([bytearray(self.goodackmessage)], frames)
+        self.assertEqual(7, decoder.discarded)
+
+    def test_decoder_source_filter(self):
+        decoder = FrameDecoder(6, 129)
+        self.assertEqual([], decoder.feed(self.goodackmessage))
+        self.assertEqual([], decoder.flush())
+        self.assertEqual(7, decoder.discarded)
+
+    def test_decoder_flush_false_header(self):
+        """Header claiming a long frame holds the scan until flushed"""
+        decoder = FrameDecoder()
+        self.assertEqual([], decoder.feed([129, 100, 0, 5, 0] + self.goodackmessage))
+        self.assertEqual([bytearray(self.goodackmessage)], decoder.flush())
+        self.assertEqual(5, decoder.discarded)
+
+    def test_decoder_requests(self):
+        capture = self.goodreadmessage + self.goodresponsemessage + self.goodwritemessage + self.goodackmessage
+        self.assertEqual(2, len(FrameDecoder().feed(capture)))
+        self.assertEqual(4, len(FrameDecoder(requests=True).feed(capture)))
+
     #form frames
     def test_form_good_write(self):
         ret = form_frame(5, HMV3_ID, 129, 1, 34, 1, [255])
-        self.assertEqual(ret, self.goodwritemessage)
+        self.assertEqual(ret, bytearray(self.goodwritemessage))
         
     def test_form_good_read(self):
         ret = form_frame(5, HMV3_ID, 129, 0, 34, 8, [])
-        self.assertEqual(ret, self.goodreadmessage)
+        self.assertEqual(ret, bytearray(self.goodreadmessage))
+
+    def test_read_frame_cache(self):
+        cache = ReadFrameCache()
+        frame = cache.get(5, HMV3_ID, 129, 34, 8)
+        self.assertEqual(bytearray(self.goodreadmessage), frame)
+        self.assertIs(frame, cache.get(5, HMV3_ID, 129, 34, 8))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        cache.invalidate()
+        self.assertEqual(0, len(cache))
+
+    def test_read_frame_cache_lru(self):
+        cache = ReadFrameCache(2)
+        cache.get(5, HMV3_ID, 129, 34, 8)
+        cache.get(6, HMV3_ID, 129, 34, 8)
+        cache.get(5, HMV3_ID, 129, 34, 8) #6 now least recently used
+        cache.get(7, HMV3_ID, 129, 34, 8)
+        self.assertEqual(2, len(cache))
+        cache.get(5, HMV3_ID, 129, 34, 8)
+        self.assertEqual((2, 3), (cache.hits, cache.misses))
+        cache.get(6, HMV3_ID, 129, 34, 8)
+        self.assertEqual(4, cache.misses)
 
     def test_form_bad_length(self):
         with self.assertRaises(ValueError):
@@ -0,0 +1,34 @@
+"""Unittests for heatmisercontroller.freshness module"""
+import unittest
+
+from heatmisercontroller.freshness import ExpiryIndex
+
+class TestExpiryIndex(unittest.TestCase):
+    """Unittests for the field expiry heap"""
+    def setUp(self):
+        self.expiries = {0: 10.0, 1: 5.0, 2: 20.0}
+        self.index = ExpiryIndex(self.expiries.get, [0, 1, 2])
+
+    def test_next_expiry(self):
+        self.assertEqual(5.0, self.index.next_expiry())
+
+    def test_stale(self):
+        self.assertEqual([0, 1], self.index.stale(10.0))
+        self.assertEqual([0, 1], self.index.stale(10.0))
+        self.assertEqual([], self.index.stale(4.0))
+
+    def test_push(self):
+        self.expiries[1] = 30.0
+        self.index.push(1, 30.0)
+        self.assertEqual(10.0, self.index.next_expiry())
+        self.assertEqual([0, 2], self.index.stale(25.0))
+
+    def test_compact(self):
+        for time in range(100):
+            self.expiries[0] = float(time)
+            self.index.push(0, float(time))
+        self.assertTrue(len(self.index) <= 4 * 3 + 16)
+        self.assertEqual([1, 2], self.index.stale(98.0))
+
+    def test_empty(self):
+        self.assertEqual(None, ExpiryIndex(self.expiries.get).next_expiry())
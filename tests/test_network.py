@@ -2,11 +2,16 @@
 import unittest
 import logging
 import os
+import time
+import threading
 
 from heatmisercontroller.network import HeatmiserNetwork
-from heatmisercontroller.exceptions import HeatmiserControllerSetupInitError
+from heatmisercontroller.exceptions import HeatmiserControllerSetupInitError, HeatmiserResponseError
 from heatmisercontroller.genericdevice import HeatmiserDevice
-from mock_serial import SetupTestClass, MockHeatmiserAdaptor
+from heatmisercontroller.busexecutor import ExecutorAdaptor
+from heatmisercontroller.adaptor import HeatmiserAdaptor
+from heatmisercontroller.hm_constants import BROADCAST_ADDR
+from mock_serial import SetupTestClass, MockHeatmiserAdaptor, ResponderSerial
 
 class TestNetwork(unittest.TestCase):
     """Unit tests for network class."""
@@ -40,6 +45,11 @@ class TestNetwork(unittest.TestCase):
         self.assertIsInstance(hmn.controllers[1], HeatmiserDevice)
         self.assertEqual(hmn.controllers[1].set_address, 2)
         
+    def test_prefetch_default(self):
+        module_path = os.path.abspath(os.path.dirname(__file__))
+        hmn = HeatmiserNetwork(os.path.join(module_path, "hmcontroller.conf"))
+        self.assertEqual([0] * len(hmn.controllers), [device.set_prefetch_fraction for device in hmn.controllers]) #opt in
+
     def test_network_stat_add(self):
         module_path = os.path.abspath(os.path.dirname(__file__))
         configfile = os.path.join(module_path, "hmcontroller.conf")
@@ -50,5 +60,138 @@ class TestNetwork(unittest.TestCase):
         with self.assertRaises(HeatmiserControllerSetupInitError):
             HeatmiserNetwork('nofile.conf')
         
+class Meeting(object):
+    """Reads on each bus wait here until every bus has a read in progress"""
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = set()
+        self.lock = threading.Lock()
+        self.everyone = threading.Event()
+
+    def arrive(self, name):
+        """Returns True once all parties have arrived, False if they didn't within a few seconds"""
+        with self.lock:
+            self.arrived.add(name)
+            if len(self.arrived) == self.parties:
+                self.everyone.set()
+        return self.everyone.wait(5)
+
+class SlowAdaptor(MockHeatmiserAdaptor):
+    """Mock adaptor answering every read with the same payload after delay
+
+    With a meeting, reads wait there instead, recording in met whether the buses overlapped"""
+    def __init__(self, setup, delay, meeting=None):
+        super(SlowAdaptor, self).__init__(setup)
+        self.delay = delay
+        self.meeting = meeting
+        self.met = []
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        if self.meeting is None:
+            time.sleep(self.delay)
+        else:
+            self.met.append(self.meeting.arrive(self.busname))
+        self.arguments.append((network_address, protocol, unique_start_address, expected_length, readall))
+        if network_address > 2:
+            raise HeatmiserResponseError("No Response")
+        return [4, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1] if expected_length == 13 else [0, 1, 0, 0, 0, 0, 0, 170]
+
+class TestBuses(unittest.TestCase):
+    """Unit tests for networks with more than one bus"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        module_path = os.path.abspath(os.path.dirname(__file__))
+        self.hmn = HeatmiserNetwork(os.path.join(module_path, "buses.conf"))
+
+    def tearDown(self):
+        self.hmn.stop_bus_executor()
+
+    def use_slow_adaptors(self, delay, meeting=None):
+        """Replace each bus adaptor with a SlowAdaptor"""
+        self.hmn.stop_bus_executor()
+        for bus in self.hmn.buses.values():
+            bus.adaptor = SlowAdaptor(SetupTestClass(), delay, meeting)
+            bus.adaptor.busname = bus.name
+        self.hmn.start_bus_executor()
+
+    def assert_buses_met(self):
+        """Check every read found reads in progress on all the buses, so they ran concurrently"""
+        for bus in self.hmn.buses.values():
+            self.assertEqual([True] * len(bus.adaptor.arguments), bus.adaptor.met, bus.name)
+
+    def test_buses(self):
+        self.assertEqual(['serial', 'Annex'], self.hmn.buses.keys())
+        annex = self.hmn.buses['Annex']
+        self.assertEqual('/dev/ttyUSB1', annex.adaptor.serport.port)
+        self.assertEqual(0.2, annex.adaptor.serport.COM_BUS_RESET_TIME)
+        self.assertEqual(4800, annex.adaptor.serport.baudrate)
+        self.assertEqual([1, 2], annex.addresses)
+        self.assertEqual('Annex', annex.adaptor.busname) #read calibration is loaded for the bus
+        self.assertEqual('serial', self.hmn.adaptor.busname)
+        self.assertEqual('Annex', self.hmn.Office.busname)
+        self.assertIsInstance(self.hmn.Office._adaptor, ExecutorAdaptor)
+        self.assertIs(annex.executor, self.hmn.Office._adaptor._executor)
+        self.assertIs(self.hmn.buses['serial'].executor, self.hmn.Kit._adaptor._executor)
+
+    def test_run_method_on_all(self):
+        self.use_slow_adaptors(0, Meeting(len(self.hmn.buses)))
+        results = self.hmn.run_method_on_all('read_fields', ['tempholdmins', 'airtemp'], 0)
+        self.assertEqual([[1, 17]] * 4, results)
+        self.assert_buses_met() #reads on each bus, not every device in turn
+        for bus in self.hmn.buses.values():
+            self.assertEqual([1, 2], [arguments[0] for arguments in bus.adaptor.arguments])
+
+    def test_device_and_all_concurrently(self):
+        #a caller holding a device lock waits on the bus thread, which must not wait on that lock
+        self.use_slow_adaptors(0.01)
+        errors = []
+        def repeat(function, count):
+            """call function count times, recording errors"""
+            try:
+                for _ in range(count):
+                    function()
+            except Exception as err: #pylint: disable=broad-except
+                errors.append(err)
+        threads = [threading.Thread(target=repeat, args=(lambda: self.hmn.Kit.read_fields(['tempholdmins', 'airtemp'], 0), 20)),
+                   threading.Thread(target=repeat, args=(lambda: self.hmn.run_method_on_all('read_fields', ['tempholdmins', 'airtemp'], 0), 5))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(any(thread.is_alive() for thread in threads), "deadlocked")
+        self.assertEqual([], errors)
+
+    def test_broadcast(self):
+        self.use_slow_adaptors(0, Meeting(len(self.hmn.buses)))
+        self.assertEqual([[1, 17]] * 4, self.hmn.All.read_fields(['tempholdmins', 'airtemp'], 0))
+        self.assert_buses_met()
+
+    def test_broadcast_write(self):
+        self.hmn.stop_bus_executor()
+        for bus in self.hmn.buses.values():
+            bus.adaptor = HeatmiserAdaptor(SetupTestClass())
+            bus.adaptor.serport = ResponderSerial()
+        self.hmn.start_bus_executor()
+        self.hmn.All.set_field('frosttemp', 10)
+        self.hmn.All.set_fields(['frosttemp', 'floormaxlimit'], [12, 20]) #not adjacent, two writes
+        for bus in self.hmn.buses.values():
+            requests = bus.adaptor.serport.requests
+            self.assertEqual([BROADCAST_ADDR] * 3, [request[0] for request in requests], bus.name)
+
+    def test_find_devices(self):
+        self.use_slow_adaptors(0)
+        found = self.hmn.find_devices(3)
+        self.assertEqual([], found) #addresses 1 and 2 in use on both buses
+        self.hmn.buses['Annex'].addresses.remove(2)
+        found = self.hmn.find_devices(3)
+        self.assertEqual(['Annex_C2'], [device.name for device in found])
+        self.assertEqual('Annex', self.hmn.Annex_C2.busname)
+        self.assertIs(self.hmn.Annex_C2, self.hmn.controllers[-1])
+
+    def test_unknown_bus(self):
+        with self.assertRaises(HeatmiserControllerSetupInitError):
+            self.hmn.add_device('Lost', {'address': 3, 'bus': 'Loft', 'expected_model': 'prt_e_model', 'expected_prog_mode': 'day'})
+
 if __name__ == '__main__':
     unittest.main()
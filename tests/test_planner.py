@@ -0,0 +1,166 @@
+"""Unittests for heatmisercontroller.read_planner module"""
+import unittest
+import logging
+import time
+import itertools
+import random
+
+from heatmisercontroller.read_planner import plan_reads, widen_blocks
+from heatmisercontroller.read_calibration import default_read_time
+from heatmisercontroller.devices_prt_e import ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterWeek, ThermoStatHotWaterDay
+from heatmisercontroller.hm_constants import HMV3_ID, PROG_MODE_DAY, PROG_MODE_WEEK, FIELDRANGES
+
+from mock_serial import SetupTestClass, MockHeatmiserAdaptor
+
+class Field(object):
+    """Minimal field with address and length"""
+    def __init__(self, address, fieldlength):
+        self.address = address
+        self.fieldlength = fieldlength
+
+def brute_force(fields, segments, betweentime):
+    """quickest time over every way of splitting fields into consecutive reads"""
+    best = None
+    count = len(fields)
+    for cuts in itertools.product([False, True], repeat=count - 1):
+        starts = [0] + [index + 1 for index, cut in enumerate(cuts) if cut]
+        ends = starts[1:] + [count]
+        if any(segments[start] != segments[end - 1] for start, end in zip(starts, ends)):
+            continue
+        cost = sum(default_read_time(fields[end - 1].address + fields[end - 1].fieldlength - fields[start].address) for start, end in zip(starts, ends))
+        cost += betweentime * (len(starts) - 1)
+        if best is None or cost < best:
+            best = cost
+    return best
+
+class TestPlanReads(unittest.TestCase):
+    """Tests for dynamic programming planner"""
+    def test_single(self):
+        field = Field(10, 2)
+        blocks, cost = plan_reads([field], [0], default_read_time, 0.1)
+        self.assertEqual([[field, field, 2]], blocks)
+        self.assertAlmostEqual(default_read_time(2), cost)
+
+    def test_between_time(self):
+        """fields far apart are only joined if the wait between reads costs more than the extra bytes"""
+        fields = [Field(0, 1), Field(100, 1)]
+        self.assertEqual(2, len(plan_reads(fields, [0, 0], default_read_time, 0.0)[0]))
+        self.assertEqual(1, len(plan_reads(fields, [0, 0], default_read_time, 0.5)[0]))
+
+    def test_segments(self):
+        fields = [Field(0, 1), Field(1, 1)]
+        self.assertEqual(2, len(plan_reads(fields, [0, 1], default_read_time, 1.0)[0]))
+
+    def test_read_all(self):
+        fields = [Field(0, 1), Field(100, 1)]
+        blocks, cost = plan_reads(fields, [0, 1], default_read_time, 0.1, 0.2)
+        self.assertIsNone(blocks)
+        self.assertEqual(0.2, cost)
+
+    def test_optimal(self):
+        rand = random.Random(1)
+        for _ in range(50):
+            address = 0
+            fields = []
+            for _ in range(rand.randint(1, 8)):
+                address += rand.randint(0, 40)
+                fields.append(Field(address, rand.randint(1, 12)))
+                address += fields[-1].fieldlength
+            segments = sorted(rand.randint(0, 2) for _ in fields)
+            _, cost = plan_reads(fields, segments, default_read_time, 0.1)
+            self.assertAlmostEqual(brute_force(fields, segments, 0.1), cost)
+
+class TestWidenBlocks(unittest.TestCase):
+    """Tests for prefetch of fields due soon"""
+    def setUp(self):
+        self.fields = [Field(address, 1) for address in [0, 1, 2, 10, 11, 40]]
+
+    def test_widen(self):
+        blocks = [[1, 1]]
+        added = widen_blocks(blocks, self.fields, [0] * 6, lambda index: index in [0, 3], default_read_time, 0.1)
+        self.assertEqual([[0, 3]], blocks)
+        self.assertEqual([0, 3], sorted(added))
+
+    def test_budget(self):
+        blocks = [[1, 1]]
+        added = widen_blocks(blocks, self.fields, [0] * 6, lambda index: index in [0, 5], default_read_time, default_read_time(2) - default_read_time(1))
+        self.assertEqual([[0, 1]], blocks)
+        self.assertEqual([0], added)
+
+    def test_segments_and_neighbours(self):
+        blocks = [[1, 1], [4, 4]]
+        added = widen_blocks(blocks, self.fields, [0, 0, 0, 1, 1, 1], lambda index: index in [2, 3], default_read_time, 1.0)
+        self.assertEqual([[1, 2], [3, 4]], blocks)
+        self.assertEqual([2, 3], sorted(added))
+
+class TestDevicePlan(unittest.TestCase):
+    """Tests for planning reads on a device"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.adaptor = MockHeatmiserAdaptor(SetupTestClass())
+        settings = {'address':1, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_e_model', 'expected_prog_mode':PROG_MODE_DAY}
+        self.func = ThermoStatDay(self.adaptor, settings)
+
+    def plan(self, fieldnames):
+        blocks = self.func._plan_reads([self.func._fieldnametonum[name] for name in fieldnames])
+        if blocks is None:
+            return None
+        return [[block[0].address, block[1].address, block[2]] for block in blocks]
+
+    def test_plans(self):
+        self.assertEqual([[4, 22, 19]], self.plan(['model', 'keylock']))
+        self.assertEqual([[4, 4, 1], [38, 38, 2]], self.plan(['model', 'airtemp']))
+        self.assertEqual([[103, 175, 84]], self.plan(['mon_heat', 'sun_heat']))
+
+    def test_plan_read_all(self):
+        self.assertIsNone(self.plan(['DCBlen', 'tempholdmins', 'currenttime', 'mon_heat']))
+
+    def test_prefetch(self):
+        self.func.set_prefetch_fraction = 0.2
+        self.func.lastreadtime = time.time()
+        self.func._procpartpayload([0, 1, 0, 0, 0, 0, 0, 170, 0, 0], 'tempholdmins', 'heatingdemand')
+        self.func.lastreadtime = time.time() - 20 #airtemp stale
+        self.func._procpartpayload([0, 170], 'airtemp', 'airtemp')
+        self.func.lastreadtime = time.time() - 60 #errorcode due in 5 s
+        self.func._procpartpayload([0], 'errorcode', 'errorcode')
+        self.adaptor.setresponse([[0, 180, 0]])
+        self.assertEqual([18], self.func.read_fields(['airtemp']))
+        self.assertEqual([(1, HMV3_ID, 38, 3, False)], self.adaptor.arguments)
+        self.assertEqual(1, self.func.fields_prefetched)
+        self.assertEqual(1, self.func.reads_saved)
+
+class ThermoStatDayGapReadable(ThermoStatDay):
+    """PRT-E day with a richer range table, reading 26 to 31 as filler"""
+    def _get_readable_ranges(self):
+        return [[0, 41], [43, 70], [103, 186]]
+
+class TestGapBridging(unittest.TestCase):
+    """Tests for reading through address gaps inside readable ranges"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.adaptor = MockHeatmiserAdaptor(SetupTestClass())
+
+    def test_never_crosses_range(self):
+        """every pair of fields is planned within FIELDRANGES, so never across 26-31 or 42 on PRT-E"""
+        for devicetype, model, mode in [(ThermoStatDay, 'prt_e_model', PROG_MODE_DAY), (ThermoStatHotWaterWeek, 'prt_hw_model', PROG_MODE_WEEK), (ThermoStatHotWaterDay, 'prt_hw_model', PROG_MODE_DAY)]:
+            device = devicetype(self.adaptor, {'address':1, 'protocol':HMV3_ID, 'expected_model':model, 'expected_prog_mode':mode})
+            ranges = [[device.fieldsbyname[first].address, device.fieldsbyname[last].address] for first, last in FIELDRANGES[model][mode]]
+            for pair in itertools.combinations(range(len(device.fields)), 2):
+                for first, last, _ in device._plan_reads(pair) or []:
+                    self.assertTrue(any(start <= first.address and last.address <= end for start, end in ranges), (first.name, last.name))
+
+    def test_expected_model_mismatch(self):
+        """ranges not used if the table doesn't match the device"""
+        device = ThermoStatDay(self.adaptor, {'address':1, 'protocol':HMV3_ID, 'expected_model':'prt_hw_model', 'expected_prog_mode':PROG_MODE_DAY})
+        self.assertEqual([], device._get_readable_ranges())
+
+    def test_bridge_gap(self):
+        device = ThermoStatDayGapReadable(self.adaptor, {'address':1, 'protocol':HMV3_ID, 'expected_model':'prt_e_model', 'expected_prog_mode':PROG_MODE_DAY})
+        self.adaptor.setresponse([[0, 5, 99, 99, 99, 99, 99, 99, 0, 7]])
+        self.assertEqual([5, 7], device.read_fields(['holidayhours', 'tempholdmins'], 0))
+        self.assertEqual([(1, HMV3_ID, 24, 10, False)], self.adaptor.arguments)
+        self.assertEqual(bytearray([0, 5, 0, 7]), device.rawdata[device.holidayhours.dcbaddress:device.tempholdmins.dcbaddress + 2])
+
+if __name__ == '__main__':
+    unittest.main()
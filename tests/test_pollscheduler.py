@@ -0,0 +1,118 @@
+"""Unittests for heatmisercontroller.pollscheduler module"""
+import unittest
+import logging
+import time
+
+from heatmisercontroller.pollscheduler import PollScheduler, FreshnessStats
+from heatmisercontroller.devices_prt_e import ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.hm_constants import HMV3_ID, PROG_MODE_DAY
+from heatmisercontroller.exceptions import HeatmiserResponseError
+
+from mock_serial import SetupTestClass, MockHeatmiserAdaptor
+
+class EchoAdaptor(MockHeatmiserAdaptor):
+    """Mock adaptor that returns the device's current bytes, so they are unchanged, or fails"""
+    def __init__(self, setup, delay=0):
+        super(EchoAdaptor, self).__init__(setup)
+        self.devices = {}
+        self.delay = delay
+        self.fail = False
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        self.arguments.append((network_address, unique_start_address, expected_length, readall))
+        time.sleep(self.delay)
+        if self.fail:
+            raise HeatmiserResponseError("No Response")
+        device = self.devices[network_address]
+        if readall:
+            return device.rawdata[:]
+        dcbaddress = [field for field in device.fields if field.address == unique_start_address][0].dcbaddress
+        return device.rawdata[dcbaddress:dcbaddress + expected_length]
+
+class NetworkStub(object):
+    """Holds the list of devices, as HeatmiserNetwork"""
+    def __init__(self, controllers):
+        self.controllers = controllers
+
+    def stale_fields(self, now=None):
+        return [(device, device.stale_fields(now)) for device in self.controllers]
+
+class TestPollScheduler(unittest.TestCase):
+    """Unittests for the poll scheduler"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.adaptor = EchoAdaptor(SetupTestClass())
+        self.devices = []
+        for address, deviceclass in [(1, ThermoStatHotWaterDay), (2, ThermoStatDay)]:
+            settings = {'address':address, 'protocol':HMV3_ID, 'long_name':'test controller', 'expected_model':'prt_e_model', 'expected_prog_mode':PROG_MODE_DAY}
+            device = deviceclass(self.adaptor, settings)
+            device.lastreadtime = time.time() - 100
+            device._procpayload(bytearray(device.dcb_length)) #fields that fail stay unread
+            self.adaptor.devices[address] = device
+            self.devices.append(device)
+        self.scheduler = PollScheduler(NetworkStub(self.devices), duty_cycle=1, batch_window=2, retry_interval=60)
+
+    def age_field(self, device, fieldname, age):
+        """Set field read age seconds ago, with unchanged bytes"""
+        field = device.fieldsbyname[fieldname]
+        device.lastreadtime = time.time() - age
+        device._procpartpayload(device.rawdata[field.dcbaddress:field.dcbaddress + field.fieldlength], fieldname, fieldname)
+
+    def test_temperatures_first(self):
+        self.scheduler.poll()
+        self.age_field(self.devices[0], 'tempholdmins', 100)
+        self.age_field(self.devices[1], 'airtemp', 100)
+        reads = self.scheduler.due_reads(time.time())
+        self.assertEqual([(11, self.devices[1], ['airtemp']), (65, self.devices[0], ['tempholdmins'])], reads)
+
+    def test_poll(self):
+        self.scheduler.poll()
+        self.assertEqual(2, self.scheduler.usage.reads)
+        self.assertEqual(0, self.scheduler.usage.errors)
+        self.assertEqual([], self.scheduler.due_reads(time.time()))
+        self.assertIn(11, self.scheduler.freshness.groups)
+        reads = len(self.adaptor.arguments)
+        self.scheduler.poll()
+        self.assertEqual(reads, len(self.adaptor.arguments))
+
+    def test_failed_fields_held(self):
+        self.scheduler.poll()
+        self.assertIn((self.devices[0], 'model'), self.scheduler._fieldheld)
+        self.assertTrue(self.scheduler.next_due(time.time()) > time.time() + 5)
+
+    def test_failed_device_held(self):
+        self.adaptor.fail = True
+        self.scheduler.poll()
+        self.assertEqual(2, self.scheduler.usage.errors)
+        self.assertEqual([], self.scheduler.due_reads(time.time()))
+
+    def test_duty_cycle(self):
+        self.adaptor.delay = 0.01
+        self.scheduler.duty_cycle = 0.01
+        self.scheduler.poll()
+        self.assertEqual(1, self.scheduler.usage.reads)
+        self.assertTrue(self.scheduler.next_due(time.time()) > time.time() + 0.5)
+
+    def test_duty_cycle_range(self):
+        for duty_cycle in [0, -0.5, 1.5]:
+            with self.assertRaises(ValueError):
+                PollScheduler(NetworkStub(self.devices), duty_cycle=duty_cycle)
+
+    def test_summary(self):
+        self.scheduler.poll()
+        lines = self.scheduler.summary()
+        self.assertTrue(lines[0].startswith("Bus"))
+        self.assertEqual(len(self.scheduler.freshness.groups) + 3, len(lines))
+
+class TestFreshnessStats(unittest.TestCase):
+    """Unittests for freshness summary"""
+    def test_record(self):
+        stats = FreshnessStats()
+        stats.record(10, 0.0, 8.0)
+        stats.record(10, 8.0, 20.0)
+        self.assertEqual([2, 1, 20.0, 12.0], stats.groups[10])
+        self.assertEqual(1, len(stats.summary()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Unittests for heatmisercontroller.adaptive_timeouts module"""
+import unittest
+import json
+
+from heatmisercontroller.adaptive_timeouts import LatencyEstimate, AdaptiveTimeouts
+
+class SerialSettings(object):
+    """Timeout settings as found on the adaptor serial port"""
+    COM_START_TIMEOUT = 0.1
+    COM_TIMEOUT = 1
+    COM_MIN_TIMEOUT = 0.01
+
+class TestAdaptiveTimeouts(unittest.TestCase):
+    """Tests for learning timeouts"""
+    def setUp(self):
+        self.serport = SerialSettings()
+        self.timeouts = AdaptiveTimeouts(quantile=0.9, margin=2, max_factor=3, min_samples=3)
+
+    def _learn(self, address, firstbyte, resttime, count=3):
+        for _ in range(count):
+            self.timeouts.record(address, firstbyte, resttime, 11)
+
+    def test_estimate(self):
+        estimate = LatencyEstimate(alpha=0.5)
+        for value in [1, 2, 3, 4]:
+            estimate.add(value)
+        self.assertEqual(3.125, estimate.mean)
+        self.assertEqual(4, estimate.quantile(0.9))
+        self.assertEqual(1, estimate.quantile(0))
+
+    def test_configured_until_learned(self):
+        self._learn(5, 0.02, 0.05, 2)
+        self.assertEqual((0.1, 1, False), self.timeouts.timeouts(5, 11, self.serport))
+
+    def test_learned(self):
+        self._learn(5, 0.02, 0.05)
+        start, frame, learned = self.timeouts.timeouts(5, 11, self.serport)
+        self.assertTrue(learned)
+        self.assertAlmostEqual(0.04, start)
+        self.assertAlmostEqual(0.14, frame)
+
+    def test_limits(self):
+        self._learn(5, 1, 10)
+        self._learn(6, 0, 0)
+        start, frame, _ = self.timeouts.timeouts(5, 11, self.serport)
+        self.assertAlmostEqual(0.3, start)
+        self.assertAlmostEqual(3.3, frame)
+        start, frame, _ = self.timeouts.timeouts(6, 11, self.serport)
+        self.assertAlmostEqual(0.01, start)
+        self.assertAlmostEqual(0.02, frame)
+
+    def test_missed_response(self):
+        self._learn(5, 0.02, 0.05)
+        self.timeouts.no_response(5, True)
+        self.assertEqual((0.1, 1, False), self.timeouts.timeouts(5, 11, self.serport))
+        self.timeouts.no_response(5, False) #dead, so try learned again
+        self.assertTrue(self.timeouts.timeouts(5, 11, self.serport)[2])
+
+    def test_persist(self):
+        self._learn(5, 0.02, 0.05)
+        other = AdaptiveTimeouts(quantile=0.9, margin=2, max_factor=3, min_samples=3)
+        other.load_learned(json.loads(json.dumps(self.timeouts.get_learned())))
+        self.assertEqual(self.timeouts.timeouts(5, 11, self.serport), other.timeouts(5, 11, self.serport))
+
+if __name__ == '__main__':
+    unittest.main()
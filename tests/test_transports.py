@@ -0,0 +1,139 @@
+"""Unittests for heatmisercontroller.transports module"""
+import unittest
+import logging
+import socket
+import threading
+import time
+
+import serial
+from serial.serialutil import SerialException
+
+from heatmisercontroller.adaptor import HeatmiserAdaptor
+from heatmisercontroller.transports import create_transport, TcpTransport, LoopbackTransport, RFC2217Transport
+from mock_serial import SetupTestClass
+
+class EchoServer(object):
+    """Local TCP server echoing what each connection sends, counting connections"""
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(4)
+        self.port = '127.0.0.1:%i'%self.listener.getsockname()[1]
+        self.connections = 0
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        """accept connections until the listener closes"""
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._echo, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _echo(conn):
+        """echo until the client shuts down"""
+        while True:
+            data = conn.recv(1024)
+            if not data:
+                break
+            conn.sendall(data)
+        conn.close()
+
+    def close(self):
+        """stop listening, shutdown wakes the accept thread"""
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.listener.close()
+
+class TestTransports(unittest.TestCase):
+    """Transport selection and the loopback, RFC2217 and TCP transports"""
+    def setUp(self):
+        logging.basicConfig(level=logging.ERROR)
+        self.server = EchoServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_create(self):
+        self.assertIsInstance(create_transport('serial'), serial.Serial)
+        self.assertIsInstance(create_transport('tcp'), TcpTransport)
+        self.assertIsInstance(create_transport('loop'), LoopbackTransport)
+        with self.assertRaises(ValueError):
+            create_transport('modem')
+
+    def test_url_ports(self):
+        port = RFC2217Transport()
+        port.port = 'server:2217'
+        self.assertEqual(port.portstr, 'rfc2217://server:2217')
+        port = TcpTransport()
+        port.port = 'socket://server:4001'
+        self.assertEqual(port.portstr, 'socket://server:4001')
+
+    def test_adaptor_loop(self):
+        setup = SetupTestClass()
+        setup.settings['serial'].update({'transport': 'loop', 'port': 'bus', 'timeout': 1, 'COM_TIMEOUT': 1, 'COM_START_TIMEOUT': 0.1, 'COM_MIN_TIMEOUT': 0.1})
+        adaptor = HeatmiserAdaptor(setup)
+        self.assertIsInstance(adaptor.serport, LoopbackTransport)
+        adaptor.connect()
+        adaptor._send_message([1, 2, 3])
+        self.assertEqual(adaptor._receive_message(3), bytearray([1, 2, 3]))
+        adaptor._disconnect()
+        setup.settings['serial']['transport'] = 'serial'
+        adaptor._update_settings(setup.settings)
+        self.assertIsInstance(adaptor.serport, serial.Serial)
+        self.assertEqual(adaptor.serport.bytesize, serial.EIGHTBITS)
+
+    def test_tcp_echo(self):
+        port = TcpTransport(timeout=1)
+        port.port = self.server.port
+        port.open()
+        self.assertEqual(port._socket.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+        port.write(b'\x01\x02\x03')
+        time.sleep(0.05)
+        self.assertEqual(port.in_waiting, 3)
+        self.assertEqual(bytearray(port.read(3)), bytearray([1, 2, 3]))
+        port.close()
+        port.close_pool()
+
+    def test_tcp_reconnect(self):
+        port = TcpTransport(timeout=1)
+        port.port = self.server.port
+        port.open()
+        start = time.time()
+        port.close()
+        port.open()
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual(port.reconnects, 1)
+        port.write(b'\x05')
+        self.assertEqual(bytearray(port.read(1)), bytearray([5]))
+        port.close()
+        port.close_pool()
+
+    def test_tcp_backoff(self):
+        unused = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        unused.bind(('127.0.0.1', 0)) #bound, not listening, so connects are refused
+        port = TcpTransport()
+        port.port = '127.0.0.1:%i'%unused.getsockname()[1]
+        port.reconnect_backoff = 10
+        with self.assertRaises(SerialException):
+            port.open()
+        with self.assertRaisesRegexp(SerialException, 'backing off'):
+            port.open()
+        port._retryat = 0.0
+        with self.assertRaises(SerialException):
+            port.open()
+        self.assertEqual(port._failures, 2)
+        self.assertGreater(port._retryat - time.time(), 15)
+        unused.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Script to compare per field decode and encode with the precompiled struct codec"""
+import random
+from timeit import repeat
+
+from heatmisercontroller.schema import get_schema
+from heatmisercontroller.devices_prt_e import ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+
+TESTS = 2000
+
+def best(function):
+    """best time of 5 runs of TESTS calls"""
+    return min(repeat(function, number=TESTS, repeat=5))
+
+def per_field_decode(schema, rawdata):
+    """values calculated one field at a time, as before the codec"""
+    return [field._calculate_value(rawdata[field.dcbaddress:field.dcbaddress + field.fieldlength]) for field in schema.fields]
+
+def per_field_encode(fields, values):
+    """payload formed one field at a time, as before the codec"""
+    payload = []
+    for field, value in zip(fields, values):
+        payload.extend(field.format_data_from_value(value))
+    return payload
+
+def compare(name, deviceclass):
+    """time decode of a full dcb and encode of the weekly schedule"""
+    schema = get_schema(deviceclass)
+    rand = random.Random(0)
+    rawdata = bytearray(rand.randint(0, 255) for _ in range(schema.dcb_length))
+    codec = schema.get_codec(0, len(schema.fields) - 1)
+    fieldtime = best(lambda: per_field_decode(schema, rawdata))
+    codectime = best(lambda: codec.decode(rawdata))
+    print("%s decode %i fields: per field %.1f us, codec %.1f us, speed up %.1fx"%(name, len(schema.fields), fieldtime / TESTS * 1e6, codectime / TESTS * 1e6, fieldtime / codectime))
+
+    first = schema.nametonum['mon_heat']
+    fields = schema.fields[first:first + 7]
+    values = [[rand.randint(0, 23) for _ in range(12)] for _ in fields]
+    codec = schema.get_codec(first, first + 6)
+    fieldtime = best(lambda: per_field_encode(fields, values))
+    codectime = best(lambda: codec.encode(values))
+    print("%s encode 7 day heat schedule: per field %.1f us, codec %.1f us, speed up %.1fx"%(name, fieldtime / TESTS * 1e6, codectime / TESTS * 1e6, fieldtime / codectime))
+
+if __name__ == '__main__':
+    compare("PRT-E day", ThermoStatDay)
+    compare("PRT-HW day", ThermoStatHotWaterDay)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""Script to compare the nibble crc16 class with the table driven crc16_bytes"""
+from timeit import timeit
+
+from heatmisercontroller.framing import crc16, crc16_bytes, form_frame
+from heatmisercontroller.hm_constants import HMV3_ID, FUNC_READ, MAX_FRAME_RESP_LENGTH, MIN_FRAME_READ_RESP_LENGTH
+
+TESTS = 20000
+
+def compare(name, frame):
+    """time both crc methods on frame, excluding the crc bytes as done when checking"""
+    message = frame[:-2]
+    nibbletime = timeit(lambda: crc16().run(message), number=TESTS)
+    tabletime = timeit(lambda: crc16_bytes(message), number=TESTS)
+    print("%s %i bytes: nibble %.1f us, table %.1f us, speed up %.1fx"%(name, len(frame), nibbletime / TESTS * 1e6, tabletime / TESTS * 1e6, nibbletime / tabletime))
+
+#10 byte frame as sent for every read and write acknowledgement sized messages
+SHORTFRAME = form_frame(5, HMV3_ID, 129, FUNC_READ, 34, 8, [])
+#159 byte read all response, built as if sent by a device
+PAYLOADLENGTH = MAX_FRAME_RESP_LENGTH - MIN_FRAME_READ_RESP_LENGTH
+READALLRESPONSE = [129, MAX_FRAME_RESP_LENGTH, 0, 5, FUNC_READ, 0, 0, PAYLOADLENGTH, 0] + [x % 256 for x in range(PAYLOADLENGTH)]
+READALLRESPONSE += crc16_bytes(READALLRESPONSE)
+
+compare("Short frame", SHORTFRAME)
+compare("Short frame bytearray", bytearray(SHORTFRAME))
+compare("Read all response", READALLRESPONSE)
+compare("Read all response bytearray", bytearray(READALLRESPONSE))
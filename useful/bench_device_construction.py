@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Script to measure construction time and memory for a 32 device network
+
+Devices are built without an adaptor, alternating PRT-E and PRT-HW day models, plus the broadcast device."""
+import gc
+import resource
+from timeit import default_timer as timer
+
+from heatmisercontroller.devices_prt_e import ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.generaldevices import HeatmiserBroadcastDevice
+from heatmisercontroller.hm_constants import HMV3_ID
+
+DEVICES = 32
+REPEATS = 5
+
+def build_network():
+    """returns list of devices and broadcast device"""
+    devices = []
+    for address in range(1, DEVICES + 1):
+        model, devicetype = ('prt_hw_model', ThermoStatHotWaterDay) if address % 2 else ('prt_e_model', ThermoStatDay)
+        devices.append(devicetype(None, {'address':address, 'protocol':HMV3_ID, 'expected_model':model, 'expected_prog_mode':'day', 'autocorrectime': False}))
+    devices.append(HeatmiserBroadcastDevice(None, 'All', devices))
+    return devices
+
+def maxrss():
+    """peak resident set size in kB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+if __name__ == '__main__':
+    build_network() #import and first build costs
+    gc.collect()
+    STARTRSS = maxrss()
+    NETWORKS = []
+    TIMES = []
+    for _ in range(REPEATS):
+        START = timer()
+        NETWORKS.append(build_network())
+        TIMES.append(timer() - START)
+    print("%i device network: %.1f ms to construct (best of %i), %i kB each"%(DEVICES, min(TIMES) * 1e3, REPEATS, (maxrss() - STARTRSS) / REPEATS))
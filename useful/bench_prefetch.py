@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Script to simulate a day of the poll scheduler with and without prefetch
+
+The difference in transactions is the number of separate reads prefetch saves.
+Reads are answered from a captured PRT-HW read all, taking the default read time
+model on a simulated clock, so the day runs in seconds."""
+import time
+
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.pollscheduler import PollScheduler
+from heatmisercontroller.read_calibration import ReadTimeCalibration, default_read_time
+from heatmisercontroller.hm_constants import HMV3_ID
+
+DEVICES = 5
+DAY = 86400
+BETWEEN = 0.1 #default COM_BUS_RESET_TIME
+READALL = [1, 37, 0, 22, 4, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 38, 1, 9, 12, 28, 1, 1, 0, 0, 0, 0, 0, 0, 255, 255, 255, 255, 0, 220, 0, 0, 0, 1, 12, 0, 0, 7, 0, 19, 9, 30, 10, 17, 0, 19, 21, 30, 10, 7, 0, 19, 21, 30, 10, 24, 0, 5, 24, 0, 5, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 8, 0, 9, 0, 18, 0, 19, 0, 24, 0, 24, 0, 24, 0, 24, 0, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 19, 8, 30, 12, 16, 30, 20, 21, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 5, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 7, 0, 12, 24, 0, 12, 24, 0, 12, 24, 0, 12, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0]
+
+class Clock(object):
+    """Simulated time"""
+    def __init__(self):
+        self.now = 1.5e9
+
+    def time(self):
+        """current simulated time"""
+        return self.now
+
+class SimulatedAdaptor(object):
+    """Answers reads from each device's read all, advancing the clock by the read time"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.read_calibration = ReadTimeCalibration()
+        self.devices = {}
+        self.transactions = 0
+
+    def min_time_between_reads(self):
+        """as the serial adaptor"""
+        return BETWEEN
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        """payload from the device's read all"""
+        self.transactions += 1
+        self.clock.now += default_read_time(expected_length) + BETWEEN
+        rawdata = self.devices[network_address]
+        if readall:
+            return rawdata[:]
+        device = self.devices[network_address].device
+        dcbaddress = [field for field in device.fields if field.address == unique_start_address][0].dcbaddress
+        return rawdata[dcbaddress:dcbaddress + expected_length]
+
+    def read_all_from_device(self, network_address, protocol, expected_length):
+        """as the serial adaptor"""
+        return self.read_from_device(network_address, protocol, 0, expected_length, True)
+
+class ReadAll(bytearray):
+    """read all bytes with the device they are for"""
+    device = None
+
+class Network(object):
+    """devices on the simulated bus"""
+    def __init__(self, adaptor, prefetch):
+        self.controllers = []
+        for address in range(1, DEVICES + 1):
+            settings = {'address':address, 'protocol':HMV3_ID, 'expected_model':'prt_hw_model', 'expected_prog_mode':'day', 'prefetch_fraction':prefetch}
+            device = ThermoStatHotWaterDay(adaptor, settings)
+            device._checkcontrollertime = lambda: None #clock isn't real
+            adaptor.devices[address] = ReadAll(READALL)
+            adaptor.devices[address][11] = address
+            adaptor.devices[address].device = device
+            self.controllers.append(device)
+
+    def stale_fields(self, now=None):
+        """as HeatmiserNetwork"""
+        return [(device, device.stale_fields(now)) for device in self.controllers]
+
+def simulate(prefetch):
+    """transactions and reads saved over a simulated day"""
+    clock = Clock()
+    realtime = time.time
+    time.time = clock.time
+    try:
+        adaptor = SimulatedAdaptor(clock)
+        network = Network(adaptor, prefetch)
+        scheduler = PollScheduler(network)
+        end = clock.now + DAY
+        while clock.now < end:
+            due = scheduler.poll()
+            clock.now = max(clock.now, 60 + clock.now if due is None else due)
+        return adaptor.transactions, sum(device.reads_saved for device in network.controllers), scheduler.summary()
+    finally:
+        time.time = realtime
+
+if __name__ == '__main__':
+    for PREFETCH in [0, 0.25]:
+        TRANSACTIONS, SAVED, SUMMARY = simulate(PREFETCH)
+        print("prefetch_fraction %.2f, %i transactions in a day, %i reads widened"%(PREFETCH, TRANSACTIONS, SAVED))
+        print("  " + "\n  ".join(SUMMARY))
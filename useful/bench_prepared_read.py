@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Script to time read_fields against a prepared read of the same names
+
+Reads are answered instantly from a captured PRT-HW read all, so only the library overhead is timed.
+Fresh is the freshness check and values alone, forced includes planning and processing the reads."""
+from timeit import default_timer as timer
+
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.hm_constants import HMV3_ID
+
+CALLS = 2000
+REPEATS = 5
+SCHEDULEFIELDS = ['mon_heat', 'tues_heat', 'wed_heat', 'thurs_heat', 'fri_heat', 'wday_heat', 'wend_heat']
+READALL = [1, 37, 0, 22, 4, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 38, 1, 9, 12, 28, 1, 1, 0, 0, 0, 0, 0, 0, 255, 255, 255, 255, 0, 220, 0, 0, 0, 1, 12, 0, 0, 7, 0, 19, 9, 30, 10, 17, 0, 19, 21, 30, 10, 7, 0, 19, 21, 30, 10, 24, 0, 5, 24, 0, 5, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 8, 0, 9, 0, 18, 0, 19, 0, 24, 0, 24, 0, 24, 0, 24, 0, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 19, 8, 30, 12, 16, 30, 20, 21, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 5, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 7, 0, 12, 24, 0, 12, 24, 0, 12, 24, 0, 12, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0]
+FIELDNAMES = ['onoff', 'frostprot', 'holidayhours', 'runmode', 'tempholdmins', 'setroomtemp', 'sensorsavaliable', 'airtemp', 'remoteairtemp', 'heatingdemand', 'hotwaterdemand']
+
+class EchoAdaptor(object):
+    """Answers reads with the device's current bytes"""
+    device = None
+
+    def min_time_between_reads(self):
+        """as the serial adaptor"""
+        return 0.1
+
+    def read_from_device(self, network_address, protocol, unique_start_address, expected_length, readall=False):
+        """the device's bytes for the read"""
+        if readall:
+            return self.device.rawdata[:]
+        dcbaddress = [field for field in self.device.fields if field.address == unique_start_address][0].dcbaddress
+        return self.device.rawdata[dcbaddress:dcbaddress + expected_length]
+
+    def read_all_from_device(self, network_address, protocol, expected_length):
+        """as the serial adaptor"""
+        return self.read_from_device(network_address, protocol, 0, expected_length, True)
+
+def best(function):
+    """best time per call in us"""
+    times = []
+    for _ in range(REPEATS):
+        start = timer()
+        for _ in range(CALLS):
+            function()
+        times.append(timer() - start)
+    return min(times) / CALLS * 1e6
+
+if __name__ == '__main__':
+    from heatmisercontroller.read_calibration import ReadTimeCalibration
+    ADAPTOR = EchoAdaptor()
+    ADAPTOR.read_calibration = ReadTimeCalibration()
+    DEVICE = ADAPTOR.device = ThermoStatHotWaterDay(ADAPTOR, {'address':1, 'protocol':HMV3_ID, 'expected_model':'prt_hw_model', 'expected_prog_mode':'day', 'autocorrectime': False})
+    DEVICE.rawdata[:] = bytearray(READALL)
+    for NAMES, LABEL in [(FIELDNAMES, 'state'), (SCHEDULEFIELDS, 'schedule')]:
+        HANDLE = DEVICE.prepare(NAMES) if hasattr(DEVICE, 'prepare') else None
+        DEVICE.read_fields(NAMES, 0)
+        print("%-8s fresh: read_fields %6.1f us, prepared %6.1f us"%(LABEL, best(lambda: DEVICE.read_fields(NAMES, -1)), best(lambda: HANDLE.read(-1)) if HANDLE else 0))
+        print("%-8s forced: read_fields %6.1f us, prepared %6.1f us"%(LABEL, best(lambda: DEVICE.read_fields(NAMES, 0)), best(lambda: HANDLE.read(0)) if HANDLE else 0))
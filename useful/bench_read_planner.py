@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Script to compare the dynamic programming read planner with the previous greedy planner
+
+Costs are estimated read times using the default read time model, so no stats are needed."""
+import random
+from timeit import default_timer as timer
+
+from heatmisercontroller.devices_prt_e import ThermoStatWeek, ThermoStatDay
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterWeek, ThermoStatHotWaterDay
+from heatmisercontroller.read_planner import plan_reads
+from heatmisercontroller.read_calibration import default_read_time
+from heatmisercontroller.hm_constants import HMV3_ID
+
+BETWEEN = 0.1 #default COM_BUS_RESET_TIME
+RANDOMSETS = 500
+
+def greedy_plan(device, fieldids):
+    """previous planner, per contiguous block one read or one read per field, then read all if within 0.02s"""
+    fieldids = sorted(fieldids)
+    readblocks = []
+    for firstfield, lastfield, _ in device._get_field_blocks_from_id_range(fieldids[0], fieldids[-1]):
+        inblock = [fieldid for fieldid in fieldids if device._fieldnametonum[firstfield.name] <= fieldid <= device._fieldnametonum[lastfield.name]]
+        if len(inblock) > 0:
+            readlen = device.fields[max(inblock)].last_dcb_byte_address() - device.fields[min(inblock)].dcbaddress + 1
+            if default_read_time(readlen) < sum([default_read_time(device.fields[fieldid].fieldlength) for fieldid in inblock]):
+                readblocks.append(readlen)
+            else:
+                readblocks.extend(device.fields[fieldid].fieldlength for fieldid in inblock)
+    cost = sum(default_read_time(length) for length in readblocks) + BETWEEN * (len(readblocks) - 1)
+    if cost < device.fullreadtime - 0.02:
+        return cost
+    return device.fullreadtime
+
+def dp_plan(device, fieldids):
+    """dynamic programming planner"""
+    fieldids = sorted(fieldids)
+    fields = [device.fields[fieldid] for fieldid in fieldids]
+    segments = [device._fieldsegments[fieldid] for fieldid in fieldids]
+    return plan_reads(fields, segments, default_read_time, BETWEEN, device.fullreadtime)[1]
+
+def workloads(device):
+    """field sets from the get example, each field alone and random sets"""
+    names = ['mon_heat', 'tues_heat', 'wed_heat', 'thurs_heat', 'fri_heat', 'wday_heat', 'wend_heat']
+    names2 = ['onoff', 'frostprot', 'holidayhours', 'runmode', 'tempholdmins', 'setroomtemp', 'sensorsavaliable', 'airtemp', 'remoteairtemp', 'heatingdemand', 'hotwaterdemand']
+    sets = [[device._fieldnametonum[name] for name in fieldnames if name in device._fieldnametonum] for fieldnames in [names, names2]]
+    sets.extend([[fieldid] for fieldid in range(len(device.fields))])
+    rand = random.Random(0)
+    for _ in range(RANDOMSETS):
+        sets.append(rand.sample(range(len(device.fields)), rand.randint(2, 8)))
+    return [fieldids for fieldids in sets if fieldids]
+
+def compare(name, device):
+    """total estimated time of each planner over the workloads"""
+    sets = workloads(device)
+    results = []
+    for planner in [greedy_plan, dp_plan]:
+        start = timer()
+        total = sum(planner(device, fieldids) for fieldids in sets)
+        results.append((total, (timer() - start) / len(sets) * 1e6))
+    print("%-10s %4i sets: greedy %.2fs (%.0f us/plan), dp %.2fs (%.0f us/plan), saves %.1f%%"%(name, len(sets), results[0][0], results[0][1], results[1][0], results[1][1], 100 * (1 - results[1][0] / results[0][0])))
+
+if __name__ == '__main__':
+    SETTINGS = {'address':1, 'protocol':HMV3_ID, 'long_name':'bench'}
+    for NAME, DEVICE in [('PRT-E week', ThermoStatWeek), ('PRT-E day', ThermoStatDay), ('PRT-HW week', ThermoStatHotWaterWeek), ('PRT-HW day', ThermoStatHotWaterDay)]:
+        compare(NAME, DEVICE(None, dict(SETTINGS, expected_model='prt_hw_model' if 'HW' in NAME else 'prt_e_model', expected_prog_mode='day' if 'day' in NAME else 'week')))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Script to time a sweep reading the state fields of several devices on a simulated bus
+
+Each request is answered after a first byte delay plus the frame's time on the wire at 4800 baud,
+from a captured PRT-HW read all. Processing time per response can be added, to see how much of it
+is hidden inside the bus settle gap. Reports end to end cycle time, library CPU time and, where the
+adaptor has it, how the settle gap before each send was used."""
+import time
+import logging
+
+from serial.urlhandler.protocol_loop import Serial as LoopSerial
+
+from heatmisercontroller.adaptor import HeatmiserAdaptor
+from heatmisercontroller.devices_prt_hw import ThermoStatHotWaterDay
+from heatmisercontroller.framing import crc16_bytes
+from heatmisercontroller.hm_constants import HMV3_ID
+
+DEVICES = 8
+SWEEPS = 5
+FIRST_BYTE_DELAY = 0.02
+BYTE_TIME = 10.0 / 4800
+WORK_TIMES = [0.0, 0.05, 0.15] #extra processing per response, settle gap is 0.1
+READALL = [1, 37, 0, 22, 4, 0, 1, 0, 0, 0, 0, 1, 0, 0, 1, 38, 1, 9, 12, 28, 1, 1, 0, 0, 0, 0, 0, 0, 255, 255, 255, 255, 0, 220, 0, 0, 0, 1, 12, 0, 0, 7, 0, 19, 9, 30, 10, 17, 0, 19, 21, 30, 10, 7, 0, 19, 21, 30, 10, 24, 0, 5, 24, 0, 5, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 8, 0, 9, 0, 18, 0, 19, 0, 24, 0, 24, 0, 24, 0, 24, 0, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 19, 8, 30, 12, 16, 30, 20, 21, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 5, 0, 20, 21, 30, 12, 24, 0, 12, 24, 0, 12, 7, 0, 20, 12, 0, 12, 17, 0, 20, 21, 30, 12, 7, 0, 12, 24, 0, 12, 24, 0, 12, 24, 0, 12, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 17, 30, 18, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0, 24, 0]
+FIELDNAMES = ['onoff', 'frostprot', 'holidayhours', 'runmode', 'tempholdmins', 'setroomtemp', 'sensorsavaliable', 'airtemp', 'remoteairtemp', 'heatingdemand', 'hotwaterdemand']
+SETTINGS = {'protocol':HMV3_ID, 'expected_model':'prt_hw_model', 'expected_prog_mode':'day', 'autocorrectime': False}
+
+class SimulatedBus(LoopSerial):
+    """Loopback port answering read requests from a reference device's bytes after the time a device would take"""
+    def __init__(self, reference):
+        super(SimulatedBus, self).__init__('loop://', timeout=0, baudrate=4800)
+        self.reference = reference
+        self.COM_BUS_RESET_TIME = 0.1
+        self.COM_START_TIMEOUT = 0.1
+        self.COM_TIMEOUT = 1
+        self.COM_MIN_TIMEOUT = 0.1
+        self.COM_SEND_MIN_TIME = 1
+
+    def write(self, data):
+        """wait for the request and response to cross the bus, then make the response available"""
+        request = bytearray(data)
+        start = request[4] | request[5] << 8
+        length = request[6] | request[7] << 8
+        addresses = [field.dcbaddress for field in self.reference.fields if field.address == start]
+        payload = self.reference.rawdata[addresses[0]:addresses[0] + length] if length != 0xffff else self.reference.rawdata[:]
+        payload = payload + bytearray(max(0, length - len(payload))) #filler bytes across address gaps
+        frame = bytearray([129, 0, 0, request[0], 0, request[4], request[5], len(payload) & 255, len(payload) >> 8]) + payload
+        frame[1], frame[2] = (len(frame) + 2) & 255, (len(frame) + 2) >> 8
+        frame.extend(crc16_bytes(frame))
+        time.sleep(FIRST_BYTE_DELAY + BYTE_TIME * (len(request) + len(frame)))
+        return super(SimulatedBus, self).write(bytes(frame))
+
+class Setup(object):
+    """adaptor settings"""
+    settings = {'controller': {'my_master_addr':129, 'auto_connect': False}, 'serial': {'COM_BUS_RESET_TIME': 0.1}}
+
+def slow(process, seconds):
+    """wrap payload processing with seconds of extra work"""
+    def inner(*args):
+        """busy wait then process"""
+        end = time.time() + seconds
+        while time.time() < end:
+            pass
+        return process(*args)
+    return inner
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    REFERENCE = ThermoStatHotWaterDay(None, dict(SETTINGS, address=1))
+    REFERENCE.rawdata[:] = bytearray(READALL)
+    for WORK in WORK_TIMES:
+        ADAPTOR = HeatmiserAdaptor(Setup())
+        ADAPTOR.serport = SimulatedBus(REFERENCE)
+        DEVICES_ON_BUS = [ThermoStatHotWaterDay(ADAPTOR, dict(SETTINGS, address=address)) for address in range(1, DEVICES + 1)]
+        for DEVICE in DEVICES_ON_BUS:
+            DEVICE._procpartpayload = slow(DEVICE._procpartpayload, WORK)
+            DEVICE.read_fields(FIELDNAMES, 0) #plan and calibrate before timing
+        if hasattr(ADAPTOR, 'bus_timing'):
+            ADAPTOR.bus_timing.reset()
+        START = time.time()
+        CPUSTART = time.clock()
+        for _ in range(SWEEPS):
+            for DEVICE in DEVICES_ON_BUS:
+                DEVICE.read_fields(FIELDNAMES, 0)
+        CYCLE = (time.time() - START) / SWEEPS
+        print("work %3.0f ms per response: sweep of %i devices %.3f s, %.1f ms CPU"%(WORK * 1000, DEVICES, CYCLE, (time.clock() - CPUSTART) / SWEEPS * 1000))
+        if hasattr(ADAPTOR, 'bus_timing'):
+            print("    %s"%ADAPTOR.bus_timing)
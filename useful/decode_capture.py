@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""Script to decode a raw capture of the RS485 bus into frames
+
+Usage: decode_capture.py capturefile
+Frames in both directions are printed, corrupt or partial frames are skipped and counted."""
+import sys
+
+from heatmisercontroller.framing import FrameDecoder
+from heatmisercontroller.logging_setup import csvlist
+
+BLOCK = 4096
+
+def decode(filename):
+    """print frames found in file and a summary"""
+    decoder = FrameDecoder(requests=True)
+    with open(filename, 'rb') as capture:
+        while True:
+            data = capture.read(BLOCK)
+            if not data:
+                break
+            for frame in decoder.feed(bytearray(data)):
+                print(csvlist(frame))
+    for frame in decoder.flush():
+        print(csvlist(frame))
+    print("%i frames, %i bytes discarded"%(decoder.frames, decoder.discarded))
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    decode(sys.argv[1])